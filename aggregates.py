@@ -0,0 +1,116 @@
+"""Incrementally maintained donation totals.
+
+donation_totals holds one row per (day, currency, status, purpose) with a
+running sum and count. Triggers on donations update it inside the same
+transaction as each INSERT/UPDATE/DELETE in donate(), success() and
+cancel(), so dashboard totals are a handful of indexed rows instead of a
+scan over the full ledger.
+"""
+
+# NULL status/purpose are bucketed under '' so they can be part of the key
+_BUCKET = "date({row}.created_at), {row}.currency, COALESCE({row}.status, ''), COALESCE({row}.purpose, '')"
+
+
+def _add(row: str, sign: str) -> str:
+    return f'''
+            INSERT INTO donation_totals (day, currency, status, purpose, total_amount, donation_count)
+            VALUES ({_BUCKET.format(row=row)}, {sign}{row}.amount, {sign}1)
+            ON CONFLICT (day, currency, status, purpose) DO UPDATE SET
+                total_amount = total_amount + excluded.total_amount,
+                donation_count = donation_count + excluded.donation_count;'''
+
+
+def ensure_donation_totals(cursor) -> None:
+    """Create the aggregate table and triggers; backfill on first creation."""
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'donation_totals'")
+    exists = cursor.fetchone() is not None
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS donation_totals (
+            day TEXT NOT NULL,
+            currency TEXT NOT NULL,
+            status TEXT NOT NULL,
+            purpose TEXT NOT NULL,
+            total_amount REAL NOT NULL DEFAULT 0,
+            donation_count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (day, currency, status, purpose)
+        )
+    ''')
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS donation_totals_ai AFTER INSERT ON donations BEGIN
+            {_add('new', '')}
+        END
+    ''')
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS donation_totals_ad AFTER DELETE ON donations BEGIN
+            {_add('old', '-')}
+        END
+    ''')
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS donation_totals_au
+        AFTER UPDATE OF amount, currency, status, purpose, created_at ON donations BEGIN
+            {_add('old', '-')}
+            {_add('new', '')}
+        END
+    ''')
+    if not exists:
+        rebuild_donation_totals(cursor)
+
+
+def rebuild_donation_totals(cursor) -> int:
+    """Recompute donation_totals from scratch; returns the number of buckets."""
+    cursor.execute('DELETE FROM donation_totals')
+    cursor.execute(f'''
+        INSERT INTO donation_totals (day, currency, status, purpose, total_amount, donation_count)
+        SELECT {_BUCKET.format(row='donations')}, SUM(amount), COUNT(*)
+        FROM donations
+        GROUP BY 1, 2, 3, 4
+    ''')
+    return cursor.rowcount
+
+
+def retain_donation_totals(cursor, where_sql: str = '', params=(), source: str = 'donations') -> None:
+    """Credit donation_totals with the matching rows of ``source``.
+
+    Archiving calls this just before deleting ledger rows, so the delete
+    trigger's debit nets out and the totals keep covering archived months.
+    It also folds archive files back in after a rebuild.
+    """
+    cursor.execute(f'''
+        INSERT INTO donation_totals (day, currency, status, purpose, total_amount, donation_count)
+        SELECT {_BUCKET.format(row='d')}, SUM(d.amount), COUNT(*)
+        FROM {source} d WHERE 1=1{where_sql}
+        GROUP BY 1, 2, 3, 4
+        ON CONFLICT (day, currency, status, purpose) DO UPDATE SET
+            total_amount = total_amount + excluded.total_amount,
+            donation_count = donation_count + excluded.donation_count
+    ''', params)
+
+
+def summary_queries(where_sql: str = '', params=()):
+    """(name, keys, sql, params) for each grouping in the donation summary."""
+    base = f'FROM donation_totals WHERE donation_count != 0{where_sql}'
+    for name, keys in (('by_currency', ['currency']),
+                       ('by_status', ['currency', 'status']),
+                       ('by_purpose', ['currency', 'purpose']),
+                       ('by_day', ['day', 'currency'])):
+        columns = ', '.join(keys)
+        order = 'day DESC, currency' if name == 'by_day' else columns
+        yield (name, keys, f'SELECT {columns}, SUM(total_amount), SUM(donation_count) {base} '
+                           f'GROUP BY {columns} ORDER BY {order}', list(params))
+
+
+def summary_rows(rows, keys):
+    return [
+        dict(zip(keys, row[:-2]), total=round(row[-2], 2), count=row[-1],
+             average=round(row[-2] / row[-1], 2) if row[-1] else 0.0)
+        for row in rows
+    ]
+
+
+def donation_summary(cursor, where_sql: str = '', params=()) -> dict:
+    """Totals, counts and averages grouped by currency, status, purpose and day."""
+    summary = {}
+    for name, keys, sql, sql_params in summary_queries(where_sql, params):
+        cursor.execute(sql, sql_params)
+        summary[name] = summary_rows(cursor.fetchall(), keys)
+    return summary
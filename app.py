@@ -1,43 +1,127 @@
-from flask import Flask, request, jsonify, render_template, redirect, url_for, flash, session, send_from_directory
-from flask_babel import Babel, gettext as _
+from flask import Flask, Response, request, jsonify, render_template, redirect, url_for, flash, session
+from flask_babel import Babel
 from flask_cors import CORS
-from werkzeug.security import generate_password_hash, check_password_hash
-from werkzeug.utils import secure_filename
-import sqlite3
+from werkzeug.exceptions import NotFound
+from werkzeug.wsgi import get_input_stream
 import os
+import sys
+import csv
+import io
+import json
+import heapq
+import secrets
+import threading
+from collections import OrderedDict
+from contextlib import closing
 from datetime import datetime
-import random
-import string
+from importlib.machinery import ModuleSpec
 
+import click
 from dotenv import load_dotenv
 import stripe
 
+# Load .env before the modules below read their settings from the environment
+load_dotenv()
+
+import db
+from db import get_db
+import metrics
+import profiler
+from ratelimit import RateLimiter
+from pagination import CursorError, keyset_clause, page_links, page_size, time_bound
+import search
+import geo
+import dedup
+import events
+from cache import response_cache
+import aggregates
+import archive
+import triage
+import bulk
+import sync
+from captcha import captchas
+import migrations
+import passwords
+import payments
+import images
+import sessions
+from assets import Assets, build_assets, send_cached
+from writebehind import WriteBehindQueue
+
 app = Flask(__name__)
 CORS(app)  # Enable CORS for all routes
-app.secret_key = 'your-secret-key-here'  # Change this in production
+db.init_app(app)
+# Per-endpoint latency, SQL and Stripe timings at /metrics; PROFILE_SLOW_MS enables the slow-request profiler
+app.config['METRICS_TOKEN'] = os.getenv('METRICS_TOKEN', '')
+metrics.init_app(app)
+profiler.init_app(app)
+# Per-client token buckets (RATE_LIMIT_*) and priority load shedding (SHED_*); see ratelimit.py
+rate_limiter = RateLimiter(app)
+app.secret_key = os.getenv('SECRET_KEY') or 'your-secret-key-here'  # Set SECRET_KEY in production
+# The cookie carries only a session ID; session data lives in SESSION_STORE_PATH, shared by all workers
+app.session_interface = sessions.ServerSideSessionInterface()
+# Contact-form captchas are signed tokens (CAPTCHA_SECRETS) with a replay cache next to the sessions.
+# Never signed with the placeholder key above: anyone could mint valid tokens with it
+captcha_keys = (os.getenv('CAPTCHA_SECRETS') or os.getenv('SECRET_KEY') or '').split(',')
+if not any(captcha_keys):
+    # Tokens then only verify on the worker that issued them, and not across restarts
+    captcha_keys = [secrets.token_hex(32)]
+    app.logger.warning('Neither CAPTCHA_SECRETS nor SECRET_KEY is set; captchas use a random per-process key')
+captchas.configure(captcha_keys, os.getenv('CAPTCHA_REPLAY_PATH') or sessions.STORE_PATH)
 app.config['BABEL_DEFAULT_LOCALE'] = 'en'
 app.config['BABEL_DEFAULT_TIMEZONE'] = 'UTC'
 app.config['BABEL_TRANSLATION_DIRECTORIES'] = 'translations'
 
+# Static/upload serving: FILE_OFFLOAD=x-sendfile|x-accel lets a front proxy send file bytes
+app.config['FILE_OFFLOAD'] = os.getenv('FILE_OFFLOAD', '')
+app.config['USE_X_SENDFILE'] = app.config['FILE_OFFLOAD'] == 'x-sendfile'
+app.config['X_ACCEL_PREFIX'] = os.getenv('X_ACCEL_PREFIX', '/_protected')
+static_assets = Assets(app)
+
+# Read-API response cache; set RESPONSE_CACHE_PATH to share it across workers
+response_cache.configure(os.getenv('RESPONSE_CACHE_PATH') or None,
+                         ttl=float(os.getenv('RESPONSE_CACHE_TTL', '30')))
+
 # i18n / l10n configuration
 LANGUAGES = ['en', 'hi']
 babel = Babel()
 
+# Process-level LRU of users.preferred_language, keyed by user_id
+PREFERRED_LANGUAGE_CACHE_SIZE = 4096
+_preferred_languages = OrderedDict()
+_preferred_languages_lock = threading.Lock()
+
+def _preferred_language(user_id):
+    """Stored language for a user, hitting the database only on a cache miss"""
+    with _preferred_languages_lock:
+        if user_id in _preferred_languages:
+            _preferred_languages.move_to_end(user_id)
+            return _preferred_languages[user_id]
+    row = get_db().execute('SELECT preferred_language FROM users WHERE id = ?', (user_id,)).fetchone()
+    lang = row[0] if row and row[0] in LANGUAGES else None
+    with _preferred_languages_lock:
+        _preferred_languages[user_id] = lang
+        while len(_preferred_languages) > PREFERRED_LANGUAGE_CACHE_SIZE:
+            _preferred_languages.popitem(last=False)
+    return lang
+
+def _forget_preferred_language(user_id):
+    with _preferred_languages_lock:
+        _preferred_languages.pop(user_id, None)
+
 def get_locale():
-    # If user selected language during session
+    # If user selected language during session (set at login/register)
     lang = session.get('language')
     if lang in LANGUAGES:
         return lang
     # If logged in and has preferred language in DB
     try:
         if 'user_id' in session:
-            conn = sqlite3.connect(DATABASE)
-            cursor = conn.cursor()
-            cursor.execute('SELECT preferred_language FROM users WHERE id = ?', (session['user_id'],))
-            row = cursor.fetchone()
-            conn.close()
-            if row and row[0] in LANGUAGES:
-                return row[0]
+            lang = _preferred_language(session['user_id'])
+            if lang:
+                # Remember it so later renders never reach the cache or DB
+                session['language'] = lang
+                return lang
     except Exception:
         pass
     return 'en'
@@ -52,109 +136,52 @@ def inject_globals():
         'CURRENT_LANGUAGE': session.get('language', 'en'),
     }
 
-# Database setup
-DATABASE = 'donations.db'
+# Upload setup (database connections are pooled in db.py)
 UPLOAD_FOLDER = 'uploads'
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
 
 # Create uploads directory if it doesn't exist
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+image_pipeline = images.ImagePipeline(UPLOAD_FOLDER)
+# Reject oversized request bodies before they are parsed (form fields get 1 MiB of slack)
+app.config['MAX_CONTENT_LENGTH'] = image_pipeline.max_bytes + 1024 * 1024
+# /api/reports/bulk streams its body, so it gets a separate, larger limit
+BULK_MAX_BYTES = int(os.getenv('BULK_MAX_MB', '512')) * 1024 * 1024
+
+# Optional write-behind mode: report/contact submissions are journaled and batch-inserted
+def _reports_committed(committed):
+    committed = [(row_id, record) for row_id, record in committed if row_id is not None]
+    clusters = []
+    with db.connection() as conn:
+        cursor = conn.cursor()
+        for row_id, record in committed:
+            row = record['row']
+            clusters.append(dedup.assign_cluster(cursor, row_id, row['disaster_type'], row['location'],
+                                                 row['description'], row['created_at'],
+                                                 row.get('latitude'), row.get('longitude')))
+    response_cache.invalidate('reports')
+    for (row_id, record), cluster_id in zip(committed, clusters):
+        row = record['row']
+        triage.pending.admit(row_id, cluster_id, row['disaster_type'], row['created_at'])
+        if 'event' in record:
+            events.broker.publish('report', dict(record['event'], id=row_id, cluster_id=cluster_id),
+                                  topic=record['event']['disaster_type'])
+
+write_behind = None
+if os.getenv('WRITE_BEHIND', '').lower() in ('1', 'true', 'yes'):
+    write_behind = WriteBehindQueue(os.getenv('WRITE_BEHIND_JOURNAL', 'write_behind.journal'))
+    write_behind.on_commit('reports', _reports_committed)
 
 def allowed_file(filename):
     """Check if file extension is allowed"""
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
-def _column_exists(cursor, table_name: str, column_name: str) -> bool:
-    cursor.execute(f"PRAGMA table_info({table_name})")
-    return any(row[1] == column_name for row in cursor.fetchall())
-
 def init_db():
-    """Initialize the SQLite database and create/migrate tables"""
-    conn = sqlite3.connect(DATABASE)
-    cursor = conn.cursor()
-
-    # Create users table (uses 'name' per spec)
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS users (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT,
-            email TEXT UNIQUE NOT NULL,
-            password_hash TEXT NOT NULL,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            preferred_language TEXT
-        )
-    ''')
-
-    # If legacy 'username' exists but 'name' missing, add 'name'
-    if not _column_exists(cursor, 'users', 'name'):
-        cursor.execute("ALTER TABLE users ADD COLUMN name TEXT")
-    # Ensure preferred_language column exists
-    if not _column_exists(cursor, 'users', 'preferred_language'):
-        cursor.execute("ALTER TABLE users ADD COLUMN preferred_language TEXT")
-
-    # Create reports table (uses 'name' per spec)
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS reports (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER NOT NULL,
-            name TEXT,
-            email TEXT NOT NULL,
-            location TEXT NOT NULL,
-            disaster_type TEXT NOT NULL,
-            description TEXT NOT NULL,
-            image_path TEXT,
-            status TEXT DEFAULT 'pending',
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (user_id) REFERENCES users (id)
-        )
-    ''')
-
-    # If legacy 'user_name' column exists, ensure 'name' exists too
-    if not _column_exists(cursor, 'reports', 'name'):
-        cursor.execute("ALTER TABLE reports ADD COLUMN name TEXT")
-
-    # Create donations table (existing)
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS donations (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            donor_name TEXT NOT NULL,
-            donor_email TEXT NOT NULL,
-            amount REAL NOT NULL CHECK (amount > 0),
-            currency TEXT NOT NULL DEFAULT 'USD',
-            purpose TEXT,
-            pay_via TEXT NOT NULL,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-
-    # Migrate donations schema: add payment_method, payment_reference, status, timestamp
-    if not _column_exists(cursor, 'donations', 'payment_method'):
-        cursor.execute("ALTER TABLE donations ADD COLUMN payment_method TEXT")
-    if not _column_exists(cursor, 'donations', 'payment_reference'):
-        cursor.execute("ALTER TABLE donations ADD COLUMN payment_reference TEXT")
-    if not _column_exists(cursor, 'donations', 'status'):
-        cursor.execute("ALTER TABLE donations ADD COLUMN status TEXT")
-    # We already have created_at; avoid adding a new timestamp column to prevent SQLite default issues
-
-    # Create contact_messages table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS contact_messages (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            enquiry_type TEXT,
-            segment TEXT,
-            name TEXT,
-            email TEXT,
-            mobile TEXT,
-            city TEXT,
-            description TEXT,
-            time_slot TEXT,
-            captcha_entered TEXT,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-
-    conn.commit()
-    conn.close()
+    """Apply pending schema migrations (see migrations.py)"""
+    with db.connection() as conn:
+        applied = migrations.migrate(conn)
+    if applied:
+        print(f'Applied schema migrations {applied}.')
 
 @app.route('/')
 def home():
@@ -183,23 +210,24 @@ def register():
             flash('Passwords do not match.', 'error')
             return render_template('register.html')
 
-        password_hash = generate_password_hash(password)
+        try:
+            password_hash = passwords.hash_password(password)
+        except passwords.HashingBusy:
+            flash('The server is busy, please try again in a moment.', 'error')
+            return render_template('register.html'), 503, {'Retry-After': str(passwords.RETRY_AFTER_SECONDS)}
 
-        conn = sqlite3.connect(DATABASE)
+        conn = get_db()
         cursor = conn.cursor()
         # Check email uniqueness explicitly
         cursor.execute('SELECT id FROM users WHERE email = ?', (email,))
         existing = cursor.fetchone()
         if existing:
-            conn.close()
             flash('Email already registered.', 'error')
             return render_template('register.html')
 
         # Insert user (support legacy 'username' NOT NULL schema by populating it)
-        cursor.execute('PRAGMA table_info(users)')
-        cols = [row[1] for row in cursor.fetchall()]  # column names
         lang_value = preferred_language if preferred_language in LANGUAGES else 'en'
-        if 'username' in cols:
+        if 'username' in migrations.columns('users'):
             cursor.execute('''
                 INSERT INTO users (name, username, email, password_hash, preferred_language)
                 VALUES (?, ?, ?, ?, ?)
@@ -211,7 +239,6 @@ def register():
             ''', (name, email, password_hash, lang_value))
         conn.commit()
         user_id = cursor.lastrowid
-        conn.close()
 
         # Auto-login and set language
         session['user_id'] = user_id
@@ -229,19 +256,32 @@ def login():
         email = request.form.get('email','').strip().lower()
         password = request.form.get('password','')
         
-        conn = sqlite3.connect(DATABASE)
+        conn = get_db()
         cursor = conn.cursor()
         cursor.execute('''
             SELECT id, name, password_hash, preferred_language FROM users WHERE email = ?
         ''', (email,))
         user = cursor.fetchone()
-        conn.close()
         
-        if user and check_password_hash(user[2], password):
+        try:
+            valid = bool(user) and passwords.verify_password(user[2], password)
+        except passwords.HashingBusy:
+            flash('The server is busy, please try again in a moment.', 'error')
+            return render_template('login.html'), 503, {'Retry-After': str(passwords.RETRY_AFTER_SECONDS)}
+        
+        if valid:
+            # Transparently upgrade hashes made with older parameters
+            if passwords.needs_rehash(user[2]):
+                try:
+                    cursor.execute('UPDATE users SET password_hash = ? WHERE id = ?',
+                                   (passwords.hash_password(password), user[0]))
+                    conn.commit()
+                except passwords.HashingBusy:
+                    pass
             session['user_id'] = user[0]
             session['name'] = user[1] or ''
-            if user[3] in LANGUAGES:
-                session['language'] = user[3]
+            # Resolve the language once here so get_locale() never queries per render
+            session['language'] = user[3] if user[3] in LANGUAGES else 'en'
             flash('Login successful!', 'success')
             return redirect(url_for('report'))
         else:
@@ -263,11 +303,11 @@ def change_language(lang_code: str):
         # Optionally persist for logged-in users
         try:
             if 'user_id' in session:
-                conn = sqlite3.connect(DATABASE)
+                conn = get_db()
                 cursor = conn.cursor()
                 cursor.execute('UPDATE users SET preferred_language = ? WHERE id = ?', (lang_code, session['user_id']))
                 conn.commit()
-                conn.close()
+                _forget_preferred_language(session['user_id'])
         except Exception:
             pass
     return redirect(request.referrer or url_for('home'))
@@ -291,96 +331,376 @@ def report():
         location = request.form['location']
         disaster_type = request.form['disaster_type']
         description = request.form['description']
+        try:
+            latitude, longitude = geo.parse_point(request.form.get('latitude'), request.form.get('longitude'))
+        except geo.GeoQueryError as e:
+            flash(str(e), 'error')
+            return redirect(url_for('report'))
         
-        # Handle file upload
+        # Handle file upload (stored under its content hash; thumbnails are made in the background)
         image_path = None
         if 'image' in request.files:
             file = request.files['image']
             if file and file.filename and allowed_file(file.filename):
-                filename = secure_filename(file.filename)
-                # Add timestamp to avoid filename conflicts
-                timestamp = datetime.now().strftime('%Y%m%d_%H%M%S_')
-                filename = timestamp + filename
-                file.save(os.path.join(UPLOAD_FOLDER, filename))
-                image_path = filename
+                try:
+                    image_path = image_pipeline.save(file)
+                except images.UploadRejected as e:
+                    flash(str(e), 'error')
+                    return redirect(url_for('report'))
+        
+        created_at = datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')
+        # Live-feed payload, pushed to dashboards once the row is committed (no re-query needed)
+        event = {
+            'name': name or 'Anonymous',
+            'email': email,
+            'location': location,
+            'disaster_type': disaster_type,
+            'description': description,
+            'image_path': image_path,
+            'thumbnail_url': url_for('thumbnail', filename=image_path) if image_path else None,
+            'status': 'pending',
+            'created_at': created_at,
+            'latitude': latitude,
+            'longitude': longitude
+        }
+        
+        if write_behind:
+            # Durable in the journal now; the background writer batches the INSERT
+            submission_id = write_behind.submit('reports', {
+                'user_id': session['user_id'], 'name': name, 'email': email, 'location': location,
+                'disaster_type': disaster_type, 'description': description, 'image_path': image_path,
+                'latitude': latitude, 'longitude': longitude, 'created_at': created_at
+            }, event=event)
+            flash(f'Report received (reference {submission_id[:12]}).', 'success')
+            return redirect(url_for('report'))
         
         # Save report to database
-        conn = sqlite3.connect(DATABASE)
+        conn = get_db()
         cursor = conn.cursor()
         cursor.execute('''
-            INSERT INTO reports (user_id, name, email, location, disaster_type, description, image_path)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
-        ''', (session['user_id'], name, email, location, disaster_type, description, image_path))
+            INSERT INTO reports (user_id, name, email, location, disaster_type, description, image_path, latitude, longitude, created_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (session['user_id'], name, email, location, disaster_type, description, image_path, latitude, longitude, created_at))
+        report_id = cursor.lastrowid
+        cluster_id = dedup.assign_cluster(cursor, report_id, disaster_type, location, description,
+                                          created_at, latitude, longitude)
         conn.commit()
-        conn.close()
+        response_cache.invalidate('reports')
+        triage.pending.admit(report_id, cluster_id, disaster_type, created_at)
+        events.broker.publish('report', dict(event, id=report_id, cluster_id=cluster_id), topic=disaster_type)
         
         flash('Report submitted successfully!', 'success')
         return redirect(url_for('report'))
     
     return render_template('report.html')
 
+REPORT_SOURCE_COLUMNS = ['id', 'name', 'email', 'location', 'disaster_type', 'description', 'image_path',
+                         'status', 'created_at', 'latitude', 'longitude', 'cluster_id']
+
+@app.errorhandler(archive.ArchiveRangeError)
+def archive_range_error(e):
+    return jsonify({'error': str(e)}), 400
+
 @app.route('/api/reports')
+@response_cache.cached('reports')
 def api_reports():
-    """API endpoint to get recent reports with filters"""
+    """API endpoint to get recent reports with filters, keyset-paginated"""
     disaster_type = request.args.get('disaster_type', '')
     location_filter = request.args.get('location', '')
+    text_query = request.args.get('q', '')
+    by_relevance = request.args.get('sort') == 'relevance'
+    # group=cluster collapses near-duplicates into one entry per incident, with a report count
+    grouped = request.args.get('group') == 'cluster'
+    try:
+        limit = page_size(request.args.get('limit'))
+        seek_sql, seek_params, order_sql, reverse = keyset_clause(request.args, 'r.created_at', 'r.id')
+        bbox = geo.parse_bbox(request.args['bbox']) if request.args.get('bbox') else None
+        near = geo.parse_near(request.args['near'], request.args.get('radius_km')) if request.args.get('near') else None
+        start = time_bound(request.args.get('from'))
+        end = time_bound(request.args.get('to'), end=True)
+    except (CursorError, geo.GeoQueryError) as e:
+        return jsonify({'error': str(e)}), 400
+    boxes = [bbox] if bbox else []
+    if near:
+        # Radius search: prefilter on the circle's bounding boxes, then rank by distance
+        boxes = geo.radius_bboxes(*near)
     
-    conn = sqlite3.connect(DATABASE)
+    conn = get_db()
     cursor = conn.cursor()
+    # A from bound reaching back into archived months also reads those archive files.
+    # The cursor is closed first: DETACH fails while a statement still reads an archive.
+    with archive.attached(conn, start, end) as schemas, closing(cursor):
+        # Archives carry neither the FTS nor the R*Tree index; they are matched with LIKE and plain ranges
+        source = archive.union_source(conn, 'reports', REPORT_SOURCE_COLUMNS, schemas)
+        use_fts = search.fts_available(conn) and not schemas
+        # Without the R*Tree module (or with archives attached) boxes become plain coordinate ranges
+        use_rtree = bool(boxes) and geo.rtree_available(conn) and not schemas
     
-    query = '''
-        SELECT r.id, r.name, r.email, r.location, r.disaster_type, 
-               r.description, r.image_path, r.status, r.created_at
-        FROM reports r
-        WHERE 1=1
-    '''
-    params = []
+        # Combine location/text search into a single FTS5 MATCH expression
+        match_terms = []
+        unmatchable = False
+        if use_fts:
+            for text, column in ((location_filter, 'location'), (text_query, None)):
+                expression = search.match_expression(text, column)
+                if expression:
+                    match_terms.append(expression)
+                elif text.strip():
+                    # Only punctuation: the index can't match it, and dropping the filter would match everything
+                    unmatchable = True
+    
+        query = '''
+            SELECT r.id, r.name, r.email, r.location, r.disaster_type, 
+                   r.description, r.image_path, r.status, r.created_at,
+                   r.latitude, r.longitude, COALESCE(r.cluster_id, r.id)
+        '''
+        params = []
+        if use_rtree:
+            # CROSS JOIN pins the R*Tree as the outer loop so only boxed rows are visited
+            boxed = ' UNION ALL '.join('SELECT id FROM reports_geo WHERE min_lat >= ? AND max_lat <= ? '
+                                       'AND min_lon >= ? AND max_lon <= ?' for _ in boxes)
+            query += f' FROM ({boxed}) g CROSS JOIN reports r ON r.id = g.id'
+            params += [value for box in boxes for value in box]
+        else:
+            query += f' FROM {source} r'
+        if match_terms:
+            query += ' JOIN reports_fts ON reports_fts.rowid = r.id'
+        query += ' WHERE 1=1'
     
-    if disaster_type:
-        query += ' AND r.disaster_type = ?'
-        params.append(disaster_type)
+        if disaster_type:
+            query += ' AND r.disaster_type = ?'
+            params.append(disaster_type)
     
-    if location_filter:
-        query += ' AND r.location LIKE ?'
-        params.append(f'%{location_filter}%')
+        if grouped:
+            query += ' AND r.cluster_id IS NULL'
     
-    query += ' ORDER BY r.created_at DESC LIMIT 20'
+        if start:
+            query += ' AND r.created_at >= ?'
+            params.append(start)
+        if end:
+            query += ' AND r.created_at < ?'
+            params.append(end)
     
-    cursor.execute(query, params)
-    reports = []
-    for row in cursor.fetchall():
-        reports.append({
-            'id': row[0],
-            'name': row[1] or 'Anonymous',
-            'email': row[2],
-            'location': row[3],
-            'disaster_type': row[4],
-            'description': row[5],
-            'image_path': row[6],
-            'status': row[7],
-            'created_at': row[8]
-        })
+        if boxes and not use_rtree:
+            query += ' AND (' + ' OR '.join('(r.latitude >= ? AND r.latitude <= ? '
+                                            'AND r.longitude >= ? AND r.longitude <= ?)' for _ in boxes) + ')'
+            params += [value for box in boxes for value in box]
     
-    conn.close()
-    return jsonify({'reports': reports})
+        if match_terms:
+            query += ' AND reports_fts MATCH ?'
+            params.append(' AND '.join(match_terms))
+        elif not use_fts:
+            if location_filter:
+                query += ' AND r.location LIKE ?'
+                params.append(f'%{location_filter}%')
+            if text_query:
+                query += ' AND (r.location LIKE ? OR r.description LIKE ?)'
+                params += [f'%{text_query}%', f'%{text_query}%']
+        if unmatchable:
+            query += ' AND 0'
+    
+        paged = not near and not (match_terms and by_relevance)
+        if near:
+            # Nearest candidates first, capped in SQL; exact distances are checked below
+            distance_sql, distance_params = geo.approx_distance_sql(near[0], near[1], 'r.latitude', 'r.longitude')
+            query += f' ORDER BY {distance_sql} LIMIT ?'
+            params += distance_params
+            params.append(limit * geo.NEAR_CANDIDATE_FACTOR)
+            reverse = False
+        elif not paged:
+            # Ranked results are a single best-match page; cursors only apply to recency order
+            query += ' ORDER BY reports_fts.rank LIMIT ?'
+            params.append(limit)
+            reverse = False
+        else:
+            query += seek_sql + order_sql + ' LIMIT ?'
+            params += seek_params
+            params.append(limit + 1)
+    
+        cursor.execute(query, params)
+        rows = cursor.fetchall()
+        if near:
+            lat, lon, radius_km = near
+            candidates = ((geo.haversine_km(lat, lon, row[9], row[10]), row) for row in rows)
+            rows = heapq.nsmallest(limit, (c for c in candidates if c[0] <= radius_km), key=lambda c: c[0])
+            has_more = False
+        else:
+            has_more = len(rows) > limit
+            rows = [(None, row) for row in rows[:limit]]
+        if reverse:
+            rows.reverse()
+        reports = []
+        for distance_km, row in rows:
+            item = {
+                'id': row[0],
+                'name': row[1] or 'Anonymous',
+                'email': row[2],
+                'location': row[3],
+                'disaster_type': row[4],
+                'description': row[5],
+                'image_path': row[6],
+                'thumbnail_url': url_for('thumbnail', filename=row[6]) if row[6] else None,
+                'status': row[7],
+                'created_at': row[8],
+                'latitude': row[9],
+                'longitude': row[10],
+                'cluster_id': row[11]
+            }
+            if distance_km is not None:
+                item['distance_km'] = round(distance_km, 3)
+            reports.append(item)
+    
+        if grouped and reports:
+            ids = [item['id'] for item in reports]
+            placeholders = ', '.join('?' for _ in ids)
+            cursor.execute(f'''
+                SELECT cluster_id, COUNT(*), MAX(created_at) FROM {source}
+                WHERE cluster_id IN ({placeholders}) GROUP BY cluster_id
+            ''', ids)
+            duplicates = {row[0]: row[1:] for row in cursor.fetchall()}
+            for item in reports:
+                count, latest = duplicates.get(item['id'], (0, None))
+                item['report_count'] = count + 1
+                item['last_reported_at'] = latest or item['created_at']
+    
+    if paged:
+        next_cursor, prev_cursor = page_links(reports, has_more, request.args)
+    else:
+        next_cursor = prev_cursor = None
+    return jsonify({'reports': reports, 'next_cursor': next_cursor, 'prev_cursor': prev_cursor})
+
+@app.route('/api/reports/stream')
+def api_reports_stream():
+    """Server-Sent Events feed of new and status-changed reports"""
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id', '')
+    disaster_type = request.args.get('disaster_type') or None
+    try:
+        sub, backlog = events.broker.subscribe(last_event_id, topic=disaster_type)
+    except events.TooManySubscribers:
+        return jsonify({'error': 'Live feed is at capacity, please poll /api/reports'}), 503, {'Retry-After': '30'}
+    return Response(events.broker.stream(sub, backlog), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no',
+    })
+
+@app.route('/api/reports/bulk', methods=['GET', 'POST'])
+def api_reports_bulk():
+    """Agency data exchange: POST imports an NDJSON/CSV stream, GET streams an export"""
+    if 'user_id' not in session:
+        return jsonify({'error': 'Login required'}), 401
+    if not bulk.is_partner(session['user_id']):
+        return jsonify({'error': 'Bulk exchange is limited to partner agency accounts'}), 403
+    export_format = request.args.get('format') or ('csv' if request.mimetype == 'text/csv' else 'ndjson')
+    if export_format not in ('ndjson', 'csv'):
+        return jsonify({'error': 'format must be ndjson or csv'}), 400
+
+    if request.method == 'POST':
+        # Read past MAX_CONTENT_LENGTH (sized for image uploads) up to the bulk limit
+        stream = get_input_stream(request.environ, max_content_length=BULK_MAX_BYTES)
+        conn = get_db()
+        summary = bulk.import_reports(conn, stream, export_format, session['user_id'])
+        if summary['imported']:
+            response_cache.invalidate('reports')
+            triage.pending.invalidate()
+        return jsonify(dict(success=True, **summary)), 200
+
+    try:
+        start = time_bound(request.args.get('from'))
+        end = time_bound(request.args.get('to'), end=True)
+    except CursorError as e:
+        return jsonify({'error': str(e)}), 400
+    where_sql = ''
+    params = []
+    if request.args.get('disaster_type'):
+        where_sql += ' AND disaster_type = ?'
+        params.append(request.args['disaster_type'])
+    if start:
+        where_sql += ' AND created_at >= ?'
+        params.append(start)
+    if end:
+        where_sql += ' AND created_at < ?'
+        params.append(end)
+
+    def generate():
+        # Own pooled connection: the body is streamed after the request context is gone
+        with db.connection() as conn:
+            yield from bulk.export_reports(conn, where_sql, params, export_format, EXPORT_BATCH_SIZE)
+
+    mimetype = 'text/csv' if export_format == 'csv' else 'application/x-ndjson'
+    return Response(generate(), mimetype=mimetype, headers={
+        'Content-Disposition': f'attachment; filename=reports.{export_format}'
+    })
+
+@app.route('/api/sync')
+def api_sync():
+    """Reports inserted, changed or deleted since a change-log version, for low-bandwidth clients"""
+    try:
+        since, fields, limit = sync.parse_request(request.args)
+        body_format = sync.negotiate(request)
+    except sync.SyncError as e:
+        return jsonify({'error': str(e)}), 400
+    payload = sync.changes(get_db(), since, fields, limit)
+    body, headers = sync.encode(payload, body_format, 'gzip' in request.accept_encodings)
+    return Response(body, headers=headers)
+
+@app.route('/api/triage/next', methods=['POST'])
+def api_triage_next():
+    """Claim the most urgent open incident for the current responder"""
+    if 'user_id' not in session:
+        return jsonify({'error': 'Login required'}), 401
+    report = triage.pending.claim(get_db(), session['user_id'])
+    if report is None:
+        return jsonify({'report': None, 'open': 0})
+    response_cache.invalidate('reports')
+    events.broker.publish('status', {'id': report['id'], 'status': report['status']}, topic=report['disaster_type'])
+    return jsonify({'report': report, 'open': len(triage.pending)})
+
+@app.route('/api/reports/<int:report_id>/status', methods=['POST'])
+def api_report_status(report_id):
+    """Move an incident to a new status (pending, dispatched, resolved, rejected)"""
+    if 'user_id' not in session:
+        return jsonify({'error': 'Login required'}), 401
+    data = request.get_json(silent=True) or request.form
+    try:
+        report = triage.pending.transition(get_db(), report_id, data.get('status', ''), session['user_id'])
+    except triage.TransitionError as e:
+        return jsonify({'error': str(e)}), 409 if data.get('status') in triage.STATUSES else 400
+    if report is None:
+        return jsonify({'error': 'Report not found'}), 404
+    response_cache.invalidate('reports')
+    events.broker.publish('status', {'id': report['id'], 'status': report['status']}, topic=report['disaster_type'])
+    return jsonify({'report': report})
 
-# Serve uploaded files
+# Serve uploaded files (content-addressed names are cached forever once processed)
 @app.route('/uploads/<path:filename>')
 def uploaded_file(filename):
-    return send_from_directory(UPLOAD_FOLDER, filename)
+    return send_cached(UPLOAD_FOLDER, filename, immutable=image_pipeline.is_final(filename))
 
-# Contact Us routes and captcha utilities
-def _generate_captcha_code(length: int = 7) -> str:
-    alphabet = string.ascii_uppercase + string.digits
-    return ''.join(random.choice(alphabet) for _ in range(length))
+@app.route('/uploads/thumbs/<path:filename>')
+def thumbnail(filename):
+    """Feed-sized variant of an upload: WebP when accepted, else JPEG, else the original"""
+    stem = filename.rsplit('.', 1)[0]
+    variants = ['.webp', '.jpg'] if request.accept_mimetypes['image/webp'] else ['.jpg']
+    response = None
+    for suffix in variants:
+        try:
+            response = send_cached(image_pipeline.thumb_folder, stem + suffix,
+                                   immutable=bool(images.CONTENT_ADDRESSED.match(filename)))
+            break
+        except NotFound:
+            continue
+    if response is None:
+        # Not processed yet (or a legacy upload): fall back to the original
+        response = send_cached(UPLOAD_FOLDER, filename)
+    response.vary.add('Accept')
+    return response
 
+# Contact Us routes
 @app.route('/contact', methods=['GET', 'POST'])
 def contact():
     if request.method == 'POST':
-        # Validate captcha
-        expected = session.get('captcha_code')
+        # Validate captcha (signed, single-use token from the form)
         entered = request.form.get('captcha_input', '').strip().upper()
-        if not expected or entered != expected:
+        if not captchas.verify(request.form.get('captcha_token', ''), entered):
             flash('Invalid captcha. Please try again.', 'error')
             return redirect(url_for('contact'))
 
@@ -394,8 +714,17 @@ def contact():
         description = request.form.get('description', '')
         time_slot = request.form.get('time_slot', '')
 
+        if write_behind:
+            submission_id = write_behind.submit('contact_messages', {
+                'enquiry_type': enquiry_type, 'segment': segment, 'name': name, 'email': email,
+                'mobile': mobile, 'city': city, 'description': description, 'time_slot': time_slot,
+                'captcha_entered': entered, 'created_at': datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')
+            })
+            flash(f'Thank you for reaching out! Our team will get back to you soon (reference {submission_id[:12]}).', 'success')
+            return redirect(url_for('contact'))
+
         # Persist to DB
-        conn = sqlite3.connect(DATABASE)
+        conn = get_db()
         cursor = conn.cursor()
         cursor.execute('''
             INSERT INTO contact_messages (
@@ -403,151 +732,154 @@ def contact():
             ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
         ''', (enquiry_type, segment, name, email, mobile, city, description, time_slot, entered))
         conn.commit()
-        conn.close()
 
         flash('Thank you for reaching out! Our team will get back to you soon.', 'success')
-        # regenerate captcha for the next visit
-        session['captcha_code'] = _generate_captcha_code()
         return redirect(url_for('contact'))
 
-    # GET: generate captcha
-    session['captcha_code'] = _generate_captcha_code()
-    return render_template('contact.html', captcha_code=session['captcha_code'])
+    # GET: issue a captcha; nothing is stored server-side until it is used
+    captcha_code, captcha_token = captchas.issue()
+    return render_template('contact.html', captcha_code=captcha_code, captcha_token=captcha_token)
 
 # ---- Stripe configuration and Checkout routes ----
 
-# Load environment variables for Stripe keys
-load_dotenv()
+# Stripe keys (environment variables are loaded from .env at import time)
 STRIPE_PUBLIC_KEY = os.getenv('STRIPE_PUBLIC_KEY', '')
 STRIPE_SECRET_KEY = os.getenv('STRIPE_SECRET_KEY', '')
+# With a webhook secret, donations are recorded from /stripe/webhook instead of /success
+STRIPE_WEBHOOK_SECRET = os.getenv('STRIPE_WEBHOOK_SECRET', '')
 
 if STRIPE_SECRET_KEY:
-    stripe.api_key = STRIPE_SECRET_KEY
+    payments.configure(STRIPE_SECRET_KEY)
 
 def _inr_smallest_unit(amount: float, currency: str) -> int:
     # Stripe expects the amount in the smallest currency unit
     # For zero-decimal currencies this would be different, but for INR/USD/EUR/GBP it's cents/paise
     return int(round(float(amount) * 100))
 
-@app.route('/create-checkout-session', methods=['POST'])
-def create_checkout_session():
-    """Create Stripe Checkout Session from donation form."""
-    try:
-        data = request.get_json(force=True, silent=False) or {}
-        donor_name = (data.get('donor_name') or '').strip()
-        donor_email = (data.get('donor_email') or '').strip()
-        purpose = (data.get('purpose') or '').strip()
-        currency = (data.get('currency') or 'USD').upper()
-        pay_via = (data.get('pay_via') or 'Other').strip()
-        amount = float(data.get('amount') or 0)
-
-        if not donor_name or not donor_email or amount <= 0:
-            return jsonify({'error': 'Invalid donation data'}), 400
+def checkout_params(data):
+    """Stripe Checkout Session parameters and the session draft for a donation form, or None if it is invalid"""
+    donor_name = (data.get('donor_name') or '').strip()
+    donor_email = (data.get('donor_email') or '').strip()
+    purpose = (data.get('purpose') or '').strip()
+    currency = (data.get('currency') or 'USD').upper()
+    pay_via = (data.get('pay_via') or 'Other').strip()
+    amount = float(data.get('amount') or 0)
 
-        if not STRIPE_SECRET_KEY:
-            return jsonify({'error': 'Stripe is not configured on the server'}), 500
+    if not donor_name or not donor_email or amount <= 0:
+        return None
 
-        amount_smallest = _inr_smallest_unit(amount, currency)
-
-        success_url = url_for('success', _external=True) + '?session_id={CHECKOUT_SESSION_ID}'
-        cancel_url = url_for('cancel', _external=True)
-
-        # Create Checkout Session
-        session_obj = stripe.checkout.Session.create(
-            mode='payment',
-            success_url=success_url,
-            cancel_url=cancel_url,
-            customer_email=donor_email,
-            line_items=[{
-                'price_data': {
-                    'currency': currency.lower(),
-                    'product_data': {
-                        'name': 'ResQNet Donation',
-                        'description': purpose or 'Support ResQNet operations'
-                    },
-                    'unit_amount': amount_smallest,
+    params = dict(
+        mode='payment',
+        success_url=url_for('success', _external=True) + '?session_id={CHECKOUT_SESSION_ID}',
+        cancel_url=url_for('cancel', _external=True),
+        customer_email=donor_email,
+        line_items=[{
+            'price_data': {
+                'currency': currency.lower(),
+                'product_data': {
+                    'name': 'ResQNet Donation',
+                    'description': purpose or 'Support ResQNet operations'
                 },
-                'quantity': 1,
-            }],
-            metadata={
-                'donor_name': donor_name,
-                'donor_email': donor_email,
-                'purpose': purpose,
-                'pay_via': pay_via,
-                'currency': currency,
-                'amount': str(amount)
-            }
-        )
-
-        # Save minimal details in Flask session for cancel handling
-        session['last_checkout'] = {
+                'unit_amount': _inr_smallest_unit(amount, currency),
+            },
+            'quantity': 1,
+        }],
+        metadata={
             'donor_name': donor_name,
             'donor_email': donor_email,
             'purpose': purpose,
             'pay_via': pay_via,
             'currency': currency,
-            'amount': amount,
-            'payment_reference': session_obj.id,
+            'amount': str(amount)
         }
+    )
+    # Saved in the Flask session for cancel handling
+    draft = {
+        'donor_name': donor_name,
+        'donor_email': donor_email,
+        'purpose': purpose,
+        'pay_via': pay_via,
+        'currency': currency,
+        'amount': amount,
+    }
+    return params, draft
+
+@app.route('/create-checkout-session', methods=['POST'])
+def create_checkout_session():
+    """Create Stripe Checkout Session from donation form."""
+    try:
+        checkout = checkout_params(request.get_json(force=True, silent=False) or {})
+        if checkout is None:
+            return jsonify({'error': 'Invalid donation data'}), 400
+
+        if not STRIPE_SECRET_KEY:
+            return jsonify({'error': 'Stripe is not configured on the server'}), 500
+
+        params, draft = checkout
+        # Create Checkout Session (timeout-bounded, fails fast while Stripe is down)
+        try:
+            session_obj = payments.create_checkout_session(**params)
+        except payments.StripeUnavailable as e:
+            return jsonify({'error': str(e)}), 503, {'Retry-After': str(int(payments.BREAKER_RESET))}
 
+        session['last_checkout'] = dict(draft, payment_reference=session_obj.id)
         return jsonify({'id': session_obj.id, 'url': session_obj.url})
     except Exception as e:
         return jsonify({'error': f'Checkout error: {str(e)}'}), 500
 
-@app.route('/success')
-def success():
-    """Payment success page; persist donation with status Succeeded."""
-    session_id = request.args.get('session_id', '')
-    if not session_id or not STRIPE_SECRET_KEY:
+def success_redirect():
+    """Where /success goes without a session id, or None when Stripe must be asked"""
+    if not request.args.get('session_id') or not STRIPE_SECRET_KEY:
         flash('Missing payment session.', 'error')
         return redirect(url_for('donation'))
+    return None
 
-    try:
-        checkout_session = stripe.checkout.Session.retrieve(session_id, expand=['payment_intent'])
-        metadata = checkout_session.get('metadata', {})
-        payment_intent = checkout_session.get('payment_intent')
-        payment_reference = session_id
-        status = 'Succeeded'
-
-        donor_name = metadata.get('donor_name', '')
-        donor_email = metadata.get('donor_email', '')
-        purpose = metadata.get('purpose', '')
-        pay_via = metadata.get('pay_via', 'Other')
-        currency = (metadata.get('currency') or 'USD').upper()
-        try:
-            amount = float(metadata.get('amount'))
-        except Exception:
-            amount = 0.0
+def webhook_success_page():
+    """Thank-you page straight from the session draft when the webhook records the donation, else None"""
+    session_id = request.args.get('session_id', '')
+    draft = session.get('last_checkout') or {}
+    if not STRIPE_WEBHOOK_SECRET or draft.get('payment_reference') != session_id:
+        return None
+    # No Stripe round-trip on the donor's request
+    session.pop('last_checkout', None)
+    return render_template('success.html',
+                           donor_name=draft.get('donor_name', ''),
+                           amount=draft.get('amount', 0),
+                           currency=(draft.get('currency') or 'USD').upper(),
+                           payment_reference=session_id)
 
-        # Insert donation record with success
-        conn = sqlite3.connect(DATABASE)
-        cursor = conn.cursor()
-        cursor.execute('''
-            INSERT INTO donations (donor_name, donor_email, amount, currency, purpose, pay_via, payment_method, payment_reference, status)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (
-            donor_name,
-            donor_email,
-            amount,
-            currency,
-            purpose,
-            pay_via,
-            'Stripe Checkout',
-            payment_reference,
-            status
-        ))
-        conn.commit()
-        conn.close()
+def record_succeeded(payment_reference, metadata):
+    """Upsert on payment_reference: reloading /success or a webhook arriving first is harmless"""
+    with db.connection() as conn:
+        payments.record_donation(conn.cursor(), payment_reference, metadata, 'Succeeded')
+    response_cache.invalidate('donations')
 
-        # Clear saved checkout draft
-        session.pop('last_checkout', None)
+def verified_success_page(checkout_session):
+    """Thank-you page for a Checkout Session fetched from Stripe (after its donation is recorded)"""
+    metadata = checkout_session.get('metadata', {})
+    try:
+        amount = float(metadata.get('amount'))
+    except Exception:
+        amount = 0.0
+    # Clear saved checkout draft
+    session.pop('last_checkout', None)
+    return render_template('success.html',
+                           donor_name=metadata.get('donor_name', ''),
+                           amount=amount,
+                           currency=(metadata.get('currency') or 'USD').upper(),
+                           payment_reference=request.args['session_id'])
 
-        # Show thank-you page
-        return render_template('success.html',
-                               donor_name=donor_name,
-                               amount=amount,
-                               currency=currency,
-                               payment_reference=payment_reference)
+@app.route('/success')
+def success():
+    """Payment success page; the donation is recorded from the webhook (or here as a fallback)."""
+    page = success_redirect() or webhook_success_page()
+    if page is not None:
+        return page
+    try:
+        session_id = request.args['session_id']
+        checkout_session = payments.retrieve_checkout_session(session_id)
+        record_succeeded(session_id, checkout_session.get('metadata', {}))
+        return verified_success_page(checkout_session)
     except Exception as e:
         flash(f'Unable to verify payment: {str(e)}', 'error')
         return redirect(url_for('donation'))
@@ -556,31 +888,31 @@ def success():
 def cancel():
     """User cancelled payment; record cancellation and redirect back with message."""
     draft = session.pop('last_checkout', None)
-    if draft:
+    if draft and draft.get('payment_reference'):
         try:
-            conn = sqlite3.connect(DATABASE)
-            cursor = conn.cursor()
-            cursor.execute('''
-                INSERT INTO donations (donor_name, donor_email, amount, currency, purpose, pay_via, payment_method, payment_reference, status)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (
-                draft.get('donor_name',''),
-                draft.get('donor_email',''),
-                float(draft.get('amount') or 0),
-                (draft.get('currency') or 'USD').upper(),
-                draft.get('purpose',''),
-                draft.get('pay_via','Other'),
-                'Stripe Checkout',
-                draft.get('payment_reference',''),
-                'Cancelled'
-            ))
+            conn = get_db()
+            # Never downgrades a payment that the webhook already recorded as Succeeded
+            payments.record_donation(conn.cursor(), draft['payment_reference'], draft, 'Cancelled')
             conn.commit()
-            conn.close()
+            response_cache.invalidate('donations')
         except Exception:
             pass
     flash('Payment Cancelled', 'error')
     return redirect(url_for('donation'))
 
+@app.route('/stripe/webhook', methods=['POST'])
+def stripe_webhook():
+    """Verify a Stripe webhook and queue it; donations are recorded in the background."""
+    if not STRIPE_WEBHOOK_SECRET:
+        return jsonify({'error': 'Webhooks are not configured'}), 404
+    payload = request.get_data()
+    try:
+        stripe.Webhook.construct_event(payload, request.headers.get('Stripe-Signature', ''), STRIPE_WEBHOOK_SECRET)
+    except (ValueError, stripe.SignatureVerificationError):
+        return jsonify({'error': 'Invalid signature'}), 400
+    payments.webhooks.receive(json.loads(payload))
+    return jsonify({'received': True})
+
 @app.route('/api/donate', methods=['POST'])
 def donate():
     """Handle donation submission"""
@@ -602,7 +934,7 @@ def donate():
             return jsonify({'error': 'Invalid amount format'}), 400
         
         # Insert into database
-        conn = sqlite3.connect(DATABASE)
+        conn = get_db()
         cursor = conn.cursor()
         
         cursor.execute('''
@@ -612,14 +944,14 @@ def donate():
             data['donor_name'],
             data['donor_email'],
             amount,
-            data.get('currency', 'USD'),
+            (data.get('currency') or 'USD').upper(),
             data.get('purpose', ''),
             data['pay_via']
         ))
         
         donation_id = cursor.lastrowid
         conn.commit()
-        conn.close()
+        response_cache.invalidate('donations')
         
         return jsonify({
             'success': True,
@@ -630,46 +962,211 @@ def donate():
     except Exception as e:
         return jsonify({'error': f'Server error: {str(e)}'}), 500
 
+DONATION_COLUMNS = ['id', 'donor_name', 'donor_email', 'amount', 'currency', 'purpose', 'pay_via', 'status', 'created_at']
+EXPORT_BATCH_SIZE = 500
+
+def donation_filters(args):
+    """WHERE fragment, params and (from, to) period for the donations ledger filters"""
+    sql = ''
+    params = []
+    if args.get('status'):
+        sql += ' AND status = ?'
+        params.append(args['status'])
+    if args.get('currency'):
+        sql += ' AND currency = ?'
+        params.append(args['currency'].upper())
+    start = time_bound(args.get('from'))
+    end = time_bound(args.get('to'), end=True)
+    if start:
+        sql += ' AND created_at >= ?'
+        params.append(start)
+    if end:
+        sql += ' AND created_at < ?'
+        params.append(end)
+    return sql, params, (start, end)
+
+def _export_donations(where_sql, params, period, export_format):
+    """Yield the filtered ledger as NDJSON or CSV straight from the cursor.
+
+    Runs on its own pooled connection because the response body is consumed
+    after the request's app context (and its connection) has been torn down.
+    """
+    with db.connection() as conn, archive.attached(conn, *period) as schemas, closing(conn.cursor()) as cursor:
+        # A client that disconnects closes this generator mid-fetch; the cursor is
+        # closed before the archives are detached, since DETACH fails while it is open
+        source = archive.union_source(conn, 'donations', DONATION_COLUMNS, schemas)
+        cursor.execute(f"SELECT {', '.join(DONATION_COLUMNS)} FROM {source} "
+                       f"WHERE 1=1{where_sql} ORDER BY created_at DESC, id DESC", params)
+        if export_format == 'csv':
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            writer.writerow(DONATION_COLUMNS)
+            while True:
+                rows = cursor.fetchmany(EXPORT_BATCH_SIZE)
+                if not rows:
+                    break
+                writer.writerows(rows)
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+            yield buffer.getvalue()
+        else:
+            while True:
+                rows = cursor.fetchmany(EXPORT_BATCH_SIZE)
+                if not rows:
+                    break
+                yield ''.join(json.dumps(dict(zip(DONATION_COLUMNS, row))) + '\n' for row in rows)
+
 @app.route('/api/get-donations', methods=['GET'])
+@response_cache.cached('donations')
 def get_donations():
-    """Retrieve all donations"""
+    """Retrieve donations, newest first, one keyset page at a time (or as a streamed export)"""
+    try:
+        where_sql, params, period = donation_filters(request.args)
+        export_format = request.args.get('format', 'json')
+        if export_format in ('ndjson', 'csv'):
+            # Fail on an over-wide archive range now rather than halfway through the stream
+            archive.months_for(get_db(), *period)
+            mimetype = 'text/csv' if export_format == 'csv' else 'application/x-ndjson'
+            return Response(_export_donations(where_sql, params, period, export_format), mimetype=mimetype, headers={
+                'Content-Disposition': f'attachment; filename=donations.{export_format}'
+            })
+        if export_format != 'json':
+            return jsonify({'error': 'format must be json, ndjson or csv'}), 400
+        limit = page_size(request.args.get('limit'))
+        seek_sql, seek_params, order_sql, reverse = keyset_clause(request.args)
+    except CursorError as e:
+        return jsonify({'error': str(e)}), 400
+
     try:
-        conn = sqlite3.connect(DATABASE)
+        conn = get_db()
         cursor = conn.cursor()
         
-        cursor.execute('''
-            SELECT id, donor_name, donor_email, amount, currency, purpose, pay_via, created_at
-            FROM donations
-            ORDER BY created_at DESC
-        ''')
+        # Reads the archive months a from bound reaches back into, if any
+        with archive.attached(conn, *period) as schemas, closing(cursor):
+            source = archive.union_source(conn, 'donations', DONATION_COLUMNS, schemas)
+            cursor.execute(
+                f"SELECT {', '.join(DONATION_COLUMNS)} FROM {source} WHERE 1=1"
+                + where_sql + seek_sql + order_sql + ' LIMIT ?',
+                params + seek_params + [limit + 1]
+            )
+            rows = cursor.fetchall()
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        if reverse:
+            rows.reverse()
         
         donations = []
-        for row in cursor.fetchall():
-            donations.append({
-                'id': row[0],
-                'donor_name': row[1],
-                'donor_email': row[2],
-                'amount': row[3],
-                'currency': row[4],
-                'purpose': row[5],
-                'pay_via': row[6],
-                'created_at': row[7]
-            })
-        
-        conn.close()
+        for row in rows:
+            donations.append(dict(zip(DONATION_COLUMNS, row)))
         
+        next_cursor, prev_cursor = page_links(donations, has_more, request.args)
         return jsonify({
             'success': True,
             'donations': donations,
-            'count': len(donations)
+            'count': len(donations),
+            'next_cursor': next_cursor,
+            'prev_cursor': prev_cursor
         }), 200
         
+    except archive.ArchiveRangeError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': f'Server error: {str(e)}'}), 500
 
-if __name__ == '__main__':
-    # Initialize database on startup
+def summary_filters(args):
+    """WHERE fragment and params over donation_totals for the summary filters"""
+    start = time_bound(args.get('from'))
+    end = time_bound(args.get('to'), end=True)
+    where_sql = ''
+    params = []
+    if args.get('currency'):
+        where_sql += ' AND currency = ?'
+        params.append(args['currency'].upper())
+    if args.get('status'):
+        where_sql += ' AND status = ?'
+        params.append(args['status'])
+    if start:
+        where_sql += ' AND day >= ?'
+        params.append(start[:10])
+    if end:
+        where_sql += ' AND day < ?'
+        params.append(end[:10])
+    return where_sql, params
+
+@app.route('/api/donations/summary', methods=['GET'])
+@response_cache.cached('donations')
+def donations_summary():
+    """Donation totals, counts and averages from the incrementally maintained aggregate table"""
+    try:
+        where_sql, params = summary_filters(request.args)
+    except CursorError as e:
+        return jsonify({'error': str(e)}), 400
+
+    summary = aggregates.donation_summary(get_db().cursor(), where_sql, params)
+    return jsonify(dict(success=True, **summary)), 200
+
+@app.cli.command('rebuild-donation-totals')
+def rebuild_donation_totals_command():
+    """Recompute the donation_totals aggregate table from the donations ledger."""
+    with db.connection() as conn:
+        buckets = aggregates.rebuild_donation_totals(conn.cursor())
+        # Archive files are attached outside a transaction
+        conn.commit()
+        archive.credit_archived_totals(conn)
+    print(f'Rebuilt donation totals ({buckets} buckets).')
+
+@app.cli.command('rebuild-report-clusters')
+def rebuild_report_clusters_command():
+    """Recompute near-duplicate report clusters, e.g. after changing DEDUP_* settings."""
+    with db.connection() as conn:
+        clusters = dedup.rebuild_clusters(conn.cursor())
+    response_cache.invalidate('reports')
+    print(f'Rebuilt report clusters ({clusters} clusters).')
+
+@app.cli.command('archive-old-rows')
+@click.option('--days', type=int, default=archive.AFTER_DAYS, show_default=True,
+              help='Archive whole months older than this many days.')
+@click.option('--vacuum', is_flag=True, help='VACUUM the live database afterwards to return the space.')
+def archive_old_rows_command(days, vacuum):
+    """Move old reports, donations and contact messages into monthly archive files."""
+    with db.connection() as conn:
+        moved = archive.archive_old_rows(conn, days)
+        if vacuum and moved:
+            conn.execute('VACUUM')
+    response_cache.invalidate('reports', 'donations')
+    triage.pending.invalidate()
+    for month, counts in moved.items():
+        print(f"{month}: {', '.join(f'{n} {table}' for table, n in counts.items())}")
+    print(f'Archived {len(moved)} month(s) to {archive.ARCHIVE_DIR}/.')
+
+@app.cli.command('build-assets')
+def build_assets_command():
+    """Fingerprint and pre-compress static files into static/dist."""
+    manifest = build_assets(app.static_folder)
+    static_assets.reload()
+    print(f'Built {len(manifest)} static assets.')
+
+def start_services():
+    """Migrate the database and start the background writers; run once per server process"""
     init_db()
+    # Recover any journaled submissions before serving traffic
+    if write_behind:
+        write_behind.start()
+    # Apply Stripe events that were received but not processed before the last shutdown
+    payments.webhooks.start()
+
+def stop_services():
+    """Commit queued submissions and stop the background writers"""
+    if write_behind:
+        write_behind.stop()
+    payments.webhooks.stop()
+
+if __name__ == '__main__':
+    # Spawned password-hashing workers would otherwise re-run this whole script as
+    # __mp_main__ (pools, caches, rate limiter, profiler); they only need werkzeug
+    sys.modules['__main__'].__spec__ = ModuleSpec('__main__', None)
+    start_services()
     
     # Run the app
     app.run(debug=True, host='0.0.0.0', port=5000)
@@ -0,0 +1,197 @@
+"""Hot/cold archival of old rows into monthly SQLite files.
+
+``flask archive-old-rows`` (run it from cron) moves reports, donations and
+contact messages older than ARCHIVE_AFTER_DAYS out of the live database.
+They go into one file per calendar month under ARCHIVE_DIR, e.g.
+``archive/2024-03.db``. Only whole months are moved, and reports still
+being worked (status 'dispatched') stay behind. Each month is copied
+(INSERT OR IGNORE on the primary key) and committed before the live rows are
+deleted. An interrupted run therefore leaves at worst duplicate rows, which
+the next run clears. Donation totals are credited back before the delete,
+so /api/donations/summary still covers archived months.
+
+The live database records each archived month in the ``archives`` table.
+Listings consult archives only when their ``from`` bound reaches back into
+an archived month. The month files are then ATTACHed read-only for that
+one query and detached afterwards. Older archive files that predate a
+later migration read NULL for columns they lack.
+"""
+import logging
+import os
+import re
+import sqlite3
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import aggregates
+from pagination import CursorError
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_DIR = os.getenv('ARCHIVE_DIR', 'archive')
+AFTER_DAYS = int(os.getenv('ARCHIVE_AFTER_DAYS', '365'))
+TABLES = ('reports', 'donations', 'contact_messages')
+# Rows that must stay live regardless of age
+KEEP_LIVE = {'reports': " AND status IS NOT 'dispatched'"}
+DEFAULT_ATTACH_LIMIT = 10
+_MONTH = re.compile(r'^\d{4}-\d{2}$')
+
+
+class ArchiveRangeError(CursorError):
+    """Raised when a time range would need more archive files than one query can attach."""
+
+
+def _month_bounds(month: str):
+    start = datetime.strptime(month, '%Y-%m')
+    end = (start + timedelta(days=32)).replace(day=1)
+    return start.strftime('%Y-%m-%d %H:%M:%S'), end.strftime('%Y-%m-%d %H:%M:%S')
+
+
+def _columns(conn, schema: str, table: str) -> list:
+    return [(row[1], row[2], row[5]) for row in conn.execute(f'PRAGMA {schema}.table_info({table})')]
+
+
+def _ensure_table(conn, schema: str, table: str) -> list:
+    """Create or widen ``schema.table`` to match the live table; returns the live column names."""
+    live = _columns(conn, 'main', table)
+    existing = {name for name, _, _ in _columns(conn, schema, table)}
+    if not existing:
+        declarations = ', '.join(f'{name} {kind} PRIMARY KEY' if pk else f'{name} {kind}' for name, kind, pk in live)
+        conn.execute(f'CREATE TABLE {schema}.{table} ({declarations})')
+        conn.execute(f'CREATE INDEX {schema}.idx_{table}_created ON {table} (created_at, id)')
+        if table == 'reports':
+            conn.execute(f'CREATE INDEX {schema}.idx_reports_type_created ON reports (disaster_type, created_at)')
+    else:
+        for name, kind, _ in live:
+            if name not in existing:
+                conn.execute(f'ALTER TABLE {schema}.{table} ADD COLUMN {name} {kind}')
+    return [name for name, _, _ in live]
+
+
+def archive_month(conn, month: str, directory: str = ARCHIVE_DIR) -> dict:
+    """Move one month of rows into its archive file; returns rows moved per table."""
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f'{month}.db')
+    start, end = _month_bounds(month)
+    moved = {}
+    conn.execute('ATTACH DATABASE ? AS archive_rw', (path,))
+    try:
+        # Rollback journal so the finished file can later be opened read-only
+        conn.execute('PRAGMA archive_rw.journal_mode=DELETE')
+        for table in TABLES:
+            where = f'created_at >= ? AND created_at < ?{KEEP_LIVE.get(table, "")}'
+            column_list = ', '.join(_ensure_table(conn, 'archive_rw', table))
+            conn.execute(f'INSERT OR IGNORE INTO archive_rw.{table} ({column_list}) '
+                         f'SELECT {column_list} FROM main.{table} WHERE {where}', (start, end))
+            conn.commit()
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                if table == 'donations':
+                    aggregates.retain_donation_totals(conn.cursor(), ' AND ' + where, [start, end])
+                moved[table] = conn.execute(f'DELETE FROM main.{table} WHERE {where}', (start, end)).rowcount
+                conn.commit()
+            except BaseException:
+                conn.rollback()
+                raise
+    finally:
+        if conn.in_transaction:
+            conn.rollback()
+        conn.execute('DETACH DATABASE archive_rw')
+    conn.execute('''
+        INSERT INTO archives (month, path, reports, donations, contact_messages) VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT (month) DO UPDATE SET
+            reports = reports + excluded.reports,
+            donations = donations + excluded.donations,
+            contact_messages = contact_messages + excluded.contact_messages,
+            archived_at = CURRENT_TIMESTAMP
+    ''', (month, path, moved['reports'], moved['donations'], moved['contact_messages']))
+    conn.commit()
+    return moved
+
+
+def archive_old_rows(conn, days: int = AFTER_DAYS, directory: str = ARCHIVE_DIR, now: datetime = None) -> dict:
+    """Archive every whole month older than ``days``; returns {month: rows moved per table}."""
+    cutoff = ((now or datetime.utcnow()) - timedelta(days=days)).replace(day=1).strftime('%Y-%m-%d 00:00:00')
+    months = set()
+    for table in TABLES:
+        months.update(row[0] for row in conn.execute(
+            f"SELECT DISTINCT strftime('%Y-%m', created_at) FROM {table} "
+            f"WHERE created_at < ?{KEEP_LIVE.get(table, '')}", (cutoff,)) if row[0])
+    return {month: archive_month(conn, month, directory) for month in sorted(months)}
+
+
+def archived_months(conn, start: str, end: str = None) -> list:
+    """(month, path) of archives overlapping [start, end), oldest first."""
+    if not start:
+        return []
+    params = [start[:7]]
+    sql = 'SELECT month, path FROM archives WHERE month >= ?'
+    if end:
+        sql += " AND month || '-01 00:00:00' < ?"
+        params.append(end)
+    return conn.execute(sql + ' ORDER BY month', params).fetchall()
+
+
+def months_for(conn, start: str, end: str = None) -> list:
+    """Archive files a [start, end) range needs; raises ArchiveRangeError past the ATTACH limit."""
+    months = [(month, path) for month, path in archived_months(conn, start, end)
+              if _MONTH.match(month) and os.path.exists(path)]
+    limit = conn.getlimit(sqlite3.SQLITE_LIMIT_ATTACHED) if hasattr(conn, 'getlimit') else DEFAULT_ATTACH_LIMIT
+    if len(months) > limit:
+        raise ArchiveRangeError(f'Time range spans {len(months)} archived months; '
+                                f'query at most {limit} at a time')
+    return months
+
+
+@contextmanager
+def attached(conn, start: str, end: str = None):
+    """Attach the archives a [start, end) range reaches into, read-only; yields their schema names.
+
+    Callers must close their cursors over the archives before leaving the
+    block. If one is still open, DETACH fails with "database is locked", and
+    the connection is marked broken so the pool closes it instead of handing
+    it out with the archive still attached.
+    """
+    months = months_for(conn, start, end)
+    schemas = []
+    try:
+        for month, path in months:
+            schema = 'archive_' + month.replace('-', '_')
+            conn.execute('ATTACH DATABASE ? AS ' + schema, (Path(path).absolute().as_uri() + '?mode=ro',))
+            schemas.append(schema)
+        yield schemas
+    finally:
+        for schema in schemas:
+            try:
+                conn.execute('DETACH DATABASE ' + schema)
+            except sqlite3.OperationalError:
+                logger.warning('could not detach %s; discarding the connection', schema)
+                conn.broken = True
+
+
+def union_source(conn, table: str, columns, schemas) -> str:
+    """FROM-clause source covering the live table plus attached archives.
+
+    Returns the bare table name when no archive is attached, so callers can
+    always write ``FROM {source} alias``.
+    """
+    if not schemas:
+        return table
+    selects = [f"SELECT {', '.join(columns)} FROM main.{table}"]
+    for schema in schemas:
+        present = {name for name, _, _ in _columns(conn, schema, table)}
+        selects.append('SELECT ' + ', '.join(c if c in present else f'NULL AS {c}' for c in columns)
+                       + f' FROM {schema}.{table}')
+    return '(' + ' UNION ALL '.join(selects) + ')'
+
+
+def credit_archived_totals(conn) -> int:
+    """Add archived donations back into donation_totals after a rebuild; returns months read."""
+    months = conn.execute('SELECT month FROM archives WHERE donations > 0 ORDER BY month').fetchall()
+    for (month,) in months:
+        with attached(conn, *_month_bounds(month)) as schemas:
+            for schema in schemas:
+                aggregates.retain_donation_totals(conn.cursor(), source=f'{schema}.donations')
+            conn.commit()
+    return len(months)
@@ -0,0 +1,457 @@
+"""ASGI entry point for production serving: ``uvicorn asgi:app``.
+
+The routes that spend their time waiting are served natively on the event
+loop. These are the live report feed, checkout session creation, /success
+and the donation read APIs. An open SSE client or a donor waiting on
+Stripe then costs a coroutine rather than a thread, so one worker can hold
+thousands of them. Stripe is awaited over httpx (payments.*_async), and the
+donation reads go through a small aiosqlite pool of ASGI_DB_POOL_SIZE
+connections.
+
+Native views still run inside a regular Flask request context. The
+session, url_for, flash, templates, the rate limiter, metrics and the
+response cache therefore behave exactly as under the WSGI server. Opening
+the session and the before/after-request hooks read and write SQLite
+files, so they run on the executor rather than the event loop.
+
+/api/reports is deliberately not among them. Its time goes into short,
+indexed SQLite reads (FTS, R*Tree, keyset pages) and response-cache hits,
+not into waiting, and it may ATTACH archives through the sqlite3 pool. On
+the loop it would still need a thread per query, so it stays a plain WSGI
+route.
+
+Every other route is handed to the Flask app. The whole request body is
+read on the event loop before a thread is taken, so a slow report upload
+only holds a thread while Flask processes it. Those calls run on a pool of
+ASGI_THREADS threads.
+
+Lifespan startup does what ``python app.py`` does before serving: apply
+migrations, replay the write-behind journal and start the Stripe event
+worker. Shutdown commits queued submissions and stops both workers.
+"""
+import asyncio
+import io
+import os
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from tempfile import SpooledTemporaryFile
+from urllib.parse import parse_qsl
+
+import aiosqlite
+from asgiref.sync import AsyncToSync, sync_to_async
+from asgiref.wsgi import WsgiToAsgiInstance
+from flask import flash, jsonify, redirect, request, session, url_for
+from flask.signals import request_started
+
+import aggregates
+import db
+import events
+import payments
+import profiler
+from cache import response_cache
+from pagination import CursorError, keyset_clause, page_links, page_size
+import app as resqnet
+
+THREADS = int(os.getenv('ASGI_THREADS', '32'))
+DB_POOL_SIZE = int(os.getenv('ASGI_DB_POOL_SIZE', '4'))
+MAX_BODY_BYTES = 1024 * 1024     # natively served POSTs take small JSON bodies
+
+# The event loop's default executor: runs the Flask (WSGI) side, and the session,
+# hook and store calls of native views, which all touch SQLite files
+executor = ThreadPoolExecutor(THREADS, thread_name_prefix='resqnet-wsgi')
+
+
+class AsyncConnectionPool:
+    """aiosqlite connections with the same pragmas as db.ConnectionPool.
+
+    Each aiosqlite connection owns one thread, so the pool bounds threads
+    too; waiting for a free connection is a coroutine, not a blocked thread.
+    """
+
+    def __init__(self, size: int = DB_POOL_SIZE):
+        self.size = size
+        self._idle = []
+        self._available = None
+
+    async def _connect(self):
+        conn = await aiosqlite.connect(db.DATABASE, timeout=db.BUSY_TIMEOUT_MS / 1000, uri=True,
+                                       cached_statements=db.STATEMENT_CACHE)
+        for pragma in ('journal_mode=WAL', 'synchronous=NORMAL', f'cache_size=-{db.CACHE_SIZE_KIB}',
+                       f'mmap_size={db.MMAP_SIZE}', 'temp_store=MEMORY', f'busy_timeout={db.BUSY_TIMEOUT_MS}'):
+            await conn.execute(f'PRAGMA {pragma}')
+        return conn
+
+    @asynccontextmanager
+    async def connection(self):
+        if self._available is None:
+            self._available = asyncio.Semaphore(self.size)
+        async with self._available:
+            conn = self._idle.pop() if self._idle else await self._connect()
+            try:
+                yield conn
+            except BaseException:
+                await conn.close()
+                raise
+            self._idle.append(conn)
+
+    async def close_all(self) -> None:
+        while self._idle:
+            await self._idle.pop().close()
+
+
+pool = AsyncConnectionPool()
+
+
+async def api_reports_stream():
+    """Server-Sent Events feed of new and status-changed reports"""
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id', '')
+    disaster_type = request.args.get('disaster_type') or None
+    loop = asyncio.get_running_loop()
+    wake = asyncio.Event()
+
+    def notify():
+        try:
+            loop.call_soon_threadsafe(wake.set)
+        except RuntimeError:
+            pass    # loop already closed at shutdown
+
+    try:
+        sub, backlog = events.broker.subscribe(last_event_id, topic=disaster_type, notify=notify)
+    except events.TooManySubscribers:
+        return jsonify({'error': 'Live feed is at capacity, please poll /api/reports'}), 503, {'Retry-After': '30'}
+    response = resqnet.app.response_class(mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no',
+    })
+    response.response = events.broker.stream_async(sub, backlog, wake)
+    return response
+
+
+async def create_checkout_session():
+    """Create Stripe Checkout Session from donation form."""
+    try:
+        checkout = resqnet.checkout_params(request.get_json(force=True, silent=False) or {})
+        if checkout is None:
+            return jsonify({'error': 'Invalid donation data'}), 400
+
+        if not resqnet.STRIPE_SECRET_KEY:
+            return jsonify({'error': 'Stripe is not configured on the server'}), 500
+
+        params, draft = checkout
+        try:
+            session_obj = await payments.create_checkout_session_async(**params)
+        except payments.StripeUnavailable as e:
+            return jsonify({'error': str(e)}), 503, {'Retry-After': str(int(payments.BREAKER_RESET))}
+
+        session['last_checkout'] = dict(draft, payment_reference=session_obj.id)
+        return jsonify({'id': session_obj.id, 'url': session_obj.url})
+    except Exception as e:
+        return jsonify({'error': f'Checkout error: {str(e)}'}), 500
+
+
+async def success():
+    """Payment success page; the donation is recorded from the webhook (or here as a fallback)."""
+    # Rendering resolves the locale, which can read the users table
+    page = await asyncio.to_thread(lambda: resqnet.success_redirect() or resqnet.webhook_success_page())
+    if page is not None:
+        return page
+    try:
+        session_id = request.args['session_id']
+        checkout_session = await payments.retrieve_checkout_session_async(session_id)
+
+        def record_and_render():
+            resqnet.record_succeeded(session_id, checkout_session.get('metadata', {}))
+            return resqnet.verified_success_page(checkout_session)
+        return await asyncio.to_thread(record_and_render)
+    except Exception as e:
+        flash(f'Unable to verify payment: {str(e)}', 'error')
+        return redirect(url_for('donation'))
+
+
+@response_cache.cached_async('donations')
+async def get_donations():
+    """Retrieve donations, newest first, one keyset page at a time"""
+    try:
+        where_sql, params, _ = resqnet.donation_filters(request.args)
+        limit = page_size(request.args.get('limit'))
+        seek_sql, seek_params, order_sql, reverse = keyset_clause(request.args)
+    except CursorError as e:
+        return jsonify({'error': str(e)}), 400
+
+    try:
+        async with pool.connection() as conn:
+            async with conn.execute(
+                f"SELECT {', '.join(resqnet.DONATION_COLUMNS)} FROM donations WHERE 1=1"
+                + where_sql + seek_sql + order_sql + ' LIMIT ?',
+                params + seek_params + [limit + 1]
+            ) as cursor:
+                rows = await cursor.fetchall()
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        if reverse:
+            rows.reverse()
+        donations = [dict(zip(resqnet.DONATION_COLUMNS, row)) for row in rows]
+        next_cursor, prev_cursor = page_links(donations, has_more, request.args)
+        return jsonify({
+            'success': True,
+            'donations': donations,
+            'count': len(donations),
+            'next_cursor': next_cursor,
+            'prev_cursor': prev_cursor
+        }), 200
+    except Exception as e:
+        return jsonify({'error': f'Server error: {str(e)}'}), 500
+
+
+@response_cache.cached_async('donations')
+async def donations_summary():
+    """Donation totals, counts and averages from the incrementally maintained aggregate table"""
+    try:
+        where_sql, params = resqnet.summary_filters(request.args)
+    except CursorError as e:
+        return jsonify({'error': str(e)}), 400
+
+    summary = {}
+    async with pool.connection() as conn:
+        for name, keys, sql, sql_params in aggregates.summary_queries(where_sql, params):
+            async with conn.execute(sql, sql_params) as cursor:
+                summary[name] = aggregates.summary_rows(await cursor.fetchall(), keys)
+    return jsonify(dict(success=True, **summary)), 200
+
+
+async def _needs_wsgi(endpoint: str, args) -> bool:
+    """True when a native route must fall back to Flask for this request."""
+    if endpoint != 'get_donations':
+        return False
+    if args.get('format', 'json') != 'json':
+        # Streamed exports iterate a sqlite3 cursor
+        return True
+    start = args.get('from')
+    if not start:
+        return False
+    # Ranges reaching into archived months ATTACH the archive files (archive.py)
+    async with pool.connection() as conn:
+        async with conn.execute('SELECT 1 FROM archives WHERE month >= ? LIMIT 1', (start[:7],)) as cursor:
+            return await cursor.fetchone() is not None
+
+
+# path -> (endpoint, method, view); endpoints match app.py so budgets and metrics line up
+NATIVE_ROUTES = {
+    '/api/reports/stream': ('api_reports_stream', 'GET', api_reports_stream),
+    '/create-checkout-session': ('create_checkout_session', 'POST', create_checkout_session),
+    '/success': ('success', 'GET', success),
+    '/api/get-donations': ('get_donations', 'GET', get_donations),
+    '/api/donations/summary': ('donations_summary', 'GET', donations_summary),
+}
+
+
+def _build_environ(scope, body) -> dict:
+    builder = WsgiToAsgiInstance(None)
+    builder.scope = scope
+    return builder.build_environ(scope, body)
+
+
+class _Wsgi:
+    """Serves a request with the Flask app on the loop's default executor.
+
+    asgiref's WsgiToAsgi runs every WSGI call on one shared thread, so the
+    fallback drives the app itself through sync_to_async(thread_sensitive=False),
+    which uses the executor installed by ResQNetASGI.
+    """
+
+    def __init__(self, wsgi_application):
+        self.wsgi_application = wsgi_application
+
+    async def __call__(self, scope, receive, send):
+        with SpooledTemporaryFile(max_size=65536) as body:
+            while True:
+                message = await receive()
+                if message['type'] == 'http.disconnect':
+                    return
+                body.write(message.get('body', b''))
+                if not message.get('more_body'):
+                    break
+            body.seek(0)
+            await sync_to_async(self._run, thread_sensitive=False)(scope, body, AsyncToSync(send))
+
+    def _run(self, scope, body, sync_send) -> None:
+        start = {}
+
+        def start_response(status, headers, exc_info=None):
+            if exc_info and start.get('sent'):
+                raise exc_info[1].with_traceback(exc_info[2])
+            start['message'] = {
+                'type': 'http.response.start',
+                'status': int(status.split(' ', 1)[0]),
+                'headers': [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers],
+            }
+
+        try:
+            environ = _build_environ(scope, body)
+        except ValueError:
+            start_response('400 Bad Request', [('Content-Type', 'text/plain')])
+            sync_send(start['message'])
+            sync_send({'type': 'http.response.body', 'body': b'Bad Request'})
+            return
+        output = self.wsgi_application(environ, start_response)
+        try:
+            for chunk in output:
+                if not start.get('sent'):
+                    start['sent'] = True
+                    sync_send(start['message'])
+                if chunk:
+                    sync_send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+            if not start.get('sent'):
+                sync_send(start['message'])
+            sync_send({'type': 'http.response.body'})
+        finally:
+            # Lets streamed responses (exports) run their teardown
+            if hasattr(output, 'close'):
+                output.close()
+
+
+async def _read_body(receive, limit: int) -> bytes:
+    body = b''
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            return None
+        body += message.get('body', b'')
+        if len(body) > limit:
+            return None
+        if not message.get('more_body'):
+            return body
+
+
+async def _watch_disconnect(receive) -> None:
+    while (await receive())['type'] != 'http.disconnect':
+        pass
+
+
+async def _send_response(response, send, receive) -> None:
+    await send({
+        'type': 'http.response.start',
+        'status': response.status_code,
+        'headers': [(name.lower().encode('latin-1'), value.encode('latin-1'))
+                    for name, value in response.headers.items()],
+    })
+    body = response.response
+    if not hasattr(body, '__aiter__'):
+        await send({'type': 'http.response.body', 'body': response.get_data()})
+        return
+
+    async def pump():
+        async for chunk in body:
+            await send({'type': 'http.response.body', 'body': chunk.encode(), 'more_body': True})
+        await send({'type': 'http.response.body'})
+
+    # Stop streaming as soon as the client goes away rather than at the next heartbeat
+    streaming = asyncio.ensure_future(pump())
+    watching = asyncio.ensure_future(_watch_disconnect(receive))
+    try:
+        await asyncio.wait((streaming, watching), return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        for task in (streaming, watching):
+            task.cancel()
+        await asyncio.gather(streaming, watching, return_exceptions=True)
+        await body.aclose()
+    if streaming.done() and not streaming.cancelled() and streaming.exception() is not None:
+        raise streaming.exception()
+
+
+class ResQNetASGI:
+    def __init__(self, flask_app):
+        self.flask_app = flask_app
+        self.wsgi = _Wsgi(flask_app)
+        self._loop = None
+
+    async def __call__(self, scope, receive, send):
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # sync_to_async(thread_sensitive=False) and asyncio.to_thread use the default executor
+            loop.set_default_executor(executor)
+            self._loop = loop
+        if scope['type'] == 'lifespan':
+            return await self._lifespan(receive, send)
+        route = NATIVE_ROUTES.get(scope['path']) if scope['type'] == 'http' else None
+        if route is None or scope['method'] != route[1]:
+            return await self.wsgi(scope, receive, send)
+        return await self._native(scope, receive, send, *route)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                # Migrations, write-behind replay and the Stripe event worker, as python app.py does
+                try:
+                    await asyncio.to_thread(resqnet.start_services)
+                except Exception as e:
+                    await send({'type': 'lifespan.startup.failed', 'message': repr(e)})
+                    return
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await asyncio.to_thread(resqnet.stop_services)
+                await pool.close_all()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def _native(self, scope, receive, send, endpoint, method, view):
+        app = self.flask_app
+        body = await _read_body(receive, MAX_BODY_BYTES) if method == 'POST' else b''
+        if body is None:
+            await send({'type': 'http.response.start', 'status': 413, 'headers': []})
+            await send({'type': 'http.response.body'})
+            return
+        environ = _build_environ(scope, io.BytesIO(body))
+        if await _needs_wsgi(endpoint, dict(parse_qsl(environ['QUERY_STRING']))):
+            return await self.wsgi(scope, _replay(body, receive), send)
+        ctx = app.request_context(environ)
+        # The session store is a SQLite file; with the session already open, push() does no I/O
+        interface = app.session_interface
+        ctx.session = await asyncio.to_thread(interface.open_session, app, ctx.request)
+        if ctx.session is None:
+            ctx.session = interface.make_null_session(app)
+        ctx.push()
+
+        error = None
+        try:
+            # Same order as Flask.full_dispatch_request, with the view awaited. The
+            # before/after hooks (rate limiter, session save) run on the executor.
+            try:
+                rv = await asyncio.to_thread(_preprocess, app)
+                if rv is None:
+                    rv = await view()
+            except Exception as e:
+                rv = app.handle_user_exception(e)
+            response = await asyncio.to_thread(app.finalize_request, rv)
+        except Exception as e:
+            error = e
+            response = app.handle_exception(e)
+        try:
+            await _send_response(response, send, receive)
+        finally:
+            ctx.pop(error)
+
+
+def _preprocess(app):
+    request_started.send(app, _async_wrapper=app.ensure_sync)
+    try:
+        return app.preprocess_request()
+    finally:
+        # The view runs on the loop; don't charge this executor thread's next job to the request
+        profiler.release_thread()
+
+
+def _replay(body: bytes, receive):
+    sent = False
+
+    async def replayed():
+        nonlocal sent
+        if sent:
+            return await receive()
+        sent = True
+        return {'type': 'http.request', 'body': body, 'more_body': False}
+    return replayed
+
+
+app = ResQNetASGI(resqnet.app)
@@ -0,0 +1,135 @@
+"""Cache-friendly serving of static assets and uploaded files.
+
+Static assets: ``flask build-assets`` copies every file under static/ to
+static/dist/ with a content hash in its name (styles.css -> styles.<hash>.css)
+and writes pre-compressed .gz (and .br when the brotli module is installed)
+variants next to it, plus a manifest. Templates link assets through
+asset_url(). Fingerprinted URLs never change content, so they are served
+with a year-long immutable Cache-Control, and the .br/.gz variant is chosen
+from Accept-Encoding. Without a manifest, asset_url() falls back to the
+plain /static URL.
+
+Files: send_cached() wraps send_from_directory (strong ETags, HTTP Range
+requests) and optionally hands the bytes to a front proxy. FILE_OFFLOAD set
+to 'x-sendfile' uses Flask's X-Sendfile support (Apache/lighttpd). Set to
+'x-accel', it emits an nginx X-Accel-Redirect to X_ACCEL_PREFIX + the
+file's path relative to the app root.
+"""
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import shutil
+
+from flask import current_app, request, send_from_directory, url_for
+from werkzeug.exceptions import NotFound
+from werkzeug.security import safe_join
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - gzip variants are still produced
+    brotli = None
+
+DIST_DIR = 'dist'
+MANIFEST = 'manifest.json'
+IMMUTABLE = 'public, max-age=31536000, immutable'
+COMPRESSIBLE = {'.css', '.js', '.svg', '.json', '.txt', '.html', '.map'}
+# Preferred order when the client accepts several encodings
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+
+def build_assets(static_folder: str) -> dict:
+    """Fingerprint and pre-compress every static file; returns the manifest."""
+    dist = os.path.join(static_folder, DIST_DIR)
+    shutil.rmtree(dist, ignore_errors=True)
+    os.makedirs(dist)
+    manifest = {}
+    for root, dirs, files in os.walk(static_folder):
+        if os.path.abspath(root) == os.path.abspath(static_folder):
+            dirs[:] = [d for d in dirs if d != DIST_DIR]
+        for name in files:
+            source = os.path.join(root, name)
+            rel = os.path.relpath(source, static_folder).replace(os.sep, '/')
+            with open(source, 'rb') as f:
+                data = f.read()
+            stem, ext = os.path.splitext(rel)
+            hashed = f'{stem}.{hashlib.sha256(data).hexdigest()[:12]}{ext}'
+            target = os.path.join(dist, hashed)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            with open(target, 'wb') as f:
+                f.write(data)
+            if ext.lower() in COMPRESSIBLE:
+                with open(target + '.gz', 'wb') as f:
+                    f.write(gzip.compress(data, compresslevel=9, mtime=0))
+                if brotli is not None:
+                    with open(target + '.br', 'wb') as f:
+                        f.write(brotli.compress(data, quality=11))
+            manifest[rel] = hashed
+    with open(os.path.join(dist, MANIFEST), 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    return manifest
+
+
+def send_cached(directory: str, filename: str, immutable: bool = False, **kwargs):
+    """send_from_directory plus immutable caching and optional proxy offload."""
+    if current_app.config.get('FILE_OFFLOAD') == 'x-accel':
+        response = _x_accel_response(directory, filename, kwargs.get('mimetype'))
+    else:
+        response = send_from_directory(directory, filename, **kwargs)
+    if immutable:
+        response.headers['Cache-Control'] = IMMUTABLE
+    return response
+
+
+def _x_accel_response(directory: str, filename: str, mimetype=None):
+    base = os.path.join(current_app.root_path, directory)
+    path = safe_join(base, filename)
+    if path is None or not os.path.isfile(path):
+        raise NotFound()
+    rel = os.path.relpath(path, current_app.root_path).replace(os.sep, '/')
+    prefix = current_app.config.get('X_ACCEL_PREFIX', '/_protected').rstrip('/')
+    response = current_app.response_class()
+    response.headers['X-Accel-Redirect'] = f'{prefix}/{rel}'
+    response.headers['Content-Type'] = mimetype or mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    return response
+
+
+class Assets:
+    def __init__(self, app=None):
+        self.manifest = {}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.dist_folder = os.path.join(app.static_folder, DIST_DIR)
+        self.reload()
+        app.add_url_rule('/assets/<path:filename>', 'assets', self.serve)
+        app.context_processor(lambda: {'asset_url': self.url})
+
+    def reload(self):
+        try:
+            with open(os.path.join(self.dist_folder, MANIFEST)) as f:
+                self.manifest = json.load(f)
+        except (OSError, ValueError):
+            self.manifest = {}
+
+    def url(self, filename: str) -> str:
+        hashed = self.manifest.get(filename)
+        if hashed:
+            return url_for('assets', filename=hashed)
+        return url_for('static', filename=filename)
+
+    def serve(self, filename: str):
+        mimetype = mimetypes.guess_type(filename)[0]
+        for encoding, suffix in ENCODINGS:
+            variant = safe_join(self.dist_folder, filename + suffix)
+            if request.accept_encodings[encoding] and variant and os.path.isfile(variant):
+                response = send_cached(self.dist_folder, filename + suffix, immutable=True,
+                                       mimetype=mimetype, etag=f'{filename}-{encoding}')
+                response.headers['Content-Encoding'] = encoding
+                break
+        else:
+            response = send_cached(self.dist_folder, filename, immutable=True, mimetype=mimetype)
+        response.vary.add('Accept-Encoding')
+        return response
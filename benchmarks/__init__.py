@@ -0,0 +1,70 @@
+"""Reproducible benchmarks for the hot endpoints.
+
+Run from the repository root:
+
+    python -m benchmarks.datagen --size 100k --db bench-100k.db
+    python -m benchmarks.micro --db bench-100k.db --out micro.json
+    python -m benchmarks.server --db bench-100k.db --port 5055 &
+    python -m benchmarks.load --url http://127.0.0.1:5055 --out load.json
+
+Every command prints and optionally writes JSON, so two runs (e.g. before and
+after a change) can be diffed with ``python -m benchmarks.compare a.json b.json``.
+"""
+import json
+import math
+import platform
+import sqlite3
+import sys
+import time
+
+BENCH_EMAIL = 'bench@example.com'
+BENCH_PASSWORD = 'benchmark-password'
+
+
+def percentile(sorted_samples, pct: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_samples:
+        return 0.0
+    rank = max(1, math.ceil(pct / 100 * len(sorted_samples)))
+    return sorted_samples[rank - 1]
+
+
+def summarize(samples, elapsed: float = None) -> dict:
+    """Latency summary in milliseconds for a list of durations in seconds."""
+    ordered = sorted(samples)
+    summary = {
+        'count': len(ordered),
+        'mean_ms': round(sum(ordered) / len(ordered) * 1000, 3) if ordered else 0.0,
+        'p50_ms': round(percentile(ordered, 50) * 1000, 3),
+        'p90_ms': round(percentile(ordered, 90) * 1000, 3),
+        'p99_ms': round(percentile(ordered, 99) * 1000, 3),
+        'max_ms': round(ordered[-1] * 1000, 3) if ordered else 0.0,
+    }
+    if elapsed:
+        summary['throughput_rps'] = round(len(ordered) / elapsed, 1)
+    return summary
+
+
+def environment(db_path: str = None) -> dict:
+    env = {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': sys.version.split()[0],
+        'platform': platform.platform(),
+        'sqlite': sqlite3.sqlite_version,
+    }
+    if db_path:
+        conn = sqlite3.connect(db_path)
+        try:
+            env['rows'] = {table: conn.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+                           for table in ('users', 'reports', 'donations')}
+        finally:
+            conn.close()
+    return env
+
+
+def emit(result: dict, out_path: str = None) -> None:
+    text = json.dumps(result, indent=2, sort_keys=True)
+    print(text)
+    if out_path:
+        with open(out_path, 'w') as f:
+            f.write(text + '\n')
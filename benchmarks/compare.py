@@ -0,0 +1,54 @@
+"""Compare two benchmark JSON results.
+
+    python -m benchmarks.compare before.json after.json
+
+Prints p50/p99 latency and throughput per case with the relative change.
+Works for both micro and load results.
+"""
+import argparse
+import json
+
+METRICS = ('p50_ms', 'p99_ms', 'throughput_rps')
+
+
+def _cases(result: dict) -> dict:
+    cases = dict(result.get('cases') or result.get('operations') or {})
+    if 'overall' in result:
+        cases['overall'] = result['overall']
+    return cases
+
+
+def _change(before, after) -> str:
+    if not before:
+        return 'n/a'
+    return f'{(after - before) / before * 100:+.1f}%'
+
+
+def compare(before: dict, after: dict):
+    rows = []
+    old, new = _cases(before), _cases(after)
+    for name in sorted(set(old) & set(new)):
+        for metric in METRICS:
+            if metric in old[name] and metric in new[name]:
+                rows.append((name, metric, old[name][metric], new[name][metric],
+                             _change(old[name][metric], new[name][metric])))
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('before')
+    parser.add_argument('after')
+    args = parser.parse_args(argv)
+    with open(args.before) as f:
+        before = json.load(f)
+    with open(args.after) as f:
+        after = json.load(f)
+    width = max([len(row[0]) for row in compare(before, after)] + [4])
+    print(f'{"case":<{width}}  {"metric":<14} {"before":>10} {"after":>10} {"change":>8}')
+    for name, metric, old, new, change in compare(before, after):
+        print(f'{name:<{width}}  {metric:<14} {old:>10} {new:>10} {change:>8}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,154 @@
+"""Seeded synthetic data for benchmarks.
+
+    python -m benchmarks.datagen --size 100k --db bench-100k.db [--seed 1]
+
+Creates a fresh database with the application's schema (via init_db) and
+fills it with users, reports and donations. The same seed always produces
+the same rows. Sizes are the number of reports and of donations; there is one
+user per ten reports. Near-duplicate clusters are only computed with
+--clusters, because that is a per-row pass and slow at 1M rows.
+"""
+import argparse
+import os
+import random
+import time
+from datetime import datetime, timedelta
+
+from werkzeug.security import generate_password_hash
+
+import app
+import db
+import dedup
+from benchmarks import BENCH_EMAIL, BENCH_PASSWORD, emit, environment
+
+SIZES = {'10k': 10_000, '100k': 100_000, '1m': 1_000_000}
+BATCH = 10_000
+DAYS = 90
+
+CITIES = [
+    ('Patna', 25.594, 85.137), ('Mumbai', 19.076, 72.877), ('Chennai', 13.083, 80.270),
+    ('Guwahati', 26.144, 91.736), ('Kolkata', 22.572, 88.363), ('Delhi', 28.704, 77.102),
+    ('Bhubaneswar', 20.296, 85.824), ('Kochi', 9.931, 76.267), ('Shimla', 31.104, 77.173),
+    ('Ahmedabad', 23.022, 72.571),
+]
+AREAS = ['Station Road', 'Old Town', 'Market Area', 'River Bank', 'Sector 12', 'Civil Lines',
+         'Bus Stand', 'Hospital Road', 'Industrial Area', 'University Campus']
+DISASTER_TYPES = ['Flood', 'Fire', 'Earthquake', 'Cyclone', 'Landslide', 'Medical', 'Other']
+DETAILS = {
+    'Flood': ['water level rising quickly', 'houses submerged', 'road cut off by water', 'people stranded on rooftops'],
+    'Fire': ['thick smoke from building', 'fire spreading to nearby shops', 'people trapped on upper floor'],
+    'Earthquake': ['cracks in walls', 'building partially collapsed', 'people injured by debris'],
+    'Cyclone': ['trees uprooted', 'power lines down', 'roofs blown away'],
+    'Landslide': ['road blocked by debris', 'vehicles buried', 'houses damaged on slope'],
+    'Medical': ['several people need urgent care', 'ambulance required', 'shortage of medicines'],
+    'Other': ['need assistance', 'situation unclear, please send help'],
+}
+# Weighted draw over triage.STATUSES; anything else would fail the triage transitions
+REPORT_STATUSES = ['pending', 'pending', 'pending', 'dispatched', 'resolved', 'resolved', 'rejected']
+CURRENCIES = ['USD', 'INR', 'EUR', 'GBP']
+STATUSES = ['Succeeded', 'Succeeded', 'Succeeded', 'Pending', 'Cancelled', None]
+PURPOSES = ['Flood relief', 'Medical supplies', 'Food and water', 'Shelter', 'General fund', '']
+PAY_VIA = ['Card', 'UPI', 'NetBanking', 'Other']
+
+
+def _timestamp(rng, now):
+    return (now - timedelta(seconds=rng.randrange(DAYS * 86400))).strftime('%Y-%m-%d %H:%M:%S')
+
+
+def _users(rng, count, password_hash):
+    yield ('Benchmark User', BENCH_EMAIL, password_hash, 'en')
+    for i in range(1, count):
+        yield (f'User {i}', f'user{i}@example.com', password_hash, rng.choice(['en', 'en', 'hi']))
+
+
+def _reports(rng, count, user_count, now):
+    for _ in range(count):
+        city, lat, lon = rng.choice(CITIES)
+        disaster_type = rng.choice(DISASTER_TYPES)
+        area = rng.choice(AREAS)
+        description = f'{rng.choice(DETAILS[disaster_type]).capitalize()} near {area}, {city}. ' \
+                      f'{rng.choice(DETAILS[disaster_type]).capitalize()}.'
+        geotagged = rng.random() < 0.6
+        yield (rng.randrange(1, user_count + 1), f'Reporter {rng.randrange(10_000)}', 'reporter@example.com',
+               f'{area}, {city}', disaster_type, description, None,
+               rng.choice(REPORT_STATUSES),
+               round(lat + rng.uniform(-0.2, 0.2), 6) if geotagged else None,
+               round(lon + rng.uniform(-0.2, 0.2), 6) if geotagged else None,
+               _timestamp(rng, now))
+
+
+def _donations(rng, count, now):
+    for i in range(count):
+        status = rng.choice(STATUSES)
+        yield (f'Donor {rng.randrange(50_000)}', f'donor{i}@example.com', round(rng.uniform(1, 5000), 2),
+               rng.choice(CURRENCIES), rng.choice(PURPOSES), rng.choice(PAY_VIA),
+               'stripe' if status else None, f'cs_bench_{i}' if status else None, status,
+               _timestamp(rng, now))
+
+
+def _insert(conn, sql, rows):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= BATCH:
+            conn.executemany(sql, batch)
+            conn.commit()
+            batch.clear()
+    if batch:
+        conn.executemany(sql, batch)
+        conn.commit()
+
+
+def generate(db_path: str, rows: int, seed: int = 1, clusters: bool = False) -> dict:
+    if os.path.exists(db_path):
+        raise SystemExit(f'{db_path} already exists; pick a new path so runs stay reproducible')
+    db.configure(db_path)
+    app.init_db()
+    rng = random.Random(seed)
+    # Fixed reference time so the same seed yields identical timestamps
+    now = datetime(2026, 1, 1)
+    user_count = max(1, rows // 10)
+    # One hash shared by every user: datagen should not spend minutes in scrypt
+    password_hash = generate_password_hash(BENCH_PASSWORD, method='pbkdf2:sha256:1000')
+
+    started = time.perf_counter()
+    with db.connection() as conn:
+        _insert(conn, 'INSERT INTO users (name, email, password_hash, preferred_language) VALUES (?, ?, ?, ?)',
+                _users(rng, user_count, password_hash))
+        _insert(conn, '''
+            INSERT INTO reports (user_id, name, email, location, disaster_type, description, image_path,
+                                 status, latitude, longitude, created_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', _reports(rng, rows, user_count, now))
+        _insert(conn, '''
+            INSERT INTO donations (donor_name, donor_email, amount, currency, purpose, pay_via,
+                                   payment_method, payment_reference, status, created_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', _donations(rng, rows, now))
+        if clusters:
+            dedup.rebuild_clusters(conn.cursor())
+        conn.execute('ANALYZE')
+    db.pool.close_all()
+    return {
+        'benchmark': 'datagen',
+        'db': db_path,
+        'seed': seed,
+        'seconds': round(time.perf_counter() - started, 2),
+        'environment': environment(db_path),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--size', default='10k', help='10k, 100k, 1m or an explicit row count')
+    parser.add_argument('--db', required=True, help='path of the database to create')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--clusters', action='store_true', help='also compute near-duplicate clusters')
+    parser.add_argument('--out', help='write the JSON result to this file')
+    args = parser.parse_args(argv)
+    rows = SIZES.get(args.size.lower()) or int(args.size)
+    emit(generate(args.db, rows, args.seed, args.clusters), args.out)
+
+
+if __name__ == '__main__':
+    main()
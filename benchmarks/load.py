@@ -0,0 +1,186 @@
+"""Concurrent load driver for mixed read/write traffic.
+
+    python -m benchmarks.load --url http://127.0.0.1:5055 [--threads 16] [--duration 30]
+                              [--mix feed=60,search=10,donations=10,report=10,donate=5,checkout=5]
+
+Start the target with ``python -m benchmarks.server`` (Stripe stubbed). Each
+worker thread logs in as the benchmark user and then picks operations at
+random according to the mix weights. The output is overall and
+per-operation throughput with p50/p99 latency, plus error counts. The
+operation sequence is seeded so runs are comparable.
+"""
+import argparse
+import http.cookiejar
+import json
+import random
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+
+from benchmarks import BENCH_EMAIL, BENCH_PASSWORD, emit, summarize
+
+DEFAULT_MIX = 'feed=60,search=10,donations=10,report=10,donate=5,checkout=5'
+SEARCH_TERMS = ['patna', 'flood', 'stranded', 'station', 'smoke', 'debris', 'mumbai', 'river']
+LOGIN_RETRY_SECONDS = 1.0
+TYPES = ['Flood', 'Fire', 'Earthquake', 'Cyclone', 'Landslide', 'Medical']
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+class Worker:
+    def __init__(self, base_url, seed):
+        self.base_url = base_url.rstrip('/')
+        self.rng = random.Random(seed)
+        jar = http.cookiejar.CookieJar()
+        self.opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(jar), _NoRedirect)
+
+    def request(self, path, data=None, json_body=None):
+        headers = {}
+        if json_body is not None:
+            data = json.dumps(json_body).encode()
+            headers['Content-Type'] = 'application/json'
+        elif data is not None:
+            data = urllib.parse.urlencode(data).encode()
+        req = urllib.request.Request(self.base_url + path, data=data, headers=headers)
+        try:
+            with self.opener.open(req, timeout=30) as response:
+                response.read()
+                return response.status
+        except urllib.error.HTTPError as e:
+            e.read()
+            return e.code
+
+    def login(self, attempts=10):
+        # Password hashing has admission control, so a burst of logins can be told to retry
+        for _ in range(attempts):
+            status = self.request('/login', data={'email': BENCH_EMAIL, 'password': BENCH_PASSWORD})
+            if status != 503:
+                return status
+            time.sleep(LOGIN_RETRY_SECONDS)
+        return status
+
+    # ---- operations ----
+
+    def feed(self):
+        params = {}
+        if self.rng.random() < 0.3:
+            params['disaster_type'] = self.rng.choice(TYPES)
+        return self.request('/api/reports?' + urllib.parse.urlencode(params))
+
+    def search(self):
+        return self.request('/api/reports?' + urllib.parse.urlencode({'q': self.rng.choice(SEARCH_TERMS)}))
+
+    def donations(self):
+        return self.request('/api/get-donations' if self.rng.random() < 0.7 else '/api/donations/summary')
+
+    def report(self):
+        n = self.rng.randrange(1000)
+        return self.request('/report', data={
+            'name': 'Load', 'email': 'load@example.com', 'location': f'Market Area, Patna {n % 40}',
+            'disaster_type': self.rng.choice(TYPES), 'description': f'Load test report {n}, water rising fast',
+        })
+
+    def donate(self):
+        return self.request('/api/donate', json_body={
+            'donor_name': 'Load', 'donor_email': 'load@example.com', 'amount': self.rng.randrange(1, 500),
+            'currency': 'INR', 'purpose': 'Flood relief', 'pay_via': 'UPI',
+        })
+
+    def checkout(self):
+        return self.request('/create-checkout-session', json_body={
+            'donor_name': 'Load', 'donor_email': 'load@example.com', 'amount': self.rng.randrange(1, 500),
+            'currency': 'INR', 'purpose': 'Flood relief', 'pay_via': 'Card',
+        })
+
+
+def parse_mix(value: str) -> dict:
+    mix = {}
+    for part in value.split(','):
+        name, _, weight = part.partition('=')
+        if not hasattr(Worker, name.strip()):
+            raise SystemExit(f'unknown operation {name!r} in --mix')
+        mix[name.strip()] = float(weight or 1)
+    return mix
+
+
+def run(url, threads=16, duration=30.0, mix=DEFAULT_MIX, seed=1) -> dict:
+    weights = parse_mix(mix)
+    names, cumulative = list(weights), []
+    total = 0.0
+    for name in names:
+        total += weights[name]
+        cumulative.append(total)
+
+    samples = {name: [] for name in names}
+    errors = {name: 0 for name in names}
+    lock = threading.Lock()
+    login_failures = []
+    window = []
+    # The clock starts once every worker has logged in
+    start_barrier = threading.Barrier(threads + 1, action=lambda: window.append(time.perf_counter()))
+
+    def work(index):
+        worker = Worker(url, seed * 1000 + index)
+        # A successful login redirects; a rejected one re-renders the form with 200
+        if worker.login() != 302:
+            login_failures.append(index)
+        start_barrier.wait()
+        local = {name: [] for name in names}
+        local_errors = {name: 0 for name in names}
+        stop_at = window[0] + duration
+        while time.perf_counter() < stop_at:
+            pick = worker.rng.random() * total
+            name = next(n for n, c in zip(names, cumulative) if pick < c)
+            begin = time.perf_counter()
+            try:
+                status = getattr(worker, name)()
+            except OSError:
+                status = 0
+            local[name].append(time.perf_counter() - begin)
+            if not 200 <= status < 400:
+                local_errors[name] += 1
+        with lock:
+            for name in names:
+                samples[name].extend(local[name])
+                errors[name] += local_errors[name]
+
+    pool = [threading.Thread(target=work, args=(i,), daemon=True) for i in range(threads)]
+    for thread in pool:
+        thread.start()
+    start_barrier.wait()
+    for thread in pool:
+        thread.join()
+    elapsed = time.perf_counter() - window[0]
+
+    everything = [s for name in names for s in samples[name]]
+    return {
+        'benchmark': 'load',
+        'url': url,
+        'threads': threads,
+        'duration_s': round(elapsed, 2),
+        'mix': weights,
+        'login_failures': len(login_failures),
+        'overall': dict(summarize(everything, elapsed), errors=sum(errors.values())),
+        'operations': {name: dict(summarize(samples[name], elapsed), errors=errors[name]) for name in names},
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--url', default='http://127.0.0.1:5055')
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--duration', type=float, default=30.0, help='seconds')
+    parser.add_argument('--mix', default=DEFAULT_MIX, help='comma-separated operation=weight pairs')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--out', help='write the JSON result to this file')
+    args = parser.parse_args(argv)
+    emit(run(args.url, args.threads, args.duration, args.mix, args.seed), args.out)
+
+
+if __name__ == '__main__':
+    main()
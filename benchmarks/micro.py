@@ -0,0 +1,115 @@
+"""Micro-benchmarks of each query path through Flask's test client.
+
+    python -m benchmarks.micro --db bench-100k.db [--iterations 200] [--only api_reports] [--out micro.json]
+
+Each case runs a fixed request repeatedly in-process. There is no network,
+so the numbers isolate routing, SQL and serialization. The response cache is
+invalidated before every request so SQL is actually exercised; pass --cached
+to measure cache hits instead. Write cases run last because they add rows.
+"""
+import argparse
+import time
+
+import app
+import db
+from benchmarks import BENCH_EMAIL, emit, environment, summarize
+from cache import response_cache
+
+READ_CASES = [
+    ('api_reports', '/api/reports'),
+    ('api_reports_type', '/api/reports?disaster_type=Flood'),
+    ('api_reports_location', '/api/reports?location=patna'),
+    ('api_reports_text', '/api/reports?q=stranded'),
+    ('api_reports_relevance', '/api/reports?q=building+collapsed&sort=relevance'),
+    ('api_reports_bbox', '/api/reports?bbox=85.0,25.4,85.3,25.8'),
+    ('api_reports_near', '/api/reports?near=19.076,72.877&radius_km=10'),
+    ('api_reports_clusters', '/api/reports?group=cluster'),
+    ('api_reports_page2', None),  # filled in with a real cursor at run time
+    ('get_donations', '/api/get-donations'),
+    ('get_donations_filtered', '/api/get-donations?status=Succeeded&currency=INR'),
+    ('donations_summary', '/api/donations/summary'),
+    ('donations_export_csv', '/api/get-donations?format=csv&from=2025-12-25'),
+    ('report_page', '/report'),
+]
+
+
+def _report_form(i):
+    return {
+        'name': 'Bench', 'email': 'bench@example.com', 'location': f'Station Road, Patna {i % 50}',
+        'disaster_type': 'Flood', 'description': f'Water level rising quickly near station road {i}',
+        'latitude': '25.6', 'longitude': '85.1',
+    }
+
+
+def _donation(i):
+    return {'donor_name': 'Bench', 'donor_email': 'bench@example.com', 'amount': 10 + i % 90,
+            'currency': 'INR', 'purpose': 'Flood relief', 'pay_via': 'UPI'}
+
+
+def _run(client, name, request, iterations, warmup, cached):
+    for i in range(warmup):
+        request(client, i).close()
+    samples = []
+    status = None
+    for i in range(iterations):
+        if not cached:
+            response_cache.invalidate('reports', 'donations')
+        start = time.perf_counter()
+        response = request(client, i)
+        response.get_data()
+        samples.append(time.perf_counter() - start)
+        status = response.status_code
+        response.close()
+    return dict(summarize(samples), status=status)
+
+
+def run(db_path, iterations=200, warmup=10, only=None, cached=False, writes=True) -> dict:
+    db.configure(db_path)
+    app.app.config['TESTING'] = True
+    app.rate_limiter.enabled = False
+    client = app.app.test_client()
+    with db.connection() as conn:
+        user_id = conn.execute('SELECT id FROM users WHERE email = ?', (BENCH_EMAIL,)).fetchone()[0]
+    with client.session_transaction() as sess:
+        sess['user_id'] = user_id
+        sess['language'] = 'en'
+
+    first_page = client.get('/api/reports').get_json()
+    cases = []
+    for name, url in READ_CASES:
+        if name == 'api_reports_page2':
+            url = f"/api/reports?after={first_page['next_cursor']}"
+        cases.append((name, lambda c, i, url=url: c.get(url)))
+    if writes:
+        cases.append(('post_report', lambda c, i: c.post('/report', data=_report_form(i))))
+        cases.append(('post_donation', lambda c, i: c.post('/api/donate', json=_donation(i))))
+
+    results = {}
+    for name, request in cases:
+        if only and not any(name.startswith(prefix) for prefix in only):
+            continue
+        results[name] = _run(client, name, request, iterations, warmup, cached)
+    return {
+        'benchmark': 'micro',
+        'iterations': iterations,
+        'cached': cached,
+        'cases': results,
+        'environment': environment(db_path),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--db', required=True, help='database created by benchmarks.datagen')
+    parser.add_argument('--iterations', type=int, default=200)
+    parser.add_argument('--warmup', type=int, default=10)
+    parser.add_argument('--only', action='append', help='run cases whose name starts with this (repeatable)')
+    parser.add_argument('--cached', action='store_true', help='leave the response cache warm')
+    parser.add_argument('--no-writes', dest='writes', action='store_false', help='skip the write cases')
+    parser.add_argument('--out', help='write the JSON result to this file')
+    args = parser.parse_args(argv)
+    emit(run(args.db, args.iterations, args.warmup, args.only, args.cached, args.writes), args.out)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,106 @@
+"""Run the app against a benchmark database with Stripe stubbed out.
+
+    python -m benchmarks.server --db bench-100k.db [--port 5055] [--asgi]
+
+Checkout sessions are answered locally, without touching the network, so
+load runs measure this app rather than Stripe. Uses Werkzeug's threaded
+server. For production-like numbers, point a real WSGI server at the
+factory instead, e.g. ``gunicorn "benchmarks.server:create_app('bench.db')"``.
+``--asgi`` serves asgi.py under uvicorn instead, for comparing the two modes.
+"""
+import argparse
+import asyncio
+import itertools
+import threading
+import time
+from types import SimpleNamespace
+
+import stripe
+
+import app
+import db
+
+_session_ids = itertools.count(1)
+_lock = threading.Lock()
+
+
+class _StubSession(dict):
+    """Enough of stripe.checkout.Session for create_checkout_session/success."""
+
+    def __getattr__(self, name):
+        try:
+            return self[name]
+        except KeyError:
+            raise AttributeError(name)
+
+
+def _new_session(params):
+    with _lock:
+        session_id = f'cs_bench_live_{next(_session_ids)}'
+    return _StubSession(id=session_id, url=f'https://checkout.invalid/{session_id}',
+                        metadata=params.get('metadata', {}), payment_intent=None)
+
+
+def _paid_session(session_id):
+    return _StubSession(id=session_id, metadata={'donor_name': 'Bench', 'donor_email': 'bench@example.com',
+                                                 'currency': 'INR', 'amount': '100', 'pay_via': 'Card'},
+                        payment_intent=None)
+
+
+def _create(**params):
+    time.sleep(_create.latency)
+    return _new_session(params)
+
+
+def _retrieve(session_id, **params):
+    time.sleep(_create.latency)
+    return _paid_session(session_id)
+
+
+async def _create_async(**params):
+    await asyncio.sleep(_create.latency)
+    return _new_session(params)
+
+
+async def _retrieve_async(session_id, **params):
+    await asyncio.sleep(_create.latency)
+    return _paid_session(session_id)
+
+
+def stub_stripe(latency_ms: float = 0.0) -> None:
+    _create.latency = latency_ms / 1000
+    app.STRIPE_SECRET_KEY = 'sk_test_benchmark_stub'
+    stripe.checkout.Session = SimpleNamespace(create=_create, retrieve=_retrieve,
+                                              create_async=_create_async, retrieve_async=_retrieve_async)
+
+
+def create_app(db_path: str = 'bench.db', stripe_latency_ms: float = 0.0):
+    db.configure(db_path, size=16)
+    app.init_db()
+    stub_stripe(stripe_latency_ms)
+    # Every load worker shares one account, so per-client budgets would cap throughput
+    app.rate_limiter.enabled = False
+    return app.app
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--db', required=True, help='database created by benchmarks.datagen')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=5055)
+    parser.add_argument('--stripe-latency-ms', type=float, default=0.0,
+                        help='simulated Stripe round-trip time')
+    parser.add_argument('--asgi', action='store_true', help='serve asgi.py under uvicorn')
+    args = parser.parse_args(argv)
+    flask_app = create_app(args.db, args.stripe_latency_ms)
+    if args.asgi:
+        import uvicorn
+
+        import asgi
+        uvicorn.run(asgi.app, host=args.host, port=args.port, log_level='warning')
+    else:
+        flask_app.run(host=args.host, port=args.port, threaded=True, debug=False, use_reloader=False)
+
+
+if __name__ == '__main__':
+    main()
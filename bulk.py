@@ -0,0 +1,221 @@
+"""Bulk incident exchange with partner agencies.
+
+Imports read an NDJSON or CSV request body as a stream. Each row is
+validated as it arrives, and valid rows are inserted in chunks of
+BULK_CHUNK_SIZE with one transaction per chunk. A 100k-row file therefore
+costs a few hundred commits rather than 100k, and memory stays flat whatever
+the file size. Invalid rows are skipped and reported by line number; they
+never abort the rest of the file, and neither does a row the database
+itself refuses (a constraint violation). Rows dated within the last
+DEDUP_WINDOW_HOURS are clustered with live reports as they are inserted.
+Older, historical rows are not; run ``flask rebuild-report-clusters`` after
+a large backfill if those should be grouped too. A created_at up to
+MAX_CLOCK_SKEW ahead of the server is clamped to now; one further in the
+future is rejected.
+
+Rows may carry an ``external_id`` (or ``id``, as written by the export). It
+becomes the row's submission_id, scoped to the importing user, so re-sending
+a file after a timeout only inserts what is missing. The export writes the
+same columns the import reads, so files round-trip between instances.
+
+The endpoint is for partner agencies only: BULK_PARTNER_USERS lists the
+account ids allowed to use it.
+"""
+import codecs
+import csv
+import io
+import json
+import os
+import sqlite3
+from datetime import datetime, timedelta, timezone
+
+import dedup
+import geo
+import triage
+
+# Account ids allowed to use /api/reports/bulk; empty disables the endpoint
+PARTNER_USERS = frozenset(int(user_id) for user_id in os.getenv('BULK_PARTNER_USERS', '').split(',')
+                          if user_id.strip())
+CHUNK_SIZE = int(os.getenv('BULK_CHUNK_SIZE', '1000'))
+MAX_REPORTED_ERRORS = 1000
+FIELD_LIMIT = 10_000    # characters per text field
+EXPORT_COLUMNS = ['id', 'name', 'email', 'location', 'disaster_type', 'description', 'image_path',
+                  'status', 'created_at', 'latitude', 'longitude', 'cluster_id']
+INSERT_SQL = '''
+    INSERT INTO reports (user_id, name, email, location, disaster_type, description,
+                         status, created_at, latitude, longitude, submission_id)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT (submission_id) WHERE submission_id IS NOT NULL DO NOTHING
+'''
+REQUIRED = ('location', 'disaster_type', 'description')
+MAX_CLOCK_SKEW = timedelta(minutes=5)
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+class RowError(ValueError):
+    """A single import row failed validation."""
+
+
+def is_partner(user_id) -> bool:
+    return user_id in PARTNER_USERS
+
+
+def _text(row: dict, field: str) -> str:
+    value = row.get(field)
+    value = '' if value is None else str(value).strip()
+    if len(value) > FIELD_LIMIT:
+        raise RowError(f'{field} is longer than {FIELD_LIMIT} characters')
+    return value
+
+
+def _timestamp(value: str, now: str) -> str:
+    if not value:
+        return now
+    try:
+        parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except ValueError:
+        raise RowError('created_at must be an ISO date/time')
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    if parsed > datetime.strptime(now, TIMESTAMP_FORMAT) + MAX_CLOCK_SKEW:
+        raise RowError('created_at is in the future')
+    return min(parsed.strftime(TIMESTAMP_FORMAT), now)
+
+
+def validate(row, user_id: int, now: str) -> tuple:
+    """Turn one decoded row into an INSERT parameter tuple, or raise RowError.
+
+    ``now`` is the import's start time as 'YYYY-MM-DD HH:MM:SS' (UTC).
+    """
+    if not isinstance(row, dict):
+        raise RowError('row must be an object')
+    values = {field: _text(row, field) for field in
+              ('name', 'email', 'location', 'disaster_type', 'description', 'status', 'created_at')}
+    missing = [field for field in REQUIRED if not values[field]]
+    if missing:
+        raise RowError(f"missing {', '.join(missing)}")
+    if values['status'] and values['status'] not in triage.STATUSES:
+        raise RowError(f"status must be one of {', '.join(triage.STATUSES)}")
+    try:
+        latitude, longitude = geo.parse_point(_text(row, 'latitude'), _text(row, 'longitude'))
+    except geo.GeoQueryError as e:
+        raise RowError(str(e))
+    external_id = _text(row, 'external_id') or _text(row, 'id')
+    submission_id = f'bulk:{user_id}:{external_id}' if external_id else None
+    created_at = _timestamp(values['created_at'], now)
+    return (user_id, values['name'], values['email'], values['location'], values['disaster_type'],
+            values['description'], values['status'] or 'pending', created_at, latitude, longitude, submission_id)
+
+
+def read_rows(stream, body_format: str):
+    """Yield (line_number, row) from a binary stream; undecodable rows come back as RowError."""
+    text = codecs.getreader('utf-8')(stream, errors='replace')
+    if body_format == 'csv':
+        reader = csv.DictReader(text)
+        for row in reader:
+            if None in row:
+                yield reader.line_num, RowError('row has more fields than the header')
+            else:
+                yield reader.line_num, row
+        return
+    for line_number, line in enumerate(text, 1):
+        if not line.strip():
+            continue
+        try:
+            yield line_number, json.loads(line)
+        except ValueError:
+            yield line_number, RowError('not valid JSON')
+
+
+def import_reports(conn, stream, body_format: str, user_id: int) -> dict:
+    """Validate and insert a report stream chunk by chunk; returns the import summary."""
+    started = datetime.utcnow()
+    now = started.strftime(TIMESTAMP_FORMAT)
+    # Only live incidents are deduplicated; MinHash on every historical row would dominate the import
+    live_after = (started - timedelta(hours=dedup.WINDOW_HOURS)).strftime(TIMESTAMP_FORMAT)
+    summary = {'imported': 0, 'duplicates': 0, 'failed': 0, 'errors': []}
+    chunk = []   # (line number, INSERT parameters)
+
+    def fail(line_number, message):
+        summary['failed'] += 1
+        if len(summary['errors']) < MAX_REPORTED_ERRORS:
+            summary['errors'].append({'line': line_number, 'error': message})
+
+    def flush():
+        cursor = conn.cursor()
+        pending = chunk
+        historical = [params for _, params in chunk if params[7] < live_after]
+        if historical:
+            # Opens the chunk's transaction; the commit below ends it
+            cursor.execute('SAVEPOINT bulk_chunk')
+            try:
+                cursor.executemany(INSERT_SQL, historical)
+            except sqlite3.IntegrityError:
+                # A row broke a constraint: redo the whole chunk row by row to find which
+                cursor.execute('ROLLBACK TO bulk_chunk')
+            else:
+                summary['imported'] += cursor.rowcount
+                summary['duplicates'] += len(historical) - cursor.rowcount
+                pending = [(line_number, params) for line_number, params in chunk if params[7] >= live_after]
+        for line_number, params in pending:
+            try:
+                cursor.execute(INSERT_SQL, params)
+            except sqlite3.IntegrityError as e:
+                fail(line_number, str(e))
+                continue
+            if cursor.rowcount == 0:
+                summary['duplicates'] += 1
+                continue
+            if params[7] >= live_after:
+                dedup.assign_cluster(cursor, cursor.lastrowid, params[4], params[3], params[5],
+                                     params[7], params[8], params[9])
+            summary['imported'] += 1
+        conn.commit()
+        chunk.clear()
+
+    try:
+        for line_number, row in read_rows(stream, body_format):
+            try:
+                if isinstance(row, RowError):
+                    raise row
+                chunk.append((line_number, validate(row, user_id, now)))
+            except RowError as e:
+                fail(line_number, str(e))
+                continue
+            if len(chunk) >= CHUNK_SIZE:
+                flush()
+        if chunk:
+            flush()
+    except BaseException:
+        # Earlier chunks stay committed; the summary so far is lost with the request
+        conn.rollback()
+        raise
+    summary['errors_truncated'] = summary['failed'] > len(summary['errors'])
+    return summary
+
+
+def export_reports(conn, where_sql: str, params, export_format: str, batch_size: int = 1000):
+    """Yield matching reports oldest-first as NDJSON or CSV, straight from the cursor."""
+    cursor = conn.execute(
+        f"SELECT {', '.join(EXPORT_COLUMNS[:-1])}, COALESCE(cluster_id, id) FROM reports "
+        f"WHERE 1=1{where_sql} ORDER BY created_at, id", params)
+    if export_format == 'csv':
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(EXPORT_COLUMNS)
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            writer.writerows(rows)
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+        yield buffer.getvalue()
+    else:
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            yield ''.join(json.dumps(dict(zip(EXPORT_COLUMNS, row))) + '\n' for row in rows)
+
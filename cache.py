@@ -0,0 +1,238 @@
+"""Response cache and conditional GET support for the read APIs.
+
+Each cached namespace ('reports', 'donations') has a generation counter that
+write routes bump through invalidate(). A response's ETag is derived from the
+namespace generation and the normalized request key. When a client revalidates
+with a matching ETag, it gets a 304 before the view runs, with no database
+query and no JSON serialization.
+
+Bodies live in an in-process LRU with a TTL. When RESPONSE_CACHE_PATH is set,
+generations and bodies are also kept in a small SQLite file, so several
+worker processes see the same invalidations and share warm entries. Without
+it each worker only sees its own writes and keeps answering 304 for data
+another worker changed. Any deployment with more than one worker process
+must set RESPONSE_CACHE_PATH.
+
+Generations start from the current time in milliseconds, so an ETag issued
+before a restart never matches afterwards. Last-Modified has one-second
+resolution. It is only sent once the second of the latest write is over, so
+a later write in that same second cannot hide behind If-Modified-Since.
+"""
+import asyncio
+import hashlib
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from email.utils import formatdate
+from functools import wraps
+from urllib.parse import urlencode
+
+from flask import Response, make_response, request
+
+import db
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TTL = 30.0
+DEFAULT_MAX_ENTRIES = 512
+
+
+class _MemoryStore:
+    """Per-process generations and an LRU of response bodies."""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()   # key -> (generation, expires_at, body, mimetype)
+        self._generations = {}          # namespace -> (generation, modified_at)
+        self._lock = threading.Lock()
+
+    def generation(self, namespace: str):
+        with self._lock:
+            # Seed from the clock so ETags issued before a restart never match
+            now = time.time()
+            return self._generations.setdefault(namespace, (int(now * 1000), now))
+
+    def bump(self, namespace: str):
+        with self._lock:
+            now = time.time()
+            current, _ = self._generations.get(namespace, (0, now))
+            # Never behind the clock, so a restarted process cannot reissue an old generation
+            self._generations[namespace] = (max(current + 1, int(now * 1000)), now)
+
+    def get(self, key: str, generation: int):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] != generation or entry[1] < time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[2], entry[3]
+
+    def put(self, key: str, generation: int, ttl: float, body: bytes, mimetype: str):
+        with self._lock:
+            self._entries[key] = (generation, time.time() + ttl, body, mimetype)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+class _SQLiteStore(_MemoryStore):
+    """Shares generations and bodies between workers through a local SQLite file.
+
+    The in-memory LRU still answers hot keys; the file is consulted on a miss
+    and is the source of truth for generations.
+    """
+
+    def __init__(self, path: str, max_entries: int):
+        super().__init__(max_entries)
+        self.pool = db.ConnectionPool(path, size=4)
+        with self.pool.connection() as conn:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS cache_generations (
+                    namespace TEXT PRIMARY KEY,
+                    generation INTEGER NOT NULL,
+                    modified_at REAL NOT NULL
+                )
+            ''')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS cache_entries (
+                    key TEXT PRIMARY KEY,
+                    generation INTEGER NOT NULL,
+                    expires_at REAL NOT NULL,
+                    body BLOB NOT NULL,
+                    mimetype TEXT NOT NULL
+                )
+            ''')
+
+    def generation(self, namespace: str):
+        with self.pool.connection() as conn:
+            row = conn.execute('SELECT generation, modified_at FROM cache_generations WHERE namespace = ?',
+                               (namespace,)).fetchone()
+            if row is None:
+                now = time.time()
+                conn.execute('INSERT OR IGNORE INTO cache_generations VALUES (?, ?, ?)',
+                             (namespace, int(now * 1000), now))
+                row = conn.execute('SELECT generation, modified_at FROM cache_generations WHERE namespace = ?',
+                                   (namespace,)).fetchone()
+        return row[0], row[1]
+
+    def bump(self, namespace: str):
+        with self.pool.connection() as conn:
+            now = time.time()
+            conn.execute('''
+                INSERT INTO cache_generations VALUES (?, ?, ?)
+                ON CONFLICT (namespace) DO UPDATE SET
+                    generation = MAX(generation + 1, excluded.generation),
+                    modified_at = excluded.modified_at
+            ''', (namespace, int(now * 1000), now))
+            conn.execute('DELETE FROM cache_entries WHERE expires_at < ?', (time.time(),))
+
+    def get(self, key: str, generation: int):
+        hit = super().get(key, generation)
+        if hit is not None:
+            return hit
+        with self.pool.connection() as conn:
+            row = conn.execute('SELECT body, mimetype, expires_at FROM cache_entries WHERE key = ? AND generation = ?',
+                               (key, generation)).fetchone()
+        if row is None or row[2] < time.time():
+            return None
+        super().put(key, generation, row[2] - time.time(), row[0], row[1])
+        return row[0], row[1]
+
+    def put(self, key: str, generation: int, ttl: float, body: bytes, mimetype: str):
+        super().put(key, generation, ttl, body, mimetype)
+        with self.pool.connection() as conn:
+            conn.execute('INSERT OR REPLACE INTO cache_entries VALUES (?, ?, ?, ?, ?)',
+                         (key, generation, time.time() + ttl, body, mimetype))
+
+
+class ResponseCache:
+    def __init__(self, ttl: float = DEFAULT_TTL, max_entries: int = DEFAULT_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.store = _MemoryStore(max_entries)
+
+    def configure(self, path: str = None, ttl: float = None):
+        """Switch to the shared SQLite store when ``path`` is given."""
+        if ttl is not None:
+            self.ttl = ttl
+        if not path and int(os.getenv('WEB_CONCURRENCY', '1')) > 1:
+            logger.warning('RESPONSE_CACHE_PATH is not set: with several workers, '
+                           'each serves 304s for data another worker changed')
+        self.store = _SQLiteStore(path, self.max_entries) if path else _MemoryStore(self.max_entries)
+
+    def invalidate(self, *namespaces: str):
+        """Call after committing a write that changes any of ``namespaces``."""
+        for namespace in namespaces:
+            self.store.bump(namespace)
+
+    def _lookup(self, namespace: str):
+        """(key, generation, etag, last_modified, response); response is set for a 304 or a cache hit."""
+        key = request.path + '?' + urlencode(sorted(request.args.items(multi=True)))
+        generation, modified_at = self.store.generation(namespace)
+        etag = hashlib.sha1(f'{namespace}:{generation}:{key}'.encode()).hexdigest()[:20]
+        # A write later in the same second would share this Last-Modified; rely on the ETag until it is over
+        last_modified = formatdate(int(modified_at), usegmt=True) if int(time.time()) > int(modified_at) else None
+
+        if request.if_none_match:
+            fresh = request.if_none_match.contains(etag)
+        else:
+            since = request.if_modified_since
+            fresh = since is not None and int(modified_at) <= since.timestamp()
+        response = None
+        if fresh:
+            response = Response(status=304)
+        else:
+            hit = self.store.get(key, generation)
+            if hit is not None:
+                response = Response(hit[0], mimetype=hit[1])
+        return key, generation, etag, last_modified, response
+
+    def _finish(self, lookup, response, computed: bool):
+        key, generation, etag, last_modified, _ = lookup
+        if computed:
+            # Streamed exports are never buffered into the cache
+            if response.status_code != 200 or response.is_streamed:
+                return response
+            self.store.put(key, generation, self.ttl, response.get_data(), response.mimetype)
+        response.set_etag(etag)
+        if last_modified:
+            response.headers['Last-Modified'] = last_modified
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
+
+    def cached(self, namespace: str):
+        """Decorator: serve a GET view from cache with ETag/Last-Modified revalidation."""
+        def decorator(view):
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                lookup = self._lookup(namespace)
+                if lookup[-1] is not None:
+                    return self._finish(lookup, lookup[-1], False)
+                return self._finish(lookup, make_response(view(*args, **kwargs)), True)
+            return wrapper
+        return decorator
+
+    def cached_async(self, namespace: str):
+        """cached() for the coroutine views served natively by asgi.py.
+
+        The lookup and the store write run on a thread, since a shared
+        (RESPONSE_CACHE_PATH) store is a SQLite file.
+        """
+        def decorator(view):
+            @wraps(view)
+            async def wrapper(*args, **kwargs):
+                lookup = await asyncio.to_thread(self._lookup, namespace)
+                if lookup[-1] is not None:
+                    return self._finish(lookup, lookup[-1], False)
+                response = make_response(await view(*args, **kwargs))
+                return await asyncio.to_thread(self._finish, lookup, response, True)
+            return wrapper
+        return decorator
+
+
+response_cache = ResponseCache()
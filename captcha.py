@@ -0,0 +1,131 @@
+"""Stateless, signed captchas for the contact form.
+
+The server keeps nothing when it issues a captcha. The form carries a token
+``nonce.expires.mac``, where mac is an HMAC-SHA256 over the nonce, the expiry
+and the code shown to the user. Any worker holding the key can check the
+typed code by recomputing the mac, without a session or sticky routing.
+
+Tokens expire after CAPTCHA_TTL_SECONDS and are single-use. The nonce of
+every accepted token is recorded in a replay cache until the token expires.
+A replay cache row is 8 bytes of nonce and an expiry. It is per process
+unless a SQLite file is configured, in which case every worker shares it.
+
+CAPTCHA_SECRETS takes comma-separated keys. The first one signs, and all of
+them verify, so a key can be rotated without invalidating open forms.
+Without it, captchas are signed with the SECRET_KEY the app runs with. With
+neither, the app signs with a random key made at startup, which only the
+process that made it knows.
+"""
+import hashlib
+import hmac
+import os
+import secrets
+import string
+import threading
+import time
+
+import db
+
+ALPHABET = string.ascii_uppercase + string.digits
+CODE_LENGTH = 7
+TTL_SECONDS = int(os.getenv('CAPTCHA_TTL_SECONDS', '600'))
+MAX_TRACKED_NONCES = 100_000
+PRUNE_EVERY = 1000
+
+
+class _MemoryReplayCache:
+    def __init__(self, max_entries: int = MAX_TRACKED_NONCES):
+        self.max_entries = max_entries
+        self._used = {}     # nonce -> expires
+        self._lock = threading.Lock()
+
+    def claim(self, nonce: str, expires: int, now: float) -> bool:
+        """Record ``nonce`` as used; False if it already was."""
+        with self._lock:
+            if nonce in self._used:
+                return False
+            if len(self._used) >= self.max_entries:
+                self._used = {n: e for n, e in self._used.items() if e > now}
+            self._used[nonce] = expires
+            return True
+
+
+class _SQLiteReplayCache:
+    """Replay cache shared between workers; each claim is one INSERT OR IGNORE."""
+
+    def __init__(self, path: str):
+        self.pool = db.ConnectionPool(path, size=4)
+        self._claims = 0
+        with self.pool.connection() as conn:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS used_captchas (
+                    nonce BLOB PRIMARY KEY,
+                    expires INTEGER NOT NULL
+                ) WITHOUT ROWID
+            ''')
+
+    def claim(self, nonce: str, expires: int, now: float) -> bool:
+        with self.pool.connection() as conn:
+            new = conn.execute('INSERT OR IGNORE INTO used_captchas VALUES (?, ?)',
+                               (bytes.fromhex(nonce), expires)).rowcount == 1
+            self._claims += 1
+            if self._claims % PRUNE_EVERY == 0:
+                conn.execute('DELETE FROM used_captchas WHERE expires <= ?', (now,))
+        return new
+
+
+class Captchas:
+    def __init__(self, ttl: int = TTL_SECONDS):
+        self.ttl = ttl
+        self.keys = []
+        self.replay_path = None
+        self._replay = None
+
+    def configure(self, keys, replay_path: str = None) -> None:
+        """Set the signing keys (first signs, all verify) and, optionally, a shared replay cache file."""
+        self.keys = [key.encode() if isinstance(key, str) else key for key in keys if key]
+        self.replay_path = replay_path
+        self._replay = None
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.keys)
+
+    @property
+    def replay(self):
+        # Opened on first use so importing the app never creates the file
+        if self._replay is None:
+            self._replay = _SQLiteReplayCache(self.replay_path) if self.replay_path else _MemoryReplayCache()
+        return self._replay
+
+    @staticmethod
+    def _mac(key: bytes, nonce: str, expires: int, code: str) -> str:
+        return hmac.new(key, f'{nonce}.{expires}.{code}'.encode(), hashlib.sha256).hexdigest()
+
+    def issue(self, now: float = None):
+        """Return ``(code, token)`` for a fresh captcha."""
+        if not self.keys:
+            raise RuntimeError('captchas are not configured with a signing key')
+        code = ''.join(secrets.choice(ALPHABET) for _ in range(CODE_LENGTH))
+        nonce = secrets.token_hex(8)
+        expires = int((time.time() if now is None else now) + self.ttl)
+        return code, f'{nonce}.{expires}.{self._mac(self.keys[0], nonce, expires, code)}'
+
+    def verify(self, token: str, entered: str, now: float = None) -> bool:
+        """True for the right code on an unexpired, unused token, which is then spent."""
+        now = time.time() if now is None else now
+        try:
+            nonce, expires, mac = token.split('.')
+            expires = int(expires)
+            bytes.fromhex(nonce)
+        except ValueError:
+            return False
+        if len(nonce) != 16 or expires <= now:
+            return False
+        code = entered.strip().upper()
+        if not any(hmac.compare_digest(mac, self._mac(key, nonce, expires, code)) for key in self.keys):
+            return False
+        return self.replay.claim(nonce, expires, now)
+
+
+captchas = Captchas()
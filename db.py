@@ -0,0 +1,188 @@
+"""Shared SQLite data-access layer.
+
+All routes borrow connections from a single bounded pool instead of calling
+sqlite3.connect() per request. Every pooled connection runs in WAL mode so
+report writes no longer block readers of the incident feed. Statements run
+through TimedCursor, which reports each one's latency to metrics.py.
+"""
+import queue
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from flask import g
+
+import metrics
+
+DATABASE = 'donations.db'
+
+# Tuning applied to every new connection
+POOL_SIZE = 8
+POOL_TIMEOUT = 10.0          # seconds to wait for a free connection
+BUSY_TIMEOUT_MS = 5000       # how long a writer waits on a locked database
+CACHE_SIZE_KIB = 16384       # page cache per connection (negative pragma = KiB)
+MMAP_SIZE = 128 * 1024 * 1024
+STATEMENT_CACHE = 256        # prepared statements kept per connection
+
+
+class PoolTimeout(RuntimeError):
+    """Raised when no pooled connection frees up within POOL_TIMEOUT."""
+
+
+class TimedCursor(sqlite3.Cursor):
+    """Cursor that records statement latency for /metrics."""
+
+    def execute(self, sql, parameters=()):
+        start = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            metrics.observe_query(sql, time.perf_counter() - start)
+
+    def executemany(self, sql, seq_of_parameters):
+        start = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            metrics.observe_query(sql, time.perf_counter() - start)
+
+
+class TimedConnection(sqlite3.Connection):
+    """Connection whose cursors, including the implicit ones, are TimedCursors."""
+
+    # Set when the connection is left in a state the next borrower must not inherit
+    broken = False
+
+    def cursor(self, factory=TimedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+
+class ConnectionPool:
+    """Bounded pool of WAL-mode sqlite3 connections.
+
+    Connections are created lazily up to ``size`` and handed out LIFO so the
+    hottest connection (with a warm page and statement cache) is reused first.
+    """
+
+    def __init__(self, database: str, size: int = POOL_SIZE, timeout: float = POOL_TIMEOUT):
+        self.database = database
+        self.size = size
+        self.timeout = timeout
+        self._idle = queue.LifoQueue(maxsize=size)
+        self._created = 0
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(
+            self.database,
+            timeout=BUSY_TIMEOUT_MS / 1000,
+            check_same_thread=False,
+            cached_statements=STATEMENT_CACHE,
+            factory=TimedConnection,
+            uri=True,   # lets archive.py ATTACH files read-only via file:...?mode=ro
+        )
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute(f'PRAGMA cache_size=-{CACHE_SIZE_KIB}')
+        conn.execute(f'PRAGMA mmap_size={MMAP_SIZE}')
+        conn.execute('PRAGMA temp_store=MEMORY')
+        conn.execute(f'PRAGMA busy_timeout={BUSY_TIMEOUT_MS}')
+        return conn
+
+    def acquire(self) -> sqlite3.Connection:
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._created < self.size:
+                self._created += 1
+                try:
+                    return self._connect()
+                except Exception:
+                    self._created -= 1
+                    raise
+        try:
+            return self._idle.get(timeout=self.timeout)
+        except queue.Empty:
+            raise PoolTimeout(f'no database connection available after {self.timeout}s')
+
+    def release(self, conn: sqlite3.Connection) -> None:
+        if getattr(conn, 'broken', False):
+            self.discard(conn)
+            return
+        # Never hand a connection with an open transaction to the next caller
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            self.discard(conn)
+            return
+        self._idle.put_nowait(conn)
+
+    def discard(self, conn: sqlite3.Connection) -> None:
+        """Close a connection that is in an unknown state instead of reusing it."""
+        try:
+            conn.close()
+        finally:
+            with self._lock:
+                self._created -= 1
+
+    @contextmanager
+    def connection(self):
+        """Borrow a connection; commit on success, roll back on error."""
+        conn = self.acquire()
+        try:
+            yield conn
+            conn.commit()
+        finally:
+            self.release(conn)
+
+    def close_all(self) -> None:
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self.discard(conn)
+
+
+pool = ConnectionPool(DATABASE)
+
+
+def configure(database: str, size: int = POOL_SIZE) -> ConnectionPool:
+    """Point the shared pool at another database file (tests, tooling)."""
+    global pool, DATABASE
+    pool.close_all()
+    DATABASE = database
+    pool = ConnectionPool(database, size=size)
+    return pool
+
+
+def get_db() -> sqlite3.Connection:
+    """Connection bound to the current request, returned to the pool on teardown."""
+    if 'db' not in g:
+        g.db = pool.acquire()
+    return g.db
+
+
+def _release_db(exc=None):
+    conn = g.pop('db', None)
+    if conn is not None:
+        pool.release(conn)
+
+
+def init_app(app):
+    app.teardown_appcontext(_release_db)
+
+
+def connection():
+    """Borrow a connection outside a request (startup, background work)."""
+    return pool.connection()
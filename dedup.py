@@ -0,0 +1,165 @@
+"""Near-duplicate detection for incident reports.
+
+During a large event many people report the same incident. Each new report
+gets a MinHash signature built from character shingles of its description
+and the words of its normalized location. The signature is split into
+LSH bands, and each band is hashed together with the disaster type into a
+bucket key. A report joins the cluster of any recent report (within
+DEDUP_WINDOW_HOURS) that shares a bucket. The match must also pass an
+estimated Jaccard similarity of at least DEDUP_THRESHOLD and, when both
+reports are geotagged, lie within DEDUP_RADIUS_KM.
+
+Buckets live in SQLite (report_lsh) and keep at most one entry per
+(bucket, cluster). A lookup therefore reads a fixed number of index entries
+however many duplicates a cluster already has. reports.cluster_id points at
+the first report of the cluster, and is NULL for that first report itself.
+"""
+import hashlib
+import os
+import random
+import re
+from array import array
+from datetime import datetime, timedelta
+
+import geo
+
+NUM_PERM = 64
+BANDS = 16
+ROWS_PER_BAND = NUM_PERM // BANDS
+SHINGLE_SIZE = 4
+WINDOW_HOURS = float(os.getenv('DEDUP_WINDOW_HOURS', '6'))
+THRESHOLD = float(os.getenv('DEDUP_THRESHOLD', '0.5'))
+RADIUS_KM = float(os.getenv('DEDUP_RADIUS_KM', '5'))
+
+_PRIME = (1 << 61) - 1
+# Fixed seed: signatures stored in the database must stay comparable across restarts
+_rng = random.Random(0x5EED)
+_PERMUTATIONS = [(_rng.randrange(1, _PRIME), _rng.randrange(0, _PRIME)) for _ in range(NUM_PERM)]
+_NON_WORD = re.compile(r'[^\w]+')
+
+
+def normalize(text: str) -> str:
+    return _NON_WORD.sub(' ', (text or '').lower()).strip()
+
+
+def shingles(location: str, description: str) -> set:
+    """Character shingles of the description plus the location's words."""
+    text = normalize(description)
+    grams = {text[i:i + SHINGLE_SIZE] for i in range(max(1, len(text) - SHINGLE_SIZE + 1))}
+    grams.update('@' + word for word in normalize(location).split())
+    grams.discard('')
+    return grams
+
+
+def _hash64(value: str) -> int:
+    return int.from_bytes(hashlib.blake2b(value.encode(), digest_size=8).digest(), 'little')
+
+
+def signature(grams: set) -> array:
+    hashes = [_hash64(g) for g in grams] or [0]
+    return array('Q', (min((a * h + b) % _PRIME for h in hashes) for a, b in _PERMUTATIONS))
+
+
+def band_keys(disaster_type: str, sig: array) -> list:
+    """One signed 64-bit bucket key per band, scoped to the disaster type."""
+    keys = []
+    for band in range(BANDS):
+        chunk = sig[band * ROWS_PER_BAND:(band + 1) * ROWS_PER_BAND]
+        digest = hashlib.blake2b(digest_size=8, person=band.to_bytes(2, 'little'))
+        digest.update(disaster_type.encode())
+        digest.update(chunk.tobytes())
+        keys.append(int.from_bytes(digest.digest(), 'little', signed=True))
+    return keys
+
+
+def similarity(a: array, b: array) -> float:
+    return sum(x == y for x, y in zip(a, b)) / NUM_PERM
+
+
+def ensure_dedup_index(cursor) -> None:
+    """Create the signature and bucket tables; backfill on first creation."""
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'report_signatures'")
+    exists = cursor.fetchone() is not None
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS report_signatures (
+            report_id INTEGER PRIMARY KEY,
+            cluster_id INTEGER NOT NULL,
+            created_at TEXT NOT NULL,
+            latitude REAL,
+            longitude REAL,
+            signature BLOB NOT NULL
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_report_signatures_created ON report_signatures (created_at)')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS report_lsh (
+            bucket INTEGER NOT NULL,
+            cluster_id INTEGER NOT NULL,
+            report_id INTEGER NOT NULL,
+            PRIMARY KEY (bucket, cluster_id)
+        ) WITHOUT ROWID
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_report_lsh_report ON report_lsh (report_id)')
+    # Expiring a signature frees its buckets for later members of the cluster
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS report_signatures_ad AFTER DELETE ON report_signatures BEGIN
+            DELETE FROM report_lsh WHERE report_id = old.report_id;
+        END
+    ''')
+    if not exists:
+        rebuild_clusters(cursor)
+
+
+def rebuild_clusters(cursor) -> int:
+    """Recluster every report in created_at order; returns the number of clusters."""
+    cursor.execute('DELETE FROM report_signatures')
+    cursor.execute('UPDATE reports SET cluster_id = NULL WHERE cluster_id IS NOT NULL')
+    cursor.execute('''
+        SELECT id, disaster_type, location, description, created_at, latitude, longitude
+        FROM reports ORDER BY created_at, id
+    ''')
+    clusters = 0
+    for row in cursor.fetchall():
+        if assign_cluster(cursor, *row) == row[0]:
+            clusters += 1
+    return clusters
+
+
+def assign_cluster(cursor, report_id, disaster_type, location, description, created_at,
+                   latitude=None, longitude=None) -> int:
+    """Index a stored report and attach it to a matching recent cluster.
+
+    Runs in the caller's transaction. Returns the report's cluster ID (its own
+    ID when it starts a new cluster).
+    """
+    sig = signature(shingles(location, description))
+    keys = band_keys(disaster_type, sig)
+    created = datetime.strptime(str(created_at)[:19], '%Y-%m-%d %H:%M:%S')
+    # The window trails the row during a rebuild, but never runs ahead of the clock:
+    # a future-dated row must not expire the live window for everyone else
+    cutoff = (min(created, datetime.utcnow()) - timedelta(hours=WINDOW_HOURS)).strftime('%Y-%m-%d %H:%M:%S')
+    cursor.execute('DELETE FROM report_signatures WHERE created_at < ?', (cutoff,))
+
+    cursor.execute(f'''
+        SELECT s.cluster_id, s.signature, s.latitude, s.longitude
+        FROM report_lsh l JOIN report_signatures s ON s.report_id = l.report_id
+        WHERE l.bucket IN ({', '.join('?' for _ in keys)}) AND s.created_at <= ?
+    ''', keys + [str(created_at)])
+    best_score, cluster_id = 0.0, report_id
+    for candidate_cluster, blob, cand_lat, cand_lon in cursor.fetchall():
+        if None not in (latitude, longitude, cand_lat, cand_lon) and \
+                geo.haversine_km(latitude, longitude, cand_lat, cand_lon) > RADIUS_KM:
+            continue
+        score = similarity(sig, array('Q', blob))
+        if score >= THRESHOLD and score > best_score:
+            best_score, cluster_id = score, candidate_cluster
+
+    cursor.execute('''
+        INSERT OR REPLACE INTO report_signatures (report_id, cluster_id, created_at, latitude, longitude, signature)
+        VALUES (?, ?, ?, ?, ?, ?)
+    ''', (report_id, cluster_id, str(created_at), latitude, longitude, sig.tobytes()))
+    cursor.executemany('INSERT OR IGNORE INTO report_lsh (bucket, cluster_id, report_id) VALUES (?, ?, ?)',
+                       [(key, cluster_id, report_id) for key in keys])
+    if cluster_id != report_id:
+        cursor.execute('UPDATE reports SET cluster_id = ? WHERE id = ?', (cluster_id, report_id))
+    return cluster_id
@@ -0,0 +1,154 @@
+"""In-process publish/subscribe fan-out for live incident updates.
+
+report() publishes each new or status-changed report once; the broker
+pre-renders the Server-Sent Events frame and hands the same bytes to every
+subscriber, so one insert reaches all open dashboards without re-querying
+the database.
+
+Every subscriber has a bounded queue. A consumer that falls behind is dropped
+and told to resync instead of letting its backlog grow without limit. Event
+IDs carry a per-process epoch, so a Last-Event-ID from before a restart is
+recognised and also answered with a resync.
+"""
+import asyncio
+import json
+import queue
+import threading
+import time
+from collections import deque
+
+HISTORY_SIZE = 1000        # recent events kept for Last-Event-ID resume
+SUBSCRIBER_QUEUE_SIZE = 256
+MAX_SUBSCRIBERS = 1000
+HEARTBEAT_SECONDS = 15.0
+RETRY_MS = 3000             # client reconnect delay advertised to EventSource
+
+
+class TooManySubscribers(RuntimeError):
+    """Raised when the broker is already serving MAX_SUBSCRIBERS streams."""
+
+
+def _frame(event_id: str, event_type: str, payload: str) -> str:
+    return f'id: {event_id}\nevent: {event_type}\ndata: {payload}\n\n'
+
+
+class Subscription:
+    def __init__(self, topic=None, size: int = SUBSCRIBER_QUEUE_SIZE, notify=None):
+        self.topic = topic
+        self.queue = queue.Queue(maxsize=size)
+        self.overflowed = False
+        # Called (from the publishing thread) after each delivery; lets asyncio consumers wake up
+        self.notify = notify
+
+
+class Broker:
+    def __init__(self, history_size: int = HISTORY_SIZE, max_subscribers: int = MAX_SUBSCRIBERS):
+        self.epoch = format(int(time.time()), 'x')
+        self.max_subscribers = max_subscribers
+        self._seq = 0
+        self._history = deque(maxlen=history_size)   # (seq, topic, frame)
+        self._subscribers = set()
+        self._lock = threading.Lock()
+
+    def publish(self, event_type: str, data: dict, topic=None) -> str:
+        """Fan ``data`` out to every subscriber whose topic filter matches."""
+        payload = json.dumps(data, separators=(',', ':'), default=str)
+        with self._lock:
+            self._seq += 1
+            event_id = f'{self.epoch}-{self._seq}'
+            frame = _frame(event_id, event_type, payload)
+            self._history.append((self._seq, topic, frame))
+            for sub in list(self._subscribers):
+                if sub.topic and topic and sub.topic != topic:
+                    continue
+                try:
+                    sub.queue.put_nowait(frame)
+                except queue.Full:
+                    # Backpressure: drop the slow consumer rather than buffer for it
+                    sub.overflowed = True
+                    self._subscribers.discard(sub)
+                if sub.notify is not None:
+                    sub.notify()
+        return event_id
+
+    def subscribe(self, last_event_id: str = '', topic=None, notify=None):
+        """Register a subscriber and return ``(subscription, backlog)``.
+
+        ``backlog`` holds the frames missed since ``last_event_id``, or is
+        None when they can no longer be replayed and the client must resync.
+        """
+        sub = Subscription(topic, notify=notify)
+        with self._lock:
+            if len(self._subscribers) >= self.max_subscribers:
+                raise TooManySubscribers('too many live subscribers')
+            backlog = []
+            if last_event_id:
+                backlog = self._replay(last_event_id, topic)
+            self._subscribers.add(sub)
+        return sub, backlog
+
+    def _replay(self, last_event_id: str, topic):
+        epoch, _, seq = last_event_id.partition('-')
+        try:
+            seq = int(seq)
+        except ValueError:
+            return None
+        if epoch != self.epoch or seq > self._seq:
+            return None
+        if seq < self._seq and (not self._history or self._history[0][0] > seq + 1):
+            return None
+        return [frame for s, t, frame in self._history
+                if s > seq and (not topic or not t or t == topic)]
+
+    def unsubscribe(self, sub: Subscription) -> None:
+        with self._lock:
+            self._subscribers.discard(sub)
+
+    def stream(self, sub: Subscription, backlog, heartbeat: float = HEARTBEAT_SECONDS):
+        """Generator of SSE frames for one subscriber; always unsubscribes on exit."""
+        try:
+            # Flush headers right away and set the browser's reconnect delay
+            yield f'retry: {RETRY_MS}\n\n'
+            if backlog is None:
+                yield _frame(f'{self.epoch}-{self._seq}', 'resync', '{}')
+            else:
+                yield from backlog
+            while True:
+                if sub.overflowed:
+                    yield _frame(f'{self.epoch}-{self._seq}', 'resync', '{}')
+                    return
+                try:
+                    yield sub.queue.get(timeout=heartbeat)
+                except queue.Empty:
+                    yield ': keep-alive\n\n'
+        finally:
+            self.unsubscribe(sub)
+
+    async def stream_async(self, sub: Subscription, backlog, wake, heartbeat: float = HEARTBEAT_SECONDS):
+        """stream() for asyncio: waits on ``wake`` (an asyncio.Event set by sub.notify) instead of a thread."""
+        try:
+            yield f'retry: {RETRY_MS}\n\n'
+            if backlog is None:
+                yield _frame(f'{self.epoch}-{self._seq}', 'resync', '{}')
+            else:
+                for frame in backlog:
+                    yield frame
+            while True:
+                wake.clear()
+                while True:
+                    try:
+                        yield sub.queue.get_nowait()
+                    except queue.Empty:
+                        break
+                if sub.overflowed:
+                    yield _frame(f'{self.epoch}-{self._seq}', 'resync', '{}')
+                    return
+                try:
+                    await asyncio.wait_for(wake.wait(), heartbeat)
+                except asyncio.TimeoutError:
+                    yield ': keep-alive\n\n'
+        finally:
+            self.unsubscribe(sub)
+
+
+broker = Broker()
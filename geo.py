@@ -0,0 +1,167 @@
+"""Spatial index and query helpers for geotagged incident reports.
+
+Reports may carry an optional latitude/longitude. Those points are mirrored
+into an R*Tree virtual table (reports_geo) by triggers, so bounding-box and
+radius lookups only touch candidate rows instead of the whole table. On
+SQLite builds without the R*Tree module the same boxes are matched as plain
+latitude/longitude ranges.
+"""
+import math
+import sqlite3
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE_LAT = 111.32
+DEFAULT_RADIUS_KM = 10.0
+MAX_RADIUS_KM = 1000.0
+# Radius queries fetch this many times the page size, nearest first by approx_distance_sql()
+NEAR_CANDIDATE_FACTOR = 4
+
+_rtree_available = None
+
+
+class GeoQueryError(ValueError):
+    """Raised for malformed coordinates or spatial query parameters."""
+
+
+def ensure_geo_index(cursor) -> bool:
+    """Create the R*Tree and its sync triggers; backfill on first creation.
+
+    Returns False when the SQLite build lacks the R*Tree module.
+    """
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'reports_geo'")
+    exists = cursor.fetchone() is not None
+    try:
+        cursor.execute('''
+            CREATE VIRTUAL TABLE IF NOT EXISTS reports_geo USING rtree(
+                id, min_lat, max_lat, min_lon, max_lon
+            )
+        ''')
+    except sqlite3.OperationalError:
+        return False
+
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS reports_geo_ai AFTER INSERT ON reports
+        WHEN new.latitude IS NOT NULL AND new.longitude IS NOT NULL BEGIN
+            INSERT INTO reports_geo VALUES (new.id, new.latitude, new.latitude, new.longitude, new.longitude);
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS reports_geo_ad AFTER DELETE ON reports BEGIN
+            DELETE FROM reports_geo WHERE id = old.id;
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS reports_geo_au AFTER UPDATE OF latitude, longitude ON reports BEGIN
+            DELETE FROM reports_geo WHERE id = old.id;
+            INSERT INTO reports_geo
+            SELECT new.id, new.latitude, new.latitude, new.longitude, new.longitude
+            WHERE new.latitude IS NOT NULL AND new.longitude IS NOT NULL;
+        END
+    ''')
+    if not exists:
+        cursor.execute('''
+            INSERT INTO reports_geo
+            SELECT id, latitude, latitude, longitude, longitude FROM reports
+            WHERE latitude IS NOT NULL AND longitude IS NOT NULL
+        ''')
+    return True
+
+
+def rtree_available(conn) -> bool:
+    """Whether reports_geo exists; checked once per process."""
+    global _rtree_available
+    if _rtree_available is None:
+        row = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'reports_geo'").fetchone()
+        _rtree_available = row is not None
+    return _rtree_available
+
+
+def parse_point(lat_value, lon_value):
+    """Validate an optional (lat, lon) pair from a form; both or neither."""
+    lat_value = (lat_value or '').strip()
+    lon_value = (lon_value or '').strip()
+    if not lat_value and not lon_value:
+        return None, None
+    try:
+        lat, lon = float(lat_value), float(lon_value)
+    except ValueError:
+        raise GeoQueryError('Latitude and longitude must both be numbers')
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        raise GeoQueryError('Coordinates are out of range')
+    return lat, lon
+
+
+def _floats(value: str, count: int, name: str):
+    try:
+        numbers = [float(part) for part in value.split(',')]
+    except ValueError:
+        numbers = []
+    if len(numbers) != count or not all(math.isfinite(n) for n in numbers):
+        raise GeoQueryError(f'Invalid {name}')
+    return numbers
+
+
+def parse_bbox(value: str):
+    """``min_lon,min_lat,max_lon,max_lat`` (GeoJSON order) -> (min_lat, max_lat, min_lon, max_lon)."""
+    min_lon, min_lat, max_lon, max_lat = _floats(value, 4, 'bbox')
+    if min_lat > max_lat or min_lon > max_lon:
+        raise GeoQueryError('Invalid bbox')
+    return min_lat, max_lat, min_lon, max_lon
+
+
+def parse_near(value: str, radius_value):
+    """``lat,lon`` plus ``radius_km`` -> (lat, lon, radius_km)."""
+    lat, lon = _floats(value, 2, 'near')
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        raise GeoQueryError('Invalid near')
+    if radius_value in (None, ''):
+        radius = DEFAULT_RADIUS_KM
+    else:
+        try:
+            radius = float(radius_value)
+        except ValueError:
+            raise GeoQueryError('Invalid radius_km')
+        if not 0 < radius <= MAX_RADIUS_KM:
+            raise GeoQueryError('Invalid radius_km')
+    return lat, lon, radius
+
+
+def radius_bboxes(lat: float, lon: float, radius_km: float) -> list:
+    """Bounding boxes that together contain a circle; used to prefilter via the R*Tree.
+
+    Usually one (min_lat, max_lat, min_lon, max_lon) box. A circle crossing
+    the antimeridian gets two, one on each side of it.
+    """
+    dlat = radius_km / KM_PER_DEGREE_LAT
+    min_lat, max_lat = max(-90.0, lat - dlat), min(90.0, lat + dlat)
+    cos_lat = math.cos(math.radians(max(abs(min_lat), abs(max_lat))))
+    if cos_lat <= 1e-9:
+        return [(min_lat, max_lat, -180.0, 180.0)]
+    dlon = radius_km / (KM_PER_DEGREE_LAT * cos_lat)
+    if dlon >= 180:
+        return [(min_lat, max_lat, -180.0, 180.0)]
+    west, east = lon - dlon, lon + dlon
+    if west < -180:
+        return [(min_lat, max_lat, west + 360, 180.0), (min_lat, max_lat, -180.0, east)]
+    if east > 180:
+        return [(min_lat, max_lat, west, 180.0), (min_lat, max_lat, -180.0, east - 360)]
+    return [(min_lat, max_lat, west, east)]
+
+
+def approx_distance_sql(lat: float, lon: float, lat_column: str = 'latitude', lon_column: str = 'longitude'):
+    """SQL expression and params growing with the squared distance from (lat, lon).
+
+    An equirectangular approximation, cheap enough to ORDER BY so a radius query
+    can LIMIT its candidates in SQL; haversine_km() has the final say.
+    """
+    dlon = f'MIN(ABS({lon_column} - ?), 360 - ABS({lon_column} - ?))'
+    sql = f'(({lat_column} - ?) * ({lat_column} - ?) + {dlon} * {dlon} * ?)'
+    return sql, [lat, lat, lon, lon, lon, lon, math.cos(math.radians(lat)) ** 2]
+
+
+def haversine_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = phi2 - phi1
+    dlmb = math.radians(lon2 - lon1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlmb / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
@@ -0,0 +1,254 @@
+"""Incident image ingestion: streamed, content-addressed, processed off-thread.
+
+The request path streams the upload to a private temporary file in chunks,
+enforces a size cap and sniffs the magic bytes. It then strips EXIF, GPS
+and other metadata before anything is published: with Pillow the image is
+decoded and re-encoded (applying the EXIF orientation first), without it
+the metadata segments/chunks are cut out of JPEG and PNG files byte by
+byte. The cleaned file is stored as ``<sha256>.<ext>`` of exactly the bytes
+served, so it never changes afterwards and the same photo uploaded by many
+reporters is kept once (re-encoding is deterministic).
+
+A background worker then writes small thumbnails (WebP, plus a JPEG
+fallback) under ``thumbs/`` for the incident feed. Pillow is optional;
+without it no thumbnails are produced and the feed falls back to the
+original file.
+"""
+import hashlib
+import logging
+import os
+import queue
+import re
+import shutil
+import struct
+import tempfile
+import threading
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # pragma: no cover - thumbnails are simply skipped
+    Image = None
+
+import db
+import metrics
+from cache import response_cache
+
+logger = logging.getLogger(__name__)
+
+MAX_UPLOAD_BYTES = int(os.getenv('MAX_UPLOAD_BYTES', str(10 * 1024 * 1024)))
+CHUNK_SIZE = 64 * 1024
+THUMBNAIL_SIZE = (480, 480)
+THUMBNAIL_DIR = 'thumbs'
+QUEUE_SIZE = 256
+
+# Leading bytes of each accepted format -> stored extension
+_MAGIC = (
+    (b'\x89PNG\r\n\x1a\n', 'png'),
+    (b'\xff\xd8\xff', 'jpg'),
+    (b'GIF87a', 'gif'),
+    (b'GIF89a', 'gif'),
+)
+
+
+# Names produced by ImagePipeline.save(); legacy uploads used timestamps instead
+CONTENT_ADDRESSED = re.compile(r'^[0-9a-f]{64}\.(png|jpg|gif)$')
+
+
+class UploadRejected(ValueError):
+    """Raised when an upload is too large or is not a supported image."""
+
+
+def _file_digest(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+# JPEG APP1 (EXIF, XMP), APP13 (IPTC) and comments; PNG text, EXIF and timestamp chunks
+_JPEG_METADATA = {0xE1, 0xED, 0xFE}
+_PNG_METADATA = {b'eXIf', b'tEXt', b'zTXt', b'iTXt', b'tIME'}
+
+
+def _strip_jpeg(data: bytes) -> bytes:
+    out = [data[:2]]
+    pos = 2
+    while pos + 4 <= len(data) and data[pos] == 0xFF:
+        marker = data[pos + 1]
+        if marker == 0xDA:      # start of scan: entropy-coded data follows
+            break
+        length = struct.unpack('>H', data[pos + 2:pos + 4])[0]
+        if marker not in _JPEG_METADATA:
+            out.append(data[pos:pos + 2 + length])
+        pos += 2 + length
+    out.append(data[pos:])
+    return b''.join(out)
+
+
+def _strip_png(data: bytes) -> bytes:
+    out = [data[:8]]
+    pos = 8
+    while pos + 8 <= len(data):
+        length = struct.unpack('>I', data[pos:pos + 4])[0]
+        end = pos + 12 + length
+        if data[pos + 4:pos + 8] not in _PNG_METADATA:
+            out.append(data[pos:end])
+        pos = end
+    return b''.join(out)
+
+
+def strip_metadata(src: str, dst: str, ext: str) -> None:
+    """Copy the image at ``src`` to ``dst`` without EXIF/GPS/text metadata; raises UploadRejected."""
+    if Image is not None:
+        try:
+            with Image.open(src) as img:
+                img.verify()
+            with Image.open(src) as img:
+                if getattr(img, 'is_animated', False):
+                    # Animated GIFs carry no EXIF; re-encoding would drop frames
+                    shutil.copyfile(src, dst)
+                    return
+                fmt = img.format
+                img = ImageOps.exif_transpose(img)
+                # Keep only what affects pixels
+                img.info = {k: v for k, v in img.info.items() if k == 'transparency'}
+                img.save(dst, fmt, **({'quality': 90} if fmt == 'JPEG' else {}))
+        except (OSError, SyntaxError, ValueError, Image.DecompressionBombError):
+            raise UploadRejected('The uploaded file is not a valid image.')
+        return
+    # Without Pillow: cut metadata out without decoding (EXIF orientation is lost)
+    with open(src, 'rb') as f:
+        data = f.read()
+    if ext == 'jpg':
+        data = _strip_jpeg(data)
+    elif ext == 'png':
+        data = _strip_png(data)
+    with open(dst, 'wb') as f:
+        f.write(data)
+
+
+def sniff_extension(head: bytes):
+    for magic, ext in _MAGIC:
+        if head.startswith(magic):
+            return ext
+    return None
+
+
+class ImagePipeline:
+    def __init__(self, upload_folder: str, max_bytes: int = MAX_UPLOAD_BYTES):
+        self.upload_folder = upload_folder
+        self.thumb_folder = os.path.join(upload_folder, THUMBNAIL_DIR)
+        # Uploads are cleaned here first; nothing in it is reachable through /uploads/
+        self.incoming_folder = upload_folder.rstrip('/\\') + '.incoming'
+        self.max_bytes = max_bytes
+        self._queue = queue.Queue(maxsize=QUEUE_SIZE)
+        self._worker = None
+        self._lock = threading.Lock()
+        os.makedirs(self.thumb_folder, exist_ok=True)
+        os.makedirs(self.incoming_folder, exist_ok=True)
+
+    def save(self, file_storage) -> str:
+        """Stream an upload, strip its metadata and publish it under its content hash.
+
+        Returns the stored filename (``<sha256>.<ext>`` of the stored bytes).
+        """
+        size = 0
+        ext = None
+        fd, raw_path = tempfile.mkstemp(dir=self.incoming_folder, suffix='.part')
+        clean_path = raw_path + '.clean'
+        try:
+            with os.fdopen(fd, 'wb') as out:
+                while True:
+                    chunk = file_storage.stream.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    if ext is None:
+                        ext = sniff_extension(chunk)
+                        if ext is None:
+                            raise UploadRejected('Only PNG, JPEG and GIF images are allowed.')
+                    size += len(chunk)
+                    if size > self.max_bytes:
+                        raise UploadRejected(f'Images must be smaller than {self.max_bytes // (1024 * 1024)} MB.')
+                    out.write(chunk)
+            if ext is None:
+                raise UploadRejected('The uploaded file is empty.')
+            metrics.upload_bytes.observe(size)
+
+            strip_metadata(raw_path, clean_path, ext)
+            filename = f'{_file_digest(clean_path)}.{ext}'
+            final_path = os.path.join(self.upload_folder, filename)
+            if os.path.exists(final_path):
+                # Duplicate content: keep the existing copy and its thumbnails
+                return filename
+            os.replace(clean_path, final_path)
+        finally:
+            for path in (raw_path, clean_path):
+                if os.path.exists(path):
+                    os.remove(path)
+
+        self.submit(filename)
+        return filename
+
+    def submit(self, filename: str) -> None:
+        if Image is None:
+            return
+        self._ensure_worker()
+        try:
+            self._queue.put_nowait(filename)
+        except queue.Full:
+            # The cleaned original is already served; thumbnails can be regenerated later
+            logger.warning('image queue full, skipping processing of %s', filename)
+
+    def is_final(self, filename: str) -> bool:
+        """True for content-addressed uploads, which are never rewritten once stored."""
+        return bool(CONTENT_ADDRESSED.match(filename))
+
+    def thumbnail_paths(self, filename: str):
+        stem = filename.rsplit('.', 1)[0]
+        return (os.path.join(self.thumb_folder, stem + '.webp'),
+                os.path.join(self.thumb_folder, stem + '.jpg'))
+
+    def _ensure_worker(self) -> None:
+        with self._lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name='image-pipeline', daemon=True)
+                self._worker.start()
+
+    def _run(self) -> None:
+        while True:
+            filename = self._queue.get()
+            try:
+                self.process(filename)
+            except Exception:
+                logger.exception('failed to process upload %s', filename)
+            finally:
+                self._queue.task_done()
+
+    def process(self, filename: str) -> None:
+        """Write the feed thumbnails for one stored upload."""
+        path = os.path.join(self.upload_folder, filename)
+        webp_path, jpeg_path = self.thumbnail_paths(filename)
+        try:
+            with Image.open(path) as img:
+                thumb = img.convert('RGBA' if img.mode in ('RGBA', 'LA', 'P') else 'RGB')
+                thumb.thumbnail(THUMBNAIL_SIZE)
+                self._atomic_save(thumb, webp_path, 'WEBP', quality=75, method=4)
+                self._atomic_save(thumb.convert('RGB'), jpeg_path, 'JPEG', quality=80, optimize=True)
+        except (OSError, SyntaxError, ValueError, Image.DecompressionBombError):
+            logger.warning('rejecting undecodable upload %s', filename)
+            self._discard(filename)
+
+    @staticmethod
+    def _atomic_save(img, path: str, fmt: str, **options) -> None:
+        tmp_path = path + '.tmp'
+        img.save(tmp_path, fmt, **options)
+        os.replace(tmp_path, path)
+
+    def _discard(self, filename: str) -> None:
+        for path in (os.path.join(self.upload_folder, filename), *self.thumbnail_paths(filename)):
+            if os.path.exists(path):
+                os.remove(path)
+        with db.connection() as conn:
+            conn.execute('UPDATE reports SET image_path = NULL WHERE image_path = ?', (filename,))
+        response_cache.invalidate('reports')
@@ -0,0 +1,194 @@
+"""In-process request metrics, exposed at /metrics in Prometheus text format.
+
+Request hooks record per-endpoint latency, and db.py routes every cursor
+through a timing wrapper, so each request also reports its SQL query count
+and database time. Template render time (via Flask's template signals),
+upload sizes and outbound Stripe latency are recorded alongside.
+
+Set METRICS_TOKEN to require ``Authorization: Bearer <token>`` on /metrics.
+Metrics are kept per process, so with several workers each one has to be
+scraped separately.
+"""
+import bisect
+import hmac
+import threading
+import time
+from contextlib import contextmanager
+
+from flask import (Response, abort, before_render_template, current_app, g, has_request_context, request,
+                   template_rendered)
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 250)
+BYTES_BUCKETS = (16 * 1024, 64 * 1024, 256 * 1024, 1024 ** 2, 4 * 1024 ** 2, 10 * 1024 ** 2, 25 * 1024 ** 2)
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(names, values, extra=()) -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)] + list(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class Counter:
+    def __init__(self, name: str, documentation: str, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount: float = 1) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self):
+        yield f'# HELP {self.name} {self.documentation}'
+        yield f'# TYPE {self.name} counter'
+        with self._lock:
+            items = sorted(self._values.items())
+        for labels, value in items:
+            yield f'{self.name}{_labels(self.labelnames, labels)} {value}'
+
+
+class Histogram:
+    def __init__(self, name: str, documentation: str, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series = {}        # labels -> [per-bucket counts..., +Inf count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels) -> None:
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0] * (len(self.buckets) + 2)
+            series[index] += 1
+            series[-1] += value
+
+    @contextmanager
+    def time(self, *labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *labels)
+
+    def render(self):
+        yield f'# HELP {self.name} {self.documentation}'
+        yield f'# TYPE {self.name} histogram'
+        with self._lock:
+            items = sorted((labels, list(series)) for labels, series in self._series.items())
+        for labels, series in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), series[:-1]):
+                cumulative += count
+                le = f'le="{bound}"'
+                yield f'{self.name}_bucket{_labels(self.labelnames, labels, [le])} {cumulative}'
+            yield f'{self.name}_sum{_labels(self.labelnames, labels)} {series[-1]}'
+            yield f'{self.name}_count{_labels(self.labelnames, labels)} {cumulative}'
+
+
+REGISTRY = []
+
+
+def _register(metric):
+    REGISTRY.append(metric)
+    return metric
+
+
+requests_total = _register(Counter(
+    'resqnet_http_requests_total', 'HTTP requests handled.', ('endpoint', 'method', 'status')))
+request_seconds = _register(Histogram(
+    'resqnet_http_request_duration_seconds', 'Request latency by endpoint.', ('endpoint', 'method')))
+request_db_seconds = _register(Histogram(
+    'resqnet_http_request_db_seconds', 'Time spent in SQL per request.', ('endpoint',)))
+request_db_queries = _register(Histogram(
+    'resqnet_http_request_db_queries', 'SQL statements executed per request.', ('endpoint',), COUNT_BUCKETS))
+query_seconds = _register(Histogram(
+    'resqnet_db_query_duration_seconds', 'SQL statement latency by statement type.', ('statement',)))
+template_seconds = _register(Histogram(
+    'resqnet_template_render_seconds', 'Jinja template render time.', ('template',)))
+upload_bytes = _register(Histogram(
+    'resqnet_upload_bytes', 'Size of accepted image uploads.', (), BYTES_BUCKETS))
+stripe_seconds = _register(Histogram(
+    'resqnet_stripe_request_duration_seconds', 'Outbound Stripe API latency.', ('operation', 'outcome')))
+rate_limited = _register(Counter(
+    'resqnet_rate_limited_total', 'Requests rejected with 429 by the per-client rate limiter.', ('endpoint',)))
+shed = _register(Counter(
+    'resqnet_shed_total', 'Requests rejected with 503 by the load shedder.', ('endpoint', 'priority')))
+
+
+def observe_query(statement: str, seconds: float) -> None:
+    """Called by db.py for every executed statement."""
+    verb = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else 'OTHER'
+    query_seconds.observe(seconds, verb)
+    if has_request_context():
+        g._metrics_db_queries = g.get('_metrics_db_queries', 0) + 1
+        g._metrics_db_seconds = g.get('_metrics_db_seconds', 0.0) + seconds
+
+
+@contextmanager
+def stripe_call(operation: str):
+    """Time an outbound Stripe API call, labelled by outcome."""
+    start = time.perf_counter()
+    outcome = 'error'
+    try:
+        yield
+        outcome = 'ok'
+    finally:
+        stripe_seconds.observe(time.perf_counter() - start, operation, outcome)
+
+
+def render_latest() -> str:
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+
+def _before_request():
+    g._metrics_start = time.perf_counter()
+
+
+def _after_request(response):
+    start = g.pop('_metrics_start', None)
+    if start is None:
+        return response
+    endpoint = request.endpoint or 'unmatched'
+    request_seconds.observe(time.perf_counter() - start, endpoint, request.method)
+    requests_total.inc(endpoint, request.method, str(response.status_code))
+    request_db_queries.observe(g.get('_metrics_db_queries', 0), endpoint)
+    request_db_seconds.observe(g.get('_metrics_db_seconds', 0.0), endpoint)
+    return response
+
+
+def _template_started(sender, template, context, **extra):
+    g.setdefault('_metrics_templates', []).append(time.perf_counter())
+
+
+def _template_finished(sender, template, context, **extra):
+    starts = g.get('_metrics_templates')
+    if starts:
+        template_seconds.observe(time.perf_counter() - starts.pop(), template.name or 'string')
+
+
+def metrics_view():
+    token = current_app.config.get('METRICS_TOKEN')
+    if token and not hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        abort(401)
+    return Response(render_latest(), content_type=CONTENT_TYPE)
+
+
+def init_app(app) -> None:
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+    before_render_template.connect(_template_started, app)
+    template_rendered.connect(_template_finished, app)
+    app.add_url_rule('/metrics', 'metrics', metrics_view)
@@ -0,0 +1,291 @@
+"""Versioned schema migrations.
+
+Each migration is a numbered function that runs once. Applied versions are
+recorded in schema_version, so an up-to-date database costs a single
+SELECT at startup however many migrations exist. Pending migrations run
+together in one BEGIN IMMEDIATE transaction, and the version is re-checked
+after the lock is taken. Workers that start at the same time therefore
+never apply a migration twice.
+
+Databases created before this runner existed were migrated by probing
+columns on every boot. The early migrations tolerate that half-migrated
+state: they check for a column before adding it, but only the first time
+they run.
+
+After migrating, the column layout of the main tables is read once and
+cached for the life of the process (see columns()).
+"""
+import logging
+import sqlite3
+
+import aggregates
+import db
+import dedup
+import geo
+import search
+import sync
+
+logger = logging.getLogger(__name__)
+
+MIGRATIONS = []
+LAYOUT_TABLES = ('users', 'reports', 'donations', 'contact_messages')
+_layout = {}
+
+
+def migration(version: int, description: str):
+    def register(fn):
+        if MIGRATIONS and version <= MIGRATIONS[-1][0]:
+            raise ValueError(f'migration {version} is out of order')
+        MIGRATIONS.append((version, description, fn))
+        return fn
+    return register
+
+
+def _has_column(cursor, table: str, column: str) -> bool:
+    cursor.execute(f'PRAGMA table_info({table})')
+    return any(row[1] == column for row in cursor.fetchall())
+
+
+def _add_column(cursor, table: str, column: str, declaration: str) -> None:
+    if not _has_column(cursor, table, column):
+        cursor.execute(f'ALTER TABLE {table} ADD COLUMN {column} {declaration}')
+
+
+@migration(1, 'core tables')
+def _core_tables(cursor):
+    # users uses 'name' per spec; legacy databases may still carry 'username'
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT,
+            email TEXT UNIQUE NOT NULL,
+            password_hash TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            preferred_language TEXT
+        )
+    ''')
+    _add_column(cursor, 'users', 'name', 'TEXT')
+    _add_column(cursor, 'users', 'preferred_language', 'TEXT')
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS reports (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            name TEXT,
+            email TEXT NOT NULL,
+            location TEXT NOT NULL,
+            disaster_type TEXT NOT NULL,
+            description TEXT NOT NULL,
+            image_path TEXT,
+            status TEXT DEFAULT 'pending',
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )
+    ''')
+    # Legacy databases used 'user_name'
+    _add_column(cursor, 'reports', 'name', 'TEXT')
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS donations (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            donor_name TEXT NOT NULL,
+            donor_email TEXT NOT NULL,
+            amount REAL NOT NULL CHECK (amount > 0),
+            currency TEXT NOT NULL DEFAULT 'USD',
+            purpose TEXT,
+            pay_via TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    # We already have created_at; no separate timestamp column (SQLite default issues)
+    _add_column(cursor, 'donations', 'payment_method', 'TEXT')
+    _add_column(cursor, 'donations', 'payment_reference', 'TEXT')
+    _add_column(cursor, 'donations', 'status', 'TEXT')
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS contact_messages (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            enquiry_type TEXT,
+            segment TEXT,
+            name TEXT,
+            email TEXT,
+            mobile TEXT,
+            city TEXT,
+            description TEXT,
+            time_slot TEXT,
+            captcha_entered TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+
+@migration(2, 'keyset pagination indexes')
+def _pagination_indexes(cursor):
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_reports_created ON reports (created_at)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_reports_type_created ON reports (disaster_type, created_at)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_donations_created ON donations (created_at)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_donations_status_created ON donations (status, created_at)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_donations_currency_created ON donations (currency, created_at)')
+
+
+@migration(3, 'full-text search over reports')
+def _report_search(cursor):
+    search.ensure_fts(cursor)
+
+
+@migration(4, 'report coordinates and R*Tree')
+def _report_coordinates(cursor):
+    _add_column(cursor, 'reports', 'latitude', 'REAL')
+    _add_column(cursor, 'reports', 'longitude', 'REAL')
+    geo.ensure_geo_index(cursor)
+
+
+@migration(5, 'donation totals')
+def _donation_totals(cursor):
+    aggregates.ensure_donation_totals(cursor)
+
+
+@migration(6, 'write-behind submission ids')
+def _submission_ids(cursor):
+    # Idempotency key for write-behind submissions (replayed with INSERT OR IGNORE)
+    _add_column(cursor, 'reports', 'submission_id', 'TEXT')
+    cursor.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_reports_submission '
+                   'ON reports (submission_id) WHERE submission_id IS NOT NULL')
+    _add_column(cursor, 'contact_messages', 'submission_id', 'TEXT')
+    cursor.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_contact_messages_submission '
+                   'ON contact_messages (submission_id) WHERE submission_id IS NOT NULL')
+
+
+@migration(7, 'near-duplicate report clusters')
+def _report_clusters(cursor):
+    # cluster_id points at the cluster's first report (NULL for that report)
+    _add_column(cursor, 'reports', 'cluster_id', 'INTEGER')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_reports_cluster ON reports (cluster_id)')
+    dedup.ensure_dedup_index(cursor)
+
+
+@migration(8, 'stripe webhook events and unique payment references')
+def _stripe_webhooks(cursor):
+    # One donation per Stripe payment: collapse earlier duplicates, keeping a Succeeded row if any.
+    # Removed rows are copied to duplicate_donations and logged, never just dropped from the ledger.
+    cursor.execute("UPDATE donations SET payment_reference = NULL WHERE payment_reference = ''")
+    cursor.execute('''
+        CREATE TEMP TABLE duplicate_donation_ids AS
+        SELECT id FROM (
+            SELECT id, ROW_NUMBER() OVER (
+                PARTITION BY payment_reference
+                ORDER BY status IS NOT 'Succeeded', id
+            ) AS rank FROM donations WHERE payment_reference IS NOT NULL
+        ) WHERE rank > 1
+    ''')
+    cursor.execute('CREATE TABLE IF NOT EXISTS duplicate_donations AS '
+                   'SELECT *, CURRENT_TIMESTAMP AS removed_at FROM donations WHERE 0')
+    cursor.execute('INSERT INTO duplicate_donations SELECT *, CURRENT_TIMESTAMP FROM donations '
+                   'WHERE id IN (SELECT id FROM duplicate_donation_ids)')
+    cursor.execute('SELECT id, payment_reference, amount, currency, status FROM donations '
+                   'WHERE id IN (SELECT id FROM duplicate_donation_ids) ORDER BY id')
+    for row in cursor.fetchall():
+        logger.warning('migration 8: moved duplicate donation %s (reference %s, %s %s, %s) '
+                       'to duplicate_donations', *row)
+    # The delete trigger takes them back out of donation_totals
+    cursor.execute('DELETE FROM donations WHERE id IN (SELECT id FROM duplicate_donation_ids)')
+    cursor.execute('DROP TABLE duplicate_donation_ids')
+    cursor.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_donations_payment_reference '
+                   'ON donations (payment_reference) WHERE payment_reference IS NOT NULL')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS stripe_events (
+            event_id TEXT PRIMARY KEY,
+            type TEXT NOT NULL,
+            payload TEXT NOT NULL,
+            received_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            processed_at TIMESTAMP,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            last_error TEXT
+        )
+    ''')
+
+
+@migration(9, 'triage claims')
+def _triage_claims(cursor):
+    _add_column(cursor, 'reports', 'claimed_by', 'INTEGER')
+    _add_column(cursor, 'reports', 'claimed_at', 'TIMESTAMP')
+    # The triage queue loads open incidents (pending cluster heads) on startup
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_reports_open ON reports (id) "
+                   "WHERE status = 'pending' AND cluster_id IS NULL")
+
+
+@migration(10, 'archive catalogue')
+def _archive_catalogue(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS archives (
+            month TEXT PRIMARY KEY,
+            path TEXT NOT NULL,
+            reports INTEGER NOT NULL DEFAULT 0,
+            donations INTEGER NOT NULL DEFAULT 0,
+            contact_messages INTEGER NOT NULL DEFAULT 0,
+            archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+
+@migration(11, 'report change log for delta sync')
+def _report_change_log(cursor):
+    sync.ensure_change_log(cursor)
+
+
+@migration(12, 'delta sync ignores updates to unsynced columns')
+def _report_change_log_columns(cursor):
+    cursor.execute('DROP TRIGGER IF EXISTS report_changes_au')
+    sync.ensure_change_log(cursor)
+
+
+def current_version(conn) -> int:
+    try:
+        return conn.execute('SELECT MAX(version) FROM schema_version').fetchone()[0] or 0
+    except sqlite3.OperationalError:
+        return 0
+
+
+def migrate(conn) -> list:
+    """Apply pending migrations and cache the column layout; returns applied versions."""
+    applied = []
+    if current_version(conn) < MIGRATIONS[-1][0]:
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS schema_version (
+                    version INTEGER PRIMARY KEY,
+                    description TEXT NOT NULL,
+                    applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+            # Another process may have migrated while we waited for the lock
+            version = current_version(conn)
+            cursor = conn.cursor()
+            for number, description, fn in MIGRATIONS:
+                if number <= version:
+                    continue
+                fn(cursor)
+                cursor.execute('INSERT INTO schema_version (version, description) VALUES (?, ?)',
+                               (number, description))
+                applied.append(number)
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+    load_layout(conn)
+    return applied
+
+
+def load_layout(conn) -> None:
+    for table in LAYOUT_TABLES:
+        _layout[table] = frozenset(row[1] for row in conn.execute(f'PRAGMA table_info({table})'))
+
+
+def columns(table: str) -> frozenset:
+    """Column names of ``table`` as resolved at startup."""
+    if table not in _layout:
+        # Imported without init_db() (e.g. under a WSGI server): resolve once on first use
+        with db.connection() as conn:
+            load_layout(conn)
+    return _layout[table]
@@ -0,0 +1,93 @@
+"""Keyset (cursor) pagination helpers shared by the listing APIs.
+
+A cursor is an opaque, URL-safe token wrapping the (created_at, id) pair of
+the last row on a page. Queries seek straight to that key through an index
+instead of paying OFFSET or full-sort costs.
+"""
+import base64
+import json
+from datetime import datetime, timedelta
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+
+class CursorError(ValueError):
+    """Raised for malformed cursor, page-size or time-range parameters."""
+
+
+def encode_cursor(created_at, row_id) -> str:
+    raw = json.dumps([created_at, row_id], separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(token: str):
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        created_at, row_id = json.loads(base64.urlsafe_b64decode(padded))
+        return str(created_at), int(row_id)
+    except Exception:
+        raise CursorError('Invalid cursor')
+
+
+def page_size(value, default: int = DEFAULT_PAGE_SIZE, maximum: int = MAX_PAGE_SIZE) -> int:
+    if value in (None, ''):
+        return default
+    try:
+        size = int(value)
+    except (TypeError, ValueError):
+        raise CursorError('Invalid page size')
+    if size < 1:
+        raise CursorError('Invalid page size')
+    return min(size, maximum)
+
+
+def time_bound(value, end: bool = False):
+    """Normalize a ``from``/``to`` query value to SQLite's timestamp format.
+
+    A bare date used as an upper bound covers that whole day, so the caller
+    compares with ``<`` against the start of the next day.
+    """
+    if not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        raise CursorError('Invalid date, use YYYY-MM-DD or YYYY-MM-DD HH:MM:SS')
+    if end and len(value) == 10:
+        parsed += timedelta(days=1)
+    return parsed.strftime('%Y-%m-%d %H:%M:%S')
+
+
+def keyset_clause(args, column: str = 'created_at', id_column: str = 'id'):
+    """Build the seek predicate and ORDER BY for newest-first keyset paging.
+
+    ``after`` pages towards older rows, ``before`` towards newer ones. Returns
+    ``(where_sql, params, order_sql, reverse)``; when ``reverse`` is true the
+    caller must flip the fetched rows back into newest-first order.
+    """
+    after = args.get('after', '')
+    before = args.get('before', '')
+    if after and before:
+        raise CursorError('Use either after or before, not both')
+    if after:
+        created_at, row_id = decode_cursor(after)
+        return (f' AND ({column}, {id_column}) < (?, ?)', [created_at, row_id],
+                f' ORDER BY {column} DESC, {id_column} DESC', False)
+    if before:
+        created_at, row_id = decode_cursor(before)
+        return (f' AND ({column}, {id_column}) > (?, ?)', [created_at, row_id],
+                f' ORDER BY {column} ASC, {id_column} ASC', True)
+    return '', [], f' ORDER BY {column} DESC, {id_column} DESC', False
+
+
+def page_links(rows, has_more: bool, args, key=lambda row: (row['created_at'], row['id'])):
+    """Cursors for the neighbouring pages of a newest-first result list."""
+    if not rows:
+        return None, None
+    paging_back = bool(args.get('before'))
+    newest, oldest = key(rows[0]), key(rows[-1])
+    # When paging back towards newer rows the "more" probe ran at the top end
+    next_cursor = encode_cursor(*oldest) if (has_more or paging_back) else None
+    prev_cursor = encode_cursor(*newest) if (args.get('after') or (paging_back and has_more)) else None
+    return next_cursor, prev_cursor
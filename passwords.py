@@ -0,0 +1,134 @@
+"""Password hashing off the request thread.
+
+generate_password_hash/check_password_hash are deliberately CPU-expensive.
+They run in a bounded process pool so a burst of logins uses spare cores
+instead of starving other routes on the worker. Admission control caps how
+many hashes may be queued or running; past that limit callers get
+HashingBusy right away and the route answers 503 with Retry-After.
+"""
+import atexit
+import multiprocessing
+import os
+import sys
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+# Werkzeug method string, e.g. 'scrypt:32768:8:1' or 'pbkdf2:sha256:600000'
+HASH_METHOD = os.getenv('PASSWORD_HASH_METHOD', 'scrypt:32768:8:1')
+SALT_LENGTH = int(os.getenv('PASSWORD_SALT_LENGTH', '16'))
+HASH_WORKERS = int(os.getenv('PASSWORD_HASH_WORKERS', str(os.cpu_count() or 2)))
+MAX_PENDING = int(os.getenv('PASSWORD_HASH_MAX_PENDING', str(HASH_WORKERS * 4)))
+HASH_TIMEOUT = float(os.getenv('PASSWORD_HASH_TIMEOUT', '10'))
+RETRY_AFTER_SECONDS = 2
+
+
+class HashingBusy(RuntimeError):
+    """Raised when the hashing queue is full; callers should answer 503."""
+
+
+_executor = None
+_executor_lock = threading.Lock()
+_slots = threading.BoundedSemaphore(MAX_PENDING)
+_method_prefix = None   # what generate_password_hash writes before the first '$' for HASH_METHOD
+
+
+def _get_executor() -> ProcessPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            # spawn: never fork a multi-threaded web worker
+            _executor = ProcessPoolExecutor(max_workers=HASH_WORKERS,
+                                            mp_context=multiprocessing.get_context('spawn'))
+        return _executor
+
+
+def _reset_executor(broken: ProcessPoolExecutor) -> None:
+    global _executor
+    with _executor_lock:
+        if _executor is broken:
+            _executor = None
+    _shutdown(broken)
+
+
+def _shutdown(executor: ProcessPoolExecutor) -> None:
+    if sys.version_info >= (3, 9):
+        executor.shutdown(wait=False, cancel_futures=True)
+    else:  # pragma: no cover - queued hashes still run to completion
+        executor.shutdown(wait=False)
+
+
+def _release_slot(future) -> None:
+    _slots.release()
+
+
+def _submit(fn, *args):
+    """Queue ``fn`` in the pool; its slot is held until the worker actually finishes."""
+    if not _slots.acquire(blocking=False):
+        raise HashingBusy('password hashing queue is full')
+    try:
+        executor = _get_executor()
+        try:
+            future = executor.submit(fn, *args)
+        except BrokenProcessPool:
+            _reset_executor(executor)
+            executor = _get_executor()
+            future = executor.submit(fn, *args)
+    except BaseException:
+        _slots.release()
+        raise
+    # Released on completion, not on timeout: a timed-out hash keeps its worker busy
+    future.add_done_callback(_release_slot)
+    return executor, future
+
+
+def _run(fn, *args):
+    executor, future = _submit(fn, *args)
+    try:
+        try:
+            return future.result(timeout=HASH_TIMEOUT)
+        except BrokenProcessPool:
+            _reset_executor(executor)
+            return _submit(fn, *args)[1].result(timeout=HASH_TIMEOUT)
+    except FutureTimeout:
+        raise HashingBusy('password hashing timed out')
+
+
+def hash_password(password: str) -> str:
+    global _method_prefix
+    password_hash = _run(generate_password_hash, password, HASH_METHOD, SALT_LENGTH)
+    _method_prefix = password_hash.split('$', 1)[0]
+    return password_hash
+
+
+def needs_rehash(password_hash: str) -> bool:
+    """True when a stored hash was made with different parameters than HASH_METHOD.
+
+    HASH_METHOD may leave parameters to werkzeug's defaults ('pbkdf2:sha256'),
+    so stored hashes are compared with the prefix werkzeug actually writes. It is
+    learned from one throwaway hash; while the pool is busy nothing is rehashed.
+    """
+    global _method_prefix
+    if _method_prefix is None:
+        try:
+            _method_prefix = _run(generate_password_hash, '', HASH_METHOD, 1).split('$', 1)[0]
+        except HashingBusy:
+            return False
+    return password_hash.split('$', 1)[0] != _method_prefix
+
+
+def verify_password(password_hash: str, password: str) -> bool:
+    return _run(check_password_hash, password_hash, password)
+
+
+def shutdown() -> None:
+    global _executor
+    with _executor_lock:
+        executor, _executor = _executor, None
+    if executor is not None:
+        _shutdown(executor)
+
+
+atexit.register(shutdown)
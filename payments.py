@@ -0,0 +1,283 @@
+"""Stripe integration: guarded API calls and webhook-driven donation recording.
+
+Outbound calls go through one keep-alive HTTP client with a hard timeout and
+a small number of network retries. A circuit breaker sits in front of it.
+After STRIPE_BREAKER_FAILURES consecutive connection/5xx failures, calls
+fail fast with StripeUnavailable for STRIPE_BREAKER_RESET seconds instead
+of tying up request threads. STRIPE_API_BASE can point at a local stand-in
+such as stripe-mock. The ``*_async`` variants used by asgi.py share the
+breaker and await Stripe over httpx instead of blocking a thread.
+
+Donations are recorded from Stripe's webhooks rather than from the donor's
+browser returning to /success. /stripe/webhook verifies the signature,
+stores the raw event in stripe_events (deduplicated by event ID) and answers
+straight away. A background worker then applies events. It retries with
+exponential backoff and replays anything unprocessed after a restart. Every
+write is an upsert keyed on donations.payment_reference, so redelivered
+events, reloads of /success and the webhook racing the browser all end up
+as one row.
+"""
+import json
+import logging
+import os
+import queue
+import threading
+import time
+
+import stripe
+
+try:
+    import httpx
+except ImportError:  # pragma: no cover - only needed for the async Stripe calls in asgi.py
+    httpx = None
+
+import db
+import metrics
+from cache import response_cache
+
+logger = logging.getLogger(__name__)
+
+TIMEOUT = int(os.getenv('STRIPE_TIMEOUT', '10'))
+NETWORK_RETRIES = int(os.getenv('STRIPE_NETWORK_RETRIES', '2'))
+BREAKER_FAILURES = int(os.getenv('STRIPE_BREAKER_FAILURES', '5'))
+BREAKER_RESET = float(os.getenv('STRIPE_BREAKER_RESET', '30'))
+MAX_ATTEMPTS = 8
+RETRY_BASE_DELAY = 2.0
+
+# Events that settle a Checkout Session, and the donation status each implies
+SESSION_EVENTS = {
+    'checkout.session.completed': None,          # depends on payment_status
+    'checkout.session.async_payment_succeeded': 'Succeeded',
+    'checkout.session.async_payment_failed': 'Failed',
+    'checkout.session.expired': 'Cancelled',
+}
+
+
+class StripeUnavailable(RuntimeError):
+    """Raised while the circuit breaker is open."""
+
+
+class CircuitBreaker:
+    """Consecutive-failure breaker with a single half-open probe."""
+
+    def __init__(self, failure_threshold: int = BREAKER_FAILURES, reset_timeout: float = BREAKER_RESET):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._opened_at is None:
+                return 'closed'
+            return 'half-open' if time.monotonic() - self._opened_at >= self.reset_timeout else 'open'
+
+    def _admit(self) -> None:
+        with self._lock:
+            if self._opened_at is None:
+                return
+            if self._probing or time.monotonic() - self._opened_at < self.reset_timeout:
+                raise StripeUnavailable('payment provider is unavailable, please try again shortly')
+            self._probing = True
+
+    def _record(self, ok: bool) -> None:
+        with self._lock:
+            self._probing = False
+            if ok:
+                self._failures = 0
+                self._opened_at = None
+                return
+            self._failures += 1
+            if self._opened_at is not None or self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+
+    def call(self, fn, *args, **kwargs):
+        self._admit()
+        try:
+            result = fn(*args, **kwargs)
+        except (stripe.APIConnectionError, stripe.APIError, stripe.RateLimitError):
+            self._record(False)
+            raise
+        except BaseException:
+            # Card declines, bad parameters etc. mean Stripe answered; they don't trip the breaker
+            self._record(True)
+            raise
+        self._record(True)
+        return result
+
+    async def call_async(self, fn, *args, **kwargs):
+        """Same as call() for a coroutine function (the ASGI entry point's Stripe calls)."""
+        self._admit()
+        try:
+            result = await fn(*args, **kwargs)
+        except (stripe.APIConnectionError, stripe.APIError, stripe.RateLimitError):
+            self._record(False)
+            raise
+        except BaseException:
+            self._record(True)
+            raise
+        self._record(True)
+        return result
+
+
+breaker = CircuitBreaker()
+
+
+def configure(api_key: str) -> None:
+    stripe.api_key = api_key
+    # The *_async calls made under asgi.py go through httpx when it is installed
+    async_client = stripe.HTTPXClient(timeout=TIMEOUT) if httpx is not None else None
+    stripe.default_http_client = stripe.http_client.RequestsClient(timeout=TIMEOUT, async_fallback_client=async_client)
+    stripe.max_network_retries = NETWORK_RETRIES
+    if os.getenv('STRIPE_API_BASE'):
+        stripe.api_base = os.getenv('STRIPE_API_BASE')
+
+
+def create_checkout_session(**params):
+    with metrics.stripe_call('checkout.Session.create'):
+        return breaker.call(stripe.checkout.Session.create, **params)
+
+
+def retrieve_checkout_session(session_id: str, **params):
+    with metrics.stripe_call('checkout.Session.retrieve'):
+        return breaker.call(stripe.checkout.Session.retrieve, session_id, **params)
+
+
+async def create_checkout_session_async(**params):
+    with metrics.stripe_call('checkout.Session.create'):
+        return await breaker.call_async(stripe.checkout.Session.create_async, **params)
+
+
+async def retrieve_checkout_session_async(session_id: str, **params):
+    with metrics.stripe_call('checkout.Session.retrieve'):
+        return await breaker.call_async(stripe.checkout.Session.retrieve_async, session_id, **params)
+
+
+def record_donation(cursor, payment_reference: str, fields: dict, status: str) -> None:
+    """Insert or update the donation for a payment; a Succeeded row is never downgraded."""
+    cursor.execute('''
+        INSERT INTO donations (donor_name, donor_email, amount, currency, purpose, pay_via,
+                               payment_method, payment_reference, status)
+        VALUES (?, ?, ?, ?, ?, ?, 'Stripe Checkout', ?, ?)
+        ON CONFLICT (payment_reference) WHERE payment_reference IS NOT NULL DO UPDATE SET
+            status = excluded.status,
+            amount = CASE WHEN excluded.amount > 0 THEN excluded.amount ELSE donations.amount END
+        WHERE donations.status IS NOT 'Succeeded'
+    ''', (
+        fields.get('donor_name', ''),
+        fields.get('donor_email', ''),
+        float(fields.get('amount') or 0),
+        (fields.get('currency') or 'USD').upper(),
+        fields.get('purpose', ''),
+        fields.get('pay_via', 'Other'),
+        payment_reference,
+        status,
+    ))
+
+
+def _session_fields(session_obj: dict) -> dict:
+    metadata = dict(session_obj.get('metadata') or {})
+    if session_obj.get('amount_total') is not None:
+        metadata['amount'] = session_obj['amount_total'] / 100
+    if session_obj.get('currency'):
+        metadata.setdefault('currency', session_obj['currency'])
+    if not metadata.get('donor_email'):
+        metadata['donor_email'] = (session_obj.get('customer_details') or {}).get('email') or ''
+    return metadata
+
+
+def apply_event(cursor, event: dict) -> bool:
+    """Apply one Stripe event; returns False for event types we ignore."""
+    if event.get('type') not in SESSION_EVENTS:
+        return False
+    session_obj = event['data']['object']
+    status = SESSION_EVENTS[event['type']]
+    if status is None:
+        # Delayed payment methods complete the session before the money arrives
+        status = 'Succeeded' if session_obj.get('payment_status') in ('paid', 'no_payment_required') else 'Pending'
+    record_donation(cursor, session_obj['id'], _session_fields(session_obj), status)
+    return True
+
+
+class WebhookProcessor:
+    def __init__(self):
+        self._queue = queue.Queue()
+        self._worker = None
+        self._lock = threading.Lock()
+
+    def receive(self, event: dict) -> bool:
+        """Durably store a verified event and queue it; False if it was a redelivery."""
+        with db.connection() as conn:
+            cursor = conn.execute(
+                'INSERT OR IGNORE INTO stripe_events (event_id, type, payload) VALUES (?, ?, ?)',
+                (event['id'], event['type'], json.dumps(event)))
+            new = cursor.rowcount == 1
+        if new:
+            self._ensure_worker()
+            self._queue.put((event['id'], 1))
+        return new
+
+    def start(self) -> None:
+        """Requeue events that were stored but not processed before the last shutdown."""
+        with db.connection() as conn:
+            pending = conn.execute('SELECT event_id, attempts FROM stripe_events '
+                                   'WHERE processed_at IS NULL AND attempts < ?', (MAX_ATTEMPTS,)).fetchall()
+        self._ensure_worker()
+        for event_id, attempts in pending:
+            self._queue.put((event_id, attempts + 1))
+
+    def stop(self, timeout: float = 10.0) -> None:
+        """Let the event being applied finish; the rest stay stored for the next start()."""
+        with self._lock:
+            worker, self._worker = self._worker, None
+        if worker is not None and worker.is_alive():
+            self._queue.put(None)
+            worker.join(timeout)
+
+    def _ensure_worker(self) -> None:
+        with self._lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name='stripe-webhooks', daemon=True)
+                self._worker.start()
+
+    def _run(self) -> None:
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            event_id, attempt = item
+            try:
+                self.process(event_id)
+            except Exception as e:
+                logger.exception('stripe event %s failed (attempt %d)', event_id, attempt)
+                self._failed(event_id, attempt, e)
+
+    def process(self, event_id: str) -> None:
+        with db.connection() as conn:
+            row = conn.execute('SELECT payload FROM stripe_events WHERE event_id = ? AND processed_at IS NULL',
+                               (event_id,)).fetchone()
+            if row is None:
+                return
+            applied = apply_event(conn.cursor(), json.loads(row[0]))
+            conn.execute("UPDATE stripe_events SET processed_at = CURRENT_TIMESTAMP, last_error = NULL "
+                         "WHERE event_id = ?", (event_id,))
+        if applied:
+            response_cache.invalidate('donations')
+
+    def _failed(self, event_id: str, attempt: int, error: Exception) -> None:
+        try:
+            with db.connection() as conn:
+                conn.execute('UPDATE stripe_events SET attempts = ?, last_error = ? WHERE event_id = ?',
+                             (attempt, str(error)[:500], event_id))
+        except Exception:
+            logger.exception('could not record failure for stripe event %s', event_id)
+        if attempt < MAX_ATTEMPTS:
+            timer = threading.Timer(RETRY_BASE_DELAY * 2 ** (attempt - 1), self._queue.put, ((event_id, attempt + 1),))
+            timer.daemon = True
+            timer.start()
+
+
+webhooks = WebhookProcessor()
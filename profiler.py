@@ -0,0 +1,126 @@
+"""Opt-in sampling profiler for slow requests.
+
+With PROFILE_SLOW_MS set, a background thread samples the Python stack of
+every thread that is serving a request, every PROFILE_INTERVAL_MS
+milliseconds. A request that takes longer than the threshold has its samples
+written to PROFILE_DIR as a ``.folded`` file. The format is one
+``frame;frame;frame count`` line per distinct stack, which flamegraph.pl,
+speedscope and inferno read directly. Faster requests throw their samples
+away.
+
+Samples are kept per request, not per thread. Under the ASGI server a native
+view's hooks run on executor threads and its teardown on the event loop; the
+hook thread is sampled until the view takes over (release_thread()), and
+after that only the request's wall time is measured.
+"""
+import collections
+import logging
+import os
+import sys
+import threading
+import time
+
+from flask import g, request
+
+logger = logging.getLogger(__name__)
+
+SLOW_MS = float(os.getenv('PROFILE_SLOW_MS', '0'))
+INTERVAL_MS = float(os.getenv('PROFILE_INTERVAL_MS', '5'))
+PROFILE_DIR = os.getenv('PROFILE_DIR', 'profiles')
+MAX_DEPTH = 128
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f'{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})'.replace(';', ',')
+
+
+def _folded_stack(frame) -> str:
+    labels = []
+    while frame is not None and len(labels) < MAX_DEPTH:
+        labels.append(_frame_label(frame))
+        frame = frame.f_back
+    return ';'.join(reversed(labels))
+
+
+class SamplingProfiler:
+    def __init__(self, slow_ms: float = SLOW_MS, interval_ms: float = INTERVAL_MS, output_dir: str = PROFILE_DIR):
+        self.slow_seconds = slow_ms / 1000
+        self.interval = interval_ms / 1000
+        self.output_dir = output_dir
+        self._active = {}          # request token -> [thread id or None, Counter of folded stacks]
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def init_app(self, app) -> None:
+        os.makedirs(self.output_dir, exist_ok=True)
+        app.before_request(self._before_request)
+        app.teardown_request(self._teardown_request)
+
+    def _ensure_sampler(self) -> None:
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name='profiler', daemon=True)
+            self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            time.sleep(self.interval)
+            with self._lock:
+                if not self._active:
+                    continue
+                frames = sys._current_frames()
+                for thread_id, samples in self._active.values():
+                    frame = frames.get(thread_id) if thread_id is not None else None
+                    if frame is not None:
+                        samples[_folded_stack(frame)] += 1
+
+    def _before_request(self):
+        g._profile_start = time.perf_counter()
+        g._profile_token = token = object()
+        g._profile_entry = [threading.get_ident(), collections.Counter()]
+        with self._lock:
+            self._active[token] = g._profile_entry
+            self._ensure_sampler()
+
+    def _teardown_request(self, exc=None):
+        with self._lock:
+            entry = self._active.pop(g.pop('_profile_token', None), None)
+        g.pop('_profile_entry', None)
+        start = g.pop('_profile_start', None)
+        if start is None or entry is None:
+            return
+        elapsed = time.perf_counter() - start
+        if elapsed < self.slow_seconds:
+            return
+        samples = entry[1]
+        if not samples:
+            logger.warning('slow request %s %s took %.0f ms; no samples from its threads',
+                           request.method, request.path, elapsed * 1000)
+            return
+        endpoint = (request.endpoint or 'unmatched').replace('/', '_')
+        path = os.path.join(self.output_dir, f'{time.strftime("%Y%m%d-%H%M%S")}-{endpoint}-{int(elapsed * 1000)}ms.folded')
+        try:
+            with open(path, 'w') as f:
+                for stack, count in samples.most_common():
+                    f.write(f'{stack} {count}\n')
+        except OSError:
+            logger.exception('could not write profile %s', path)
+        else:
+            logger.warning('slow request %s %s took %.0f ms; profile written to %s',
+                           request.method, request.path, elapsed * 1000, path)
+
+
+def release_thread() -> None:
+    """Stop sampling the current thread for this request; it is going back to a pool."""
+    entry = g.get('_profile_entry')
+    if entry is not None:
+        entry[0] = None
+
+
+def init_app(app):
+    """Install the profiler when PROFILE_SLOW_MS is set; returns it (or None)."""
+    if SLOW_MS <= 0:
+        return None
+    profiler = SamplingProfiler()
+    profiler.init_app(app)
+    return profiler
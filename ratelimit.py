@@ -0,0 +1,238 @@
+"""Per-client rate limiting and priority load shedding.
+
+Rate limiting: every endpoint with a budget gets a token bucket per client.
+The client is the logged-in user, or the socket address otherwise. Proxy
+trust is opt-in: with RATE_LIMIT_TRUSTED_PROXIES set to the number of
+reverse proxies in front of the app, the address is the X-Forwarded-For
+entry the outermost proxy added. The header is only read on requests whose
+peer is in RATE_LIMIT_PROXY_NETWORKS (default: loopback), so clients that
+connect directly cannot pick their own bucket with a forged header.
+Buckets refill continuously, so a budget of 10 per 60s allows a burst of 10
+and then one request every 6 seconds. Buckets live in process memory, or in
+a shared SQLite file (RATE_LIMIT_PATH) so several workers enforce one budget.
+A rejected request gets 429 with Retry-After.
+
+Load shedding: requests are classed as critical (incident report
+submission), normal, or low (donation listings, report exports, contact
+form). When more than SHED_MAX_INFLIGHT requests are in flight, or the front proxy
+reports (X-Request-Start) that requests queued longer than
+SHED_TARGET_DELAY_MS, low-priority requests are turned away with 503
+first. Normal requests are shed only at twice those limits, and critical
+requests are always admitted.
+"""
+import ipaddress
+import math
+import os
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+from flask import g, jsonify, request, session
+from werkzeug.exceptions import ServiceUnavailable, TooManyRequests
+
+import db
+import metrics
+
+Budget = namedtuple('Budget', 'capacity period methods')
+
+# endpoint -> Budget(requests, per seconds, methods counted); None methods = all
+BUDGETS = {
+    'login': Budget(10, 60, ('POST',)),
+    'register': Budget(5, 300, ('POST',)),
+    'contact': Budget(5, 300, ('POST',)),
+    'create_checkout_session': Budget(10, 60, ('POST',)),
+    'donate': Budget(10, 60, ('POST',)),
+    'get_donations': Budget(60, 60, None),
+    'donations_summary': Budget(60, 60, None),
+    'api_reports': Budget(120, 60, None),
+    'report': Budget(30, 60, ('POST',)),
+    'api_reports_bulk': Budget(10, 60, None),
+}
+DEFAULT_BUDGET = Budget(300, 60, None)
+# Static files, health/metrics, webhooks and long-lived streams are never limited or shed
+EXEMPT = {'static', 'assets', 'uploaded_file', 'thumbnail', 'metrics', 'stripe_webhook', 'api_reports_stream'}
+
+CRITICAL, NORMAL, LOW = 0, 1, 2
+PRIORITIES = {
+    ('report', 'POST'): CRITICAL,
+    ('get_donations', None): LOW,
+    ('donations_summary', None): LOW,
+    ('contact', None): LOW,
+    ('api_reports_bulk', 'GET'): LOW,
+}
+PRIORITY_NAMES = {CRITICAL: 'critical', NORMAL: 'normal', LOW: 'low'}
+
+TRUSTED_PROXIES = int(os.getenv('RATE_LIMIT_TRUSTED_PROXIES', '0'))
+PROXY_NETWORKS = [ipaddress.ip_network(network.strip(), strict=False) for network in
+                  os.getenv('RATE_LIMIT_PROXY_NETWORKS', '127.0.0.0/8,::1/128').split(',') if network.strip()]
+
+MAX_TRACKED_CLIENTS = 100_000
+PRUNE_EVERY = 1000
+IDLE_SECONDS = 3600
+
+
+class _MemoryBuckets:
+    def __init__(self, max_keys: int = MAX_TRACKED_CLIENTS):
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()   # key -> (tokens, updated)
+        self._lock = threading.Lock()
+
+    def take(self, key: str, capacity: float, rate: float, now: float):
+        """Consume one token; returns (allowed, seconds until the next token)."""
+        with self._lock:
+            tokens, updated = self._buckets.pop(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - updated) * rate)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            self._buckets[key] = (tokens, now)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return allowed, 0.0 if allowed else (1 - tokens) / rate
+
+
+class _SQLiteBuckets:
+    """Buckets shared between workers; each take() is a single atomic upsert."""
+
+    def __init__(self, path: str):
+        self.pool = db.ConnectionPool(path, size=4)
+        self._calls = 0
+        with self.pool.connection() as conn:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS rate_limits (
+                    key TEXT PRIMARY KEY,
+                    tokens REAL NOT NULL,
+                    updated REAL NOT NULL,
+                    allowed INTEGER NOT NULL
+                )
+            ''')
+
+    def take(self, key: str, capacity: float, rate: float, now: float):
+        refill = 'MIN(:capacity, tokens + (:now - updated) * :rate)'
+        with self.pool.connection() as conn:
+            tokens, allowed = conn.execute(f'''
+                INSERT INTO rate_limits (key, tokens, updated, allowed) VALUES (:key, :capacity - 1, :now, 1)
+                ON CONFLICT (key) DO UPDATE SET
+                    tokens = CASE WHEN {refill} >= 1 THEN {refill} - 1 ELSE {refill} END,
+                    allowed = {refill} >= 1,
+                    updated = :now
+                RETURNING tokens, allowed
+            ''', {'key': key, 'capacity': capacity, 'rate': rate, 'now': now}).fetchone()
+            self._calls += 1
+            if self._calls % PRUNE_EVERY == 0:
+                conn.execute('DELETE FROM rate_limits WHERE updated < ?', (now - IDLE_SECONDS,))
+        return bool(allowed), 0.0 if allowed else (1 - tokens) / rate
+
+
+class LoadShedder:
+    def __init__(self, max_inflight: int, target_delay: float):
+        self.max_inflight = max_inflight
+        self.target_delay = target_delay
+        self.inflight = 0
+        self._lock = threading.Lock()
+
+    def admit(self, priority: int, queue_delay: float) -> bool:
+        with self._lock:
+            if priority != CRITICAL:
+                # LOW sheds at the configured limits, NORMAL only at twice them
+                factor = 1 if priority == LOW else 2
+                if self.inflight >= self.max_inflight * factor or queue_delay > self.target_delay * factor:
+                    return False
+            self.inflight += 1
+            return True
+
+    def release(self) -> None:
+        with self._lock:
+            self.inflight -= 1
+
+
+def _queue_delay() -> float:
+    """Seconds the request waited in front of the app, from nginx/Heroku-style X-Request-Start."""
+    value = request.headers.get('X-Request-Start', '').strip()
+    if value.startswith('t='):
+        value = value[2:]
+    try:
+        started = float(value)
+    except ValueError:
+        return 0.0
+    # Accept seconds, milliseconds or microseconds since the epoch
+    while started > 1e11:
+        started /= 1000
+    return max(0.0, time.time() - started)
+
+
+def _from_proxy(address: str) -> bool:
+    try:
+        peer = ipaddress.ip_address(address)
+    except ValueError:
+        return False
+    return any(peer in network for network in PROXY_NETWORKS)
+
+
+def _client_address() -> str:
+    """The real client address: behind trusted proxies, the one the outermost proxy saw."""
+    address = request.remote_addr
+    if TRUSTED_PROXIES and address and _from_proxy(address):
+        forwarded = [hop.strip() for hop in request.headers.get('X-Forwarded-For', '').split(',') if hop.strip()]
+        if len(forwarded) >= TRUSTED_PROXIES:
+            return forwarded[-TRUSTED_PROXIES]
+    return address
+
+
+def _client_key() -> str:
+    user_id = session.get('user_id')
+    return f'user:{user_id}' if user_id else f'ip:{_client_address()}'
+
+
+def _reject(error, retry_after: float, message: str):
+    retry = str(max(1, math.ceil(retry_after)))
+    if request.path.startswith('/api/') or request.is_json:
+        return jsonify({'error': message}), error.code, {'Retry-After': retry}
+    response = error(message).get_response()
+    response.headers['Retry-After'] = retry
+    return response
+
+
+class RateLimiter:
+    def __init__(self, app=None):
+        self.buckets = _MemoryBuckets()
+        self.shedder = LoadShedder(int(os.getenv('SHED_MAX_INFLIGHT', '64')),
+                                   float(os.getenv('SHED_TARGET_DELAY_MS', '100')) / 1000)
+        self.enabled = os.getenv('RATE_LIMIT_ENABLED', '1').lower() not in ('0', 'false', 'no')
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app) -> None:
+        if os.getenv('RATE_LIMIT_PATH'):
+            self.buckets = _SQLiteBuckets(os.getenv('RATE_LIMIT_PATH'))
+        app.before_request(self._before_request)
+        app.teardown_request(self._teardown_request)
+
+    def _budget(self, endpoint: str):
+        budget = BUDGETS.get(endpoint, DEFAULT_BUDGET)
+        if budget.methods and request.method not in budget.methods:
+            return None
+        return budget
+
+    def _before_request(self):
+        endpoint = request.endpoint
+        if endpoint is None or endpoint in EXEMPT:
+            return None
+        budget = self._budget(endpoint) if self.enabled else None
+        if budget is not None:
+            allowed, retry_after = self.buckets.take(f'{endpoint}:{_client_key()}', budget.capacity,
+                                                     budget.capacity / budget.period, time.time())
+            if not allowed:
+                metrics.rate_limited.inc(endpoint)
+                return _reject(TooManyRequests, retry_after, 'Too many requests, please slow down.')
+
+        priority = PRIORITIES.get((endpoint, request.method), PRIORITIES.get((endpoint, None), NORMAL))
+        if not self.shedder.admit(priority, _queue_delay()):
+            metrics.shed.inc(endpoint, PRIORITY_NAMES[priority])
+            return _reject(ServiceUnavailable, 5, 'The server is busy, please try again shortly.')
+        g._shed_admitted = True
+        return None
+
+    def _teardown_request(self, exc=None):
+        if g.pop('_shed_admitted', False):
+            self.shedder.release()
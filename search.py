@@ -0,0 +1,83 @@
+"""FTS5 full-text index over incident reports.
+
+reports_fts is an external-content FTS5 table shadowing reports.location and
+reports.description. Triggers keep it current, and init_db backfills it the
+first time it is created. Searches become ranked token/prefix lookups
+("Mumb" matches "Mumbai") instead of LIKE '%...%' scans.
+"""
+import re
+import sqlite3
+
+_TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+_fts_available = None
+
+
+def ensure_fts(cursor) -> bool:
+    """Create the FTS table and sync triggers; backfill on first creation.
+
+    Returns False when the SQLite build lacks FTS5, in which case searches
+    fall back to LIKE.
+    """
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'reports_fts'")
+    exists = cursor.fetchone() is not None
+    try:
+        cursor.execute('''
+            CREATE VIRTUAL TABLE IF NOT EXISTS reports_fts USING fts5(
+                location, description,
+                content='reports', content_rowid='id',
+                tokenize='unicode61 remove_diacritics 2',
+                prefix='2 3'
+            )
+        ''')
+    except sqlite3.OperationalError:
+        return False
+
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS reports_fts_ai AFTER INSERT ON reports BEGIN
+            INSERT INTO reports_fts (rowid, location, description)
+            VALUES (new.id, new.location, new.description);
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS reports_fts_ad AFTER DELETE ON reports BEGIN
+            INSERT INTO reports_fts (reports_fts, rowid, location, description)
+            VALUES ('delete', old.id, old.location, old.description);
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS reports_fts_au AFTER UPDATE OF location, description ON reports BEGIN
+            INSERT INTO reports_fts (reports_fts, rowid, location, description)
+            VALUES ('delete', old.id, old.location, old.description);
+            INSERT INTO reports_fts (rowid, location, description)
+            VALUES (new.id, new.location, new.description);
+        END
+    ''')
+    if not exists:
+        cursor.execute("INSERT INTO reports_fts (reports_fts) VALUES ('rebuild')")
+    return True
+
+
+def fts_available(conn) -> bool:
+    """Whether reports_fts exists; checked once per process."""
+    global _fts_available
+    if _fts_available is None:
+        row = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'reports_fts'").fetchone()
+        _fts_available = row is not None
+    return _fts_available
+
+
+def match_expression(text: str, column: str = None):
+    """Turn free user input into a safe FTS5 prefix query.
+
+    Every word becomes a quoted prefix term and all terms must match, so
+    punctuation or FTS operators typed by users never reach the parser.
+    Returns None when the input has no searchable tokens.
+    """
+    tokens = _TOKEN_RE.findall(text or '')
+    if not tokens:
+        return None
+    terms = ' '.join(f'"{token}"*' for token in tokens)
+    if column:
+        return f'{column} : ({terms})'
+    return f'({terms})'
@@ -0,0 +1,137 @@
+"""Server-side sessions shared by every worker.
+
+Flask's default session serialises the whole session into a signed cookie.
+Every request then carries the checkout draft, flashes and language back
+and forth, and every worker must share one secret_key. With this interface
+the cookie holds only a random 256-bit session ID. The data lives in a
+SQLite file (SESSION_STORE_PATH) that all workers on a host open, so
+no request needs to be pinned to the worker that created its session.
+
+Rows expire after SESSION_TTL_HOURS without use. An unchanged session only
+has its expiry pushed forward once per TOUCH_SECONDS, so read-only page
+views cost one indexed SELECT and no write. Expired rows are deleted every
+PRUNE_EVERY saves. The session ID is replaced whenever the logged-in user
+changes (login, logout), so an ID planted before login is useless after it.
+"""
+import os
+import secrets
+import time
+
+from flask.sessions import SecureCookieSession, SessionInterface, session_json_serializer
+
+import db
+
+STORE_PATH = os.getenv('SESSION_STORE_PATH', 'sessions.db')
+TTL_SECONDS = float(os.getenv('SESSION_TTL_HOURS', '168')) * 3600
+TOUCH_SECONDS = 3600
+PRUNE_EVERY = 1000
+SID_BYTES = 32
+
+
+class ServerSession(SecureCookieSession):
+    def __init__(self, initial=None, sid: str = None, expires: float = 0.0):
+        super().__init__(initial)
+        self.sid = sid
+        self.expires = expires
+        # The user the session was loaded for; a change means the ID must be rotated
+        self.loaded_user = self.get('user_id')
+
+
+class SQLiteSessionStore:
+    def __init__(self, path: str = STORE_PATH):
+        self.pool = db.ConnectionPool(path, size=4)
+        self._saves = 0
+        with self.pool.connection() as conn:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS sessions (
+                    sid TEXT PRIMARY KEY,
+                    data TEXT NOT NULL,
+                    expires REAL NOT NULL
+                ) WITHOUT ROWID
+            ''')
+
+    def load(self, sid: str, now: float):
+        """(data, expires) of a live session, or None."""
+        with self.pool.connection() as conn:
+            return conn.execute('SELECT data, expires FROM sessions WHERE sid = ? AND expires > ?',
+                                (sid, now)).fetchone()
+
+    def save(self, sid: str, data: str, expires: float) -> None:
+        with self.pool.connection() as conn:
+            conn.execute('''
+                INSERT INTO sessions (sid, data, expires) VALUES (?, ?, ?)
+                ON CONFLICT (sid) DO UPDATE SET data = excluded.data, expires = excluded.expires
+            ''', (sid, data, expires))
+            self._saves += 1
+            if self._saves % PRUNE_EVERY == 0:
+                conn.execute('DELETE FROM sessions WHERE expires <= ?', (time.time(),))
+
+    def touch(self, sid: str, expires: float) -> None:
+        with self.pool.connection() as conn:
+            conn.execute('UPDATE sessions SET expires = ? WHERE sid = ?', (expires, sid))
+
+    def delete(self, sid: str) -> None:
+        with self.pool.connection() as conn:
+            conn.execute('DELETE FROM sessions WHERE sid = ?', (sid,))
+
+    def prune(self, now: float = None) -> int:
+        with self.pool.connection() as conn:
+            return conn.execute('DELETE FROM sessions WHERE expires <= ?', (now or time.time(),)).rowcount
+
+
+class ServerSideSessionInterface(SessionInterface):
+    session_class = ServerSession
+    serializer = session_json_serializer
+
+    def __init__(self, path: str = STORE_PATH, ttl: float = TTL_SECONDS):
+        self.path = path
+        self.ttl = ttl
+        self._store = None
+
+    @property
+    def store(self) -> SQLiteSessionStore:
+        # Opened on first use so importing the app never creates the file
+        if self._store is None:
+            self._store = SQLiteSessionStore(self.path)
+        return self._store
+
+    def open_session(self, app, request):
+        sid = request.cookies.get(self.get_cookie_name(app), '')
+        if sid and len(sid) < 64:
+            row = self.store.load(sid, time.time())
+            if row is not None:
+                return self.session_class(self.serializer.loads(row[0]), sid, row[1])
+        # Unknown or expired IDs are never adopted; a new one is issued on save
+        return self.session_class()
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+        if session.accessed:
+            response.vary.add('Cookie')
+
+        if not session:
+            if session.sid is not None:
+                self.store.delete(session.sid)
+                response.delete_cookie(name, domain=domain, path=path,
+                                       secure=self.get_cookie_secure(app), samesite=self.get_cookie_samesite(app))
+            return
+
+        now = time.time()
+        rotate = session.sid is None or session.get('user_id') != session.loaded_user
+        if not rotate and not session.modified:
+            if session.expires - now < self.ttl - TOUCH_SECONDS:
+                self.store.touch(session.sid, now + self.ttl)
+            return
+        if rotate:
+            if session.sid is not None:
+                self.store.delete(session.sid)
+            session.sid = secrets.token_urlsafe(SID_BYTES)
+            session.loaded_user = session.get('user_id')
+        session.expires = now + self.ttl
+        self.store.save(session.sid, self.serializer.dumps(dict(session)), session.expires)
+        if rotate or session.permanent:
+            response.set_cookie(name, session.sid, expires=self.get_expiration_time(app, session),
+                                httponly=self.get_cookie_httponly(app), domain=domain, path=path,
+                                secure=self.get_cookie_secure(app), samesite=self.get_cookie_samesite(app))
@@ -0,0 +1,64 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db  # noqa: E402
+import migrations  # noqa: E402
+
+
+@pytest.fixture
+def pool(tmp_path):
+    """A connection pool over an empty database file in a temp directory."""
+    pool = db.ConnectionPool(str(tmp_path / 'test.db'), size=2)
+    yield pool
+    pool.close_all()
+
+
+@pytest.fixture
+def conn(pool):
+    """A pooled connection to a fully migrated database."""
+    conn = pool.acquire()
+    migrations.migrate(conn)
+    yield conn
+    pool.release(conn)
+
+
+
+@pytest.fixture
+def add_report(conn):
+    """Insert a report and return its id; columns default to a minimal valid row."""
+    def add(**fields):
+        row = dict(user_id=1, name='Reporter', email='r@example.com', location='Patna',
+                   disaster_type='Flood', description='water rising', created_at='2024-01-15 10:00:00')
+        row.update(fields)
+        cursor = conn.execute(f"INSERT INTO reports ({', '.join(row)}) VALUES ({', '.join('?' for _ in row)})",
+                              list(row.values()))
+        conn.commit()
+        return cursor.lastrowid
+    return add
+
+
+@pytest.fixture
+def database(tmp_path):
+    """The shared pool (db.connection(), get_db()) pointed at a fresh, migrated database."""
+    previous = db.DATABASE
+    db.configure(str(tmp_path / 'app.db'))
+    with db.connection() as conn:
+        migrations.migrate(conn)
+    yield db.pool
+    db.configure(previous)
+
+
+@pytest.fixture
+def client(database, tmp_path, monkeypatch):
+    """Flask test client over the fresh database, with sessions kept in the temp directory."""
+    import app as flask_app
+    import sessions
+
+    monkeypatch.setattr(flask_app.app, 'session_interface',
+                        sessions.ServerSideSessionInterface(str(tmp_path / 'sessions.db')))
+    flask_app.response_cache.invalidate('reports', 'donations')
+    return flask_app.app.test_client()
@@ -0,0 +1,53 @@
+import aggregates
+import db
+
+
+def _add(conn, amount, status='Succeeded', currency='USD', created_at='2024-01-01 09:00:00'):
+    return conn.execute("INSERT INTO donations (donor_name, donor_email, amount, currency, status, purpose, "
+                        "pay_via, created_at) VALUES ('D', 'd@example.com', ?, ?, ?, 'relief', 'Card', ?)",
+                        (amount, currency, status, created_at)).lastrowid
+
+
+def _totals(conn):
+    return conn.execute('SELECT day, currency, status, total_amount, donation_count FROM donation_totals '
+                        'WHERE donation_count != 0 ORDER BY day, currency, status').fetchall()
+
+
+def test_triggers_keep_totals_in_step_with_the_ledger(conn):
+    first = _add(conn, 10, status='Pending')
+    _add(conn, 15)
+    _add(conn, 5, currency='INR', created_at='2024-01-02 09:00:00')
+    conn.execute("UPDATE donations SET status = 'Succeeded' WHERE id = ?", (first,))
+    assert _totals(conn) == [('2024-01-01', 'USD', 'Succeeded', 25.0, 2),
+                             ('2024-01-02', 'INR', 'Succeeded', 5.0, 1)]
+    conn.execute('DELETE FROM donations WHERE currency = ?', ('INR',))
+    assert _totals(conn) == [('2024-01-01', 'USD', 'Succeeded', 25.0, 2)]
+
+
+def test_rebuild_matches_the_incremental_totals(conn):
+    for amount in (10, 20, 30):
+        _add(conn, amount, created_at=f'2024-01-0{amount // 10} 09:00:00')
+    incremental = _totals(conn)
+    conn.execute('DELETE FROM donation_totals')
+    assert aggregates.rebuild_donation_totals(conn.cursor()) == 3
+    assert _totals(conn) == incremental
+
+
+def test_summary_groups_totals(conn):
+    _add(conn, 10)
+    _add(conn, 30)
+    _add(conn, 7, status='Failed')
+    summary = aggregates.donation_summary(conn.cursor())
+    assert summary['by_currency'] == [{'currency': 'USD', 'total': 47.0, 'count': 3, 'average': 15.67}]
+    assert summary['by_status'][1] == {'currency': 'USD', 'status': 'Succeeded', 'total': 40.0, 'count': 2,
+                                       'average': 20.0}
+    only_succeeded = aggregates.donation_summary(conn.cursor(), ' AND status = ?', ['Succeeded'])
+    assert only_succeeded['by_day'] == [{'day': '2024-01-01', 'currency': 'USD', 'total': 40.0, 'count': 2,
+                                        'average': 20.0}]
+
+
+def test_summary_endpoint_reads_the_aggregate(client):
+    with db.connection() as conn:
+        _add(conn, 12)
+    body = client.get('/api/donations/summary?currency=usd').get_json()
+    assert body['by_currency'] == [{'currency': 'USD', 'total': 12.0, 'count': 1, 'average': 12.0}]
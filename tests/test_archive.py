@@ -0,0 +1,74 @@
+import sqlite3
+
+import pytest
+
+import archive
+
+
+@pytest.fixture
+def archived(conn, add_report, tmp_path):
+    """Two January reports archived to their month file, one March report left live."""
+    old = add_report(created_at='2024-01-10 08:00:00')
+    add_report(created_at='2024-01-20 08:00:00')
+    dispatched = add_report(created_at='2024-01-25 08:00:00', status='dispatched')
+    live = add_report(created_at='2024-03-01 08:00:00')
+    moved = archive.archive_month(conn, '2024-01', str(tmp_path / 'archive'))
+    assert moved['reports'] == 2
+    return old, dispatched, live
+
+
+def _attached_schemas(conn):
+    return [row[1] for row in conn.execute('PRAGMA database_list') if row[1] not in ('main', 'temp')]
+
+
+def test_archived_rows_leave_the_live_table(conn, archived):
+    old, dispatched, live = archived
+    ids = {row[0] for row in conn.execute('SELECT id FROM reports')}
+    assert ids == {dispatched, live}
+
+
+def test_attached_reads_archives_then_detaches(conn, archived):
+    old, dispatched, live = archived
+    with archive.attached(conn, '2024-01-01 00:00:00') as schemas:
+        assert schemas == ['archive_2024_01']
+        source = archive.union_source(conn, 'reports', ['id', 'created_at'], schemas)
+        ids = {row[0] for row in conn.execute(f'SELECT id FROM {source} r')}
+    assert {old, dispatched, live} <= ids
+    assert _attached_schemas(conn) == []
+    assert not conn.broken
+
+
+def test_ranges_after_the_archive_attach_nothing(conn, archived):
+    with archive.attached(conn, '2024-02-01 00:00:00') as schemas:
+        assert schemas == []
+        assert archive.union_source(conn, 'reports', ['id'], schemas) == 'reports'
+    with archive.attached(conn, None) as schemas:
+        assert schemas == []
+
+
+def test_archives_are_attached_read_only(conn, archived):
+    with archive.attached(conn, '2024-01-01 00:00:00') as schemas:
+        with pytest.raises(sqlite3.OperationalError):
+            conn.execute(f'DELETE FROM {schemas[0]}.reports')
+
+
+def test_open_cursor_gets_the_connection_discarded(pool, archived):
+    conn = pool.acquire()
+    with archive.attached(conn, '2024-01-01 00:00:00') as schemas:
+        cursor = conn.execute(f'SELECT id FROM {schemas[0]}.reports')
+        cursor.fetchone()    # statement still active over the archive
+    assert conn.broken
+    pool.release(conn)
+    with pytest.raises(sqlite3.ProgrammingError):
+        conn.execute('SELECT 1')
+
+
+def test_too_many_months_for_one_query(conn, add_report, tmp_path):
+    for month in ('2024-01', '2024-02'):
+        add_report(created_at=f'{month}-10 08:00:00')
+        archive.archive_month(conn, month, str(tmp_path / 'archive'))
+    conn.setlimit(sqlite3.SQLITE_LIMIT_ATTACHED, 1)
+    with pytest.raises(archive.ArchiveRangeError):
+        with archive.attached(conn, '2024-01-01 00:00:00'):
+            pass
+    assert _attached_schemas(conn) == []
@@ -0,0 +1,78 @@
+import asyncio
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import db
+
+
+@pytest.fixture
+def asgi(client, monkeypatch):
+    import asgi
+
+    monkeypatch.setattr(asgi, 'pool', asgi.AsyncConnectionPool(size=2))
+    monkeypatch.setattr(asgi, 'executor', asgi.executor)   # restored; _request installs its own
+    return asgi
+
+
+def _request(asgi, path, query='', method='GET', body=b''):
+    """Run one request through the ASGI app; returns (status, headers, body)."""
+    messages = [{'type': 'http.request', 'body': body, 'more_body': False}]
+    sent = []
+
+    async def receive():
+        if messages:
+            return messages.pop(0)
+        await asyncio.sleep(3600)   # the client never disconnects
+
+    async def send(message):
+        sent.append(message)
+
+    async def run():
+        scope = {'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': method,
+                 'scheme': 'http', 'path': path, 'raw_path': path.encode(), 'query_string': query.encode(),
+                 'root_path': '', 'headers': [(b'host', b'testserver')], 'client': ('127.0.0.1', 50000),
+                 'server': ('testserver', 80)}
+        try:
+            await asgi.app(scope, receive, send)
+        finally:
+            await asgi.pool.close_all()
+
+    # asyncio.run() shuts the loop's default executor down when it returns
+    asgi.executor = ThreadPoolExecutor(4)
+    asyncio.run(run())
+    start = sent[0]
+    return (start['status'], dict(start['headers']),
+            b''.join(message.get('body', b'') for message in sent[1:]))
+
+
+def _add_donation(name):
+    with db.connection() as conn:
+        conn.execute("INSERT INTO donations (donor_name, donor_email, amount, currency, status, pay_via) "
+                     "VALUES (?, 'd@example.com', 10, 'USD', 'Succeeded', 'Card')", (name,))
+
+
+def test_native_donation_reads_use_the_async_pool(asgi):
+    _add_donation('Asha')
+    status, headers, body = _request(asgi, '/api/get-donations')
+    assert status == 200
+    assert [d['donor_name'] for d in json.loads(body)['donations']] == ['Asha']
+    assert b'etag' in headers
+    status, _, body = _request(asgi, '/api/donations/summary')
+    assert json.loads(body)['by_currency'][0]['total'] == 10.0
+
+
+def test_exports_and_other_routes_are_served_by_flask(asgi):
+    _add_donation('Asha')
+    status, headers, body = _request(asgi, '/api/get-donations', 'format=csv')
+    assert status == 200 and headers[b'content-type'].startswith(b'text/csv')
+    assert body.splitlines()[1].startswith(b'1,Asha,')
+    status, _, body = _request(asgi, '/api/reports')
+    assert status == 200 and json.loads(body)['reports'] == []
+
+
+def test_oversized_native_posts_are_refused(asgi):
+    status, _, _ = _request(asgi, '/create-checkout-session', method='POST',
+                            body=b'x' * (asgi.MAX_BODY_BYTES + 1))
+    assert status == 413
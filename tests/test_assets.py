@@ -0,0 +1,76 @@
+import gzip
+
+import pytest
+from flask import Flask
+
+from assets import IMMUTABLE, Assets, build_assets, send_cached
+
+CSS = b'body { color: #333; }\n' * 50
+
+
+@pytest.fixture
+def app(tmp_path):
+    static = tmp_path / 'static'
+    (static / 'img').mkdir(parents=True)
+    (static / 'styles.css').write_bytes(CSS)
+    (static / 'img' / 'logo.png').write_bytes(b'\x89PNG fake')
+    (tmp_path / 'files').mkdir()
+    (tmp_path / 'files' / 'photo.jpg').write_bytes(bytes(range(256)))
+    app = Flask(__name__, root_path=str(tmp_path), static_folder=str(static))
+    app.assets = Assets(app)
+
+    @app.route('/files/<path:filename>')
+    def files(filename):
+        return send_cached('files', filename, immutable=True)
+
+    return app
+
+
+def test_build_fingerprints_and_precompresses(app):
+    manifest = build_assets(app.static_folder)
+    assert set(manifest) == {'styles.css', 'img/logo.png'}
+    assert manifest['styles.css'].startswith('styles.') and manifest['styles.css'].endswith('.css')
+    dist = app.assets.dist_folder
+    with open(f"{dist}/{manifest['styles.css']}.gz", 'rb') as f:
+        assert gzip.decompress(f.read()) == CSS
+    with pytest.raises(FileNotFoundError):
+        open(f"{dist}/{manifest['img/logo.png']}.gz")
+    # Rebuilding never fingerprints the previous build
+    assert build_assets(app.static_folder) == manifest
+
+
+def test_asset_urls_fall_back_to_static_without_a_manifest(app):
+    with app.test_request_context():
+        assert app.assets.url('styles.css') == '/static/styles.css'
+        app.assets.manifest = build_assets(app.static_folder)
+        assert app.assets.url('styles.css') == f"/assets/{app.assets.manifest['styles.css']}"
+
+
+def test_assets_are_immutable_and_negotiate_encoding(app):
+    hashed = build_assets(app.static_folder)['styles.css']
+    client = app.test_client()
+    compressed = client.get(f'/assets/{hashed}', headers={'Accept-Encoding': 'gzip'})
+    assert compressed.headers['Content-Encoding'] == 'gzip'
+    assert compressed.headers['Cache-Control'] == IMMUTABLE
+    assert compressed.mimetype == 'text/css'
+    assert 'Accept-Encoding' in compressed.headers['Vary']
+    assert gzip.decompress(compressed.data) == CSS
+    plain = client.get(f'/assets/{hashed}')
+    assert 'Content-Encoding' not in plain.headers and plain.data == CSS
+
+
+def test_files_support_ranges_and_revalidation(app):
+    client = app.test_client()
+    partial = client.get('/files/photo.jpg', headers={'Range': 'bytes=10-19'})
+    assert partial.status_code == 206 and partial.data == bytes(range(10, 20))
+    etag = client.get('/files/photo.jpg').headers['ETag']
+    assert client.get('/files/photo.jpg', headers={'If-None-Match': etag}).status_code == 304
+    assert client.get('/files/../static/styles.css').status_code == 404
+
+
+def test_x_accel_offload_hands_the_file_to_nginx(app):
+    app.config['FILE_OFFLOAD'] = 'x-accel'
+    response = app.test_client().get('/files/photo.jpg')
+    assert response.headers['X-Accel-Redirect'] == '/_protected/files/photo.jpg'
+    assert response.mimetype == 'image/jpeg' and response.data == b''
+    assert app.test_client().get('/files/missing.jpg').status_code == 404
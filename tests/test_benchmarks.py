@@ -0,0 +1,48 @@
+import sqlite3
+
+import pytest
+
+from benchmarks import compare, datagen, percentile, summarize
+
+
+def test_nearest_rank_percentiles():
+    samples = [0.001 * n for n in range(1, 101)]
+    assert percentile(samples, 50) == pytest.approx(0.05)
+    assert percentile(samples, 99) == pytest.approx(0.099)
+    assert percentile([], 50) == 0.0
+    summary = summarize(samples, elapsed=2.0)
+    assert (summary['count'], summary['p90_ms'], summary['max_ms'], summary['throughput_rps']) == (100, 90.0, 100.0, 50.0)
+
+
+def test_compare_reports_relative_change():
+    before = {'cases': {'feed': {'p50_ms': 10.0, 'p99_ms': 40.0}}, 'overall': {'throughput_rps': 200.0}}
+    after = {'cases': {'feed': {'p50_ms': 5.0, 'p99_ms': 40.0}, 'new': {'p50_ms': 1.0}},
+             'overall': {'throughput_rps': 250.0}}
+    assert compare.compare(before, after) == [
+        ('feed', 'p50_ms', 10.0, 5.0, '-50.0%'),
+        ('feed', 'p99_ms', 40.0, 40.0, '+0.0%'),
+        ('overall', 'throughput_rps', 200.0, 250.0, '+25.0%'),
+    ]
+
+
+def _dump(path):
+    conn = sqlite3.connect(path)
+    try:
+        # Password salts and users.created_at are not seeded
+        return [conn.execute('SELECT id, name, email, preferred_language FROM users ORDER BY id').fetchall()] + \
+            [conn.execute(f'SELECT * FROM {table} ORDER BY id').fetchall() for table in ('reports', 'donations')]
+    finally:
+        conn.close()
+
+
+def test_the_same_seed_generates_the_same_rows(database, tmp_path):
+    paths = [str(tmp_path / f'bench-{n}.db') for n in range(3)]
+    datagen.generate(paths[0], 50, seed=7)
+    datagen.generate(paths[1], 50, seed=7)
+    datagen.generate(paths[2], 50, seed=8)
+    first = _dump(paths[0])
+    assert [len(rows) for rows in first] == [5, 50, 50]
+    assert _dump(paths[1]) == first
+    assert _dump(paths[2]) != first
+    with pytest.raises(SystemExit):
+        datagen.generate(paths[0], 50)
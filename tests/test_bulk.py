@@ -0,0 +1,93 @@
+import io
+import json
+
+import pytest
+
+import bulk
+
+NOW = '2024-06-01 12:00:00'
+ROW = {'location': 'Patna', 'disaster_type': 'Flood', 'description': 'water rising'}
+
+
+def test_minimal_row_gets_defaults():
+    params = bulk.validate(dict(ROW), 7, NOW)
+    assert params == (7, '', '', 'Patna', 'Flood', 'water rising', 'pending', NOW, None, None, None)
+
+
+@pytest.mark.parametrize('row, error', [
+    (['not', 'an', 'object'], 'row must be an object'),
+    ({'location': 'Patna'}, 'missing disaster_type, description'),
+    (dict(ROW, status='verified'), 'status must be one of'),
+    (dict(ROW, latitude='25.6'), 'Latitude and longitude must both be numbers'),
+    (dict(ROW, latitude='95', longitude='85'), 'Coordinates are out of range'),
+    (dict(ROW, created_at='yesterday'), 'created_at must be an ISO date/time'),
+    (dict(ROW, created_at='2024-06-01T12:10:00'), 'created_at is in the future'),
+    (dict(ROW, description='x' * (bulk.FIELD_LIMIT + 1)), 'description is longer than'),
+])
+def test_invalid_rows_are_rejected(row, error):
+    with pytest.raises(bulk.RowError, match=error):
+        bulk.validate(row, 7, NOW)
+
+
+def test_timestamps_are_normalised_to_utc():
+    assert bulk.validate(dict(ROW, created_at='2024-05-01T10:00:00+05:30'), 7, NOW)[7] == '2024-05-01 04:30:00'
+    assert bulk.validate(dict(ROW, created_at='2024-05-01T10:00:00Z'), 7, NOW)[7] == '2024-05-01 10:00:00'
+
+
+def test_small_clock_skew_is_clamped_to_now():
+    assert bulk.validate(dict(ROW, created_at='2024-06-01T12:03:00'), 7, NOW)[7] == NOW
+
+
+def test_external_id_is_scoped_to_the_importer():
+    assert bulk.validate(dict(ROW, external_id='A-1'), 7, NOW)[10] == 'bulk:7:A-1'
+    assert bulk.validate(dict(ROW, id=42), 8, NOW)[10] == 'bulk:8:42'
+
+
+def test_csv_rows_with_extra_fields_are_errors():
+    stream = io.BytesIO(b'location,disaster_type,description\nPatna,Flood,water\nPatna,Flood,water,extra\n')
+    rows = list(bulk.read_rows(stream, 'csv'))
+    assert rows[0] == (2, {'location': 'Patna', 'disaster_type': 'Flood', 'description': 'water'})
+    assert rows[1][0] == 3 and isinstance(rows[1][1], bulk.RowError)
+
+
+def test_ndjson_reports_bad_lines_by_number():
+    stream = io.BytesIO(b'{"a": 1}\n\n{broken\n')
+    rows = list(bulk.read_rows(stream, 'ndjson'))
+    assert rows[0] == (1, {'a': 1})
+    assert rows[1][0] == 3 and isinstance(rows[1][1], bulk.RowError)
+
+
+def _ndjson(*rows):
+    return io.BytesIO(''.join(json.dumps(row) + '\n' for row in rows).encode())
+
+
+def test_import_skips_bad_rows_and_is_idempotent(conn):
+    rows = [dict(ROW, external_id='1', created_at='2024-01-01T00:00:00'),
+            {'location': 'Patna'},
+            dict(ROW, external_id='2')]
+    summary = bulk.import_reports(conn, _ndjson(*rows), 'ndjson', 7)
+    assert (summary['imported'], summary['failed'], summary['duplicates']) == (2, 1, 0)
+    assert summary['errors'] == [{'line': 2, 'error': 'missing disaster_type, description'}]
+    again = bulk.import_reports(conn, _ndjson(*rows), 'ndjson', 7)
+    assert (again['imported'], again['duplicates']) == (0, 2)
+    assert conn.execute('SELECT COUNT(*) FROM reports').fetchone()[0] == 2
+
+
+def test_constraint_violations_are_failures_not_duplicates(conn):
+    conn.execute("CREATE TRIGGER reject_nowhere BEFORE INSERT ON reports WHEN NEW.location = 'Nowhere' "
+                 "BEGIN SELECT RAISE(ABORT, 'location rejected'); END")
+    rows = [dict(ROW, created_at='2024-01-01T00:00:00'),
+            dict(ROW, location='Nowhere', created_at='2024-01-01T00:00:00'),
+            dict(ROW, location='Nowhere'),
+            dict(ROW, external_id='3')]
+    summary = bulk.import_reports(conn, _ndjson(*rows), 'ndjson', 7)
+    assert (summary['imported'], summary['failed'], summary['duplicates']) == (2, 2, 0)
+    assert summary['errors'] == [{'line': 2, 'error': 'location rejected'},
+                                 {'line': 3, 'error': 'location rejected'}]
+    assert conn.execute('SELECT COUNT(*) FROM reports').fetchone()[0] == 2
+
+
+def test_only_partner_accounts_may_use_the_endpoint(monkeypatch):
+    monkeypatch.setattr(bulk, 'PARTNER_USERS', frozenset({3}))
+    assert bulk.is_partner(3)
+    assert not bulk.is_partner(4)
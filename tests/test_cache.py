@@ -0,0 +1,68 @@
+import itertools
+
+from flask import Flask, jsonify
+
+import db
+from cache import ResponseCache
+
+
+def _app(cache):
+    app = Flask(__name__)
+    counter = itertools.count(1)
+
+    @app.route('/items')
+    @cache.cached('items')
+    def items():
+        return jsonify(render=next(counter))
+
+    return app.test_client()
+
+
+def test_responses_are_cached_until_invalidated():
+    cache = ResponseCache()
+    client = _app(cache)
+    first = client.get('/items')
+    assert first.get_json() == {'render': 1}
+    assert client.get('/items').get_json() == {'render': 1}
+    assert client.get('/items?page=2').get_json() == {'render': 2}
+    cache.invalidate('items')
+    fresh = client.get('/items')
+    assert fresh.get_json() == {'render': 3}
+    assert fresh.headers['ETag'] != first.headers['ETag']
+
+
+def test_matching_etag_is_answered_with_304():
+    cache = ResponseCache()
+    client = _app(cache)
+    etag = client.get('/items').headers['ETag']
+    assert client.get('/items', headers={'If-None-Match': etag}).status_code == 304
+    cache.invalidate('items')
+    assert client.get('/items', headers={'If-None-Match': etag}).status_code == 200
+
+
+def test_shared_store_carries_invalidations_between_workers(tmp_path):
+    path = str(tmp_path / 'cache.db')
+    workers = [ResponseCache(), ResponseCache()]
+    for cache in workers:
+        cache.configure(path)
+    clients = [_app(cache) for cache in workers]
+    etag = clients[0].get('/items').headers['ETag']
+    # The other worker has never rendered it: served from the shared file with the same ETag
+    assert clients[1].get('/items').headers['ETag'] == etag
+    workers[1].invalidate('items')
+    assert clients[0].get('/items', headers={'If-None-Match': etag}).status_code == 200
+    for cache in workers:
+        cache.store.pool.close_all()
+
+
+def test_status_changes_invalidate_cached_reports(client):
+    with db.connection() as conn:
+        report = conn.execute("INSERT INTO reports (user_id, name, email, location, disaster_type, description) "
+                              "VALUES (1, 'Reporter', 'r@example.com', 'Patna', 'Flood', 'water')").lastrowid
+    etag = client.get('/api/reports').headers['ETag']
+    with client.session_transaction() as session:
+        session['user_id'] = 1
+    assert client.post(f'/api/reports/{report}/status', json={'status': 'resolved'}).status_code == 200
+    response = client.get('/api/reports', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.get_json()['reports'][0]['status'] == 'resolved'
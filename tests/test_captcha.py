@@ -0,0 +1,75 @@
+import pytest
+
+from captcha import Captchas
+
+
+@pytest.fixture
+def captchas():
+    captchas = Captchas(ttl=60)
+    captchas.configure(['current-key'])
+    return captchas
+
+
+def test_right_code_verifies_once(captchas):
+    code, token = captchas.issue()
+    assert captchas.verify(token, f' {code.lower()} ')
+    assert not captchas.verify(token, code)
+
+
+def test_wrong_code_does_not_spend_the_token(captchas):
+    code, token = captchas.issue()
+    assert not captchas.verify(token, 'WRONG00')
+    assert captchas.verify(token, code)
+
+
+def test_expired_token_is_rejected(captchas):
+    code, token = captchas.issue(now=1000)
+    assert captchas.verify(token, code, now=1059)
+    code, token = captchas.issue(now=1000)
+    assert not captchas.verify(token, code, now=1060)
+
+
+@pytest.mark.parametrize('token', ['', 'abc', 'a.b.c', 'zz' * 8 + '.9999999999.mac', '00' * 8 + '.soon.mac'])
+def test_malformed_tokens_are_rejected(captchas, token):
+    assert not captchas.verify(token, 'ABC1234')
+
+
+def test_tampered_expiry_is_rejected(captchas):
+    code, token = captchas.issue(now=1000)
+    nonce, expires, mac = token.split('.')
+    assert not captchas.verify(f'{nonce}.{int(expires) + 3600}.{mac}', code, now=1000)
+
+
+def test_rotated_keys_still_verify_open_forms(captchas):
+    code, token = captchas.issue()
+    captchas.configure(['next-key', 'current-key'])
+    assert captchas.verify(token, code)
+    code, token = captchas.issue()
+    captchas.configure(['other-key'])
+    assert not captchas.verify(token, code)
+
+
+def test_shared_replay_cache_spans_workers(tmp_path):
+    workers = [Captchas(ttl=60), Captchas(ttl=60)]
+    for worker in workers:
+        worker.configure(['shared-key'], str(tmp_path / 'replay.db'))
+    code, token = workers[0].issue()
+    assert workers[1].verify(token, code)
+    assert not workers[0].verify(token, code)
+
+
+def test_without_keys_captchas_are_disabled():
+    captchas = Captchas()
+    captchas.configure(['', ''])
+    assert not captchas.enabled
+    with pytest.raises(RuntimeError):
+        captchas.issue()
+    assert not captchas.verify('00' * 8 + '.9999999999.mac', 'ABC1234')
+
+
+def test_contact_form_works_without_configured_keys(client):
+    import app as flask_app
+
+    assert flask_app.captchas.enabled
+    response = client.get('/contact')
+    assert response.status_code == 200
@@ -0,0 +1,68 @@
+import pytest
+from flask import Flask
+
+import db
+
+
+def test_connections_run_in_wal_mode(pool):
+    with pool.connection() as conn:
+        assert conn.execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+        assert conn.execute('PRAGMA busy_timeout').fetchone()[0] == db.BUSY_TIMEOUT_MS
+
+
+def test_most_recently_released_connection_is_reused(pool):
+    first, second = pool.acquire(), pool.acquire()
+    pool.release(first)
+    pool.release(second)
+    assert pool.acquire() is second
+
+
+def test_pool_is_bounded(tmp_path):
+    pool = db.ConnectionPool(str(tmp_path / 'test.db'), size=1, timeout=0.05)
+    conn = pool.acquire()
+    with pytest.raises(db.PoolTimeout):
+        pool.acquire()
+    pool.release(conn)
+    assert pool.acquire() is conn
+    pool.close_all()
+
+
+def test_connection_commits_or_rolls_back(pool):
+    with pool.connection() as conn:
+        conn.execute('CREATE TABLE t (x INTEGER)')
+        conn.execute('INSERT INTO t VALUES (1)')
+    with pytest.raises(RuntimeError):
+        with pool.connection() as conn:
+            conn.execute('INSERT INTO t VALUES (2)')
+            raise RuntimeError
+    with pool.connection() as conn:
+        assert conn.execute('SELECT x FROM t').fetchall() == [(1,)]
+
+
+def test_open_transactions_are_not_handed_on(pool):
+    conn = pool.acquire()
+    conn.execute('CREATE TABLE t (x INTEGER)')
+    conn.commit()
+    conn.execute('INSERT INTO t VALUES (1)')
+    pool.release(conn)
+    assert not conn.in_transaction
+    assert conn.execute('SELECT COUNT(*) FROM t').fetchone()[0] == 0
+
+
+def test_broken_connections_are_replaced(pool):
+    conn = pool.acquire()
+    conn.broken = True
+    pool.release(conn)
+    replacement = pool.acquire()
+    assert replacement is not conn
+    pool.release(replacement)
+
+
+def test_request_connection_is_returned_on_teardown(database):
+    app = Flask(__name__)
+    db.init_app(app)
+    with app.app_context():
+        conn = db.get_db()
+        assert db.get_db() is conn
+    assert database.acquire() is conn
+    database.release(conn)
@@ -0,0 +1,49 @@
+import dedup
+
+TEXT = 'Water is rising fast near the railway station, several houses flooded'
+
+
+def _submit(conn, add_report, **fields):
+    fields.setdefault('description', TEXT)
+    report_id = add_report(**fields)
+    row = conn.execute('SELECT disaster_type, location, description, created_at, latitude, longitude '
+                       'FROM reports WHERE id = ?', (report_id,)).fetchone()
+    return report_id, dedup.assign_cluster(conn.cursor(), report_id, *row)
+
+
+def test_similar_text_is_scored_close():
+    sig = dedup.signature(dedup.shingles('Patna', TEXT))
+    close = dedup.signature(dedup.shingles('Patna', TEXT.replace('fast', 'quickly')))
+    other = dedup.signature(dedup.shingles('Mumbai', 'Building collapsed after the tremor'))
+    assert dedup.similarity(sig, close) >= dedup.THRESHOLD
+    assert dedup.similarity(sig, other) < 0.2
+
+
+def test_near_duplicates_join_the_first_report(conn, add_report):
+    first, cluster = _submit(conn, add_report)
+    assert cluster == first
+    second, cluster = _submit(conn, add_report, description=TEXT + '!!', created_at='2024-01-15 10:05:00')
+    assert cluster == first
+    assert conn.execute('SELECT cluster_id FROM reports WHERE id = ?', (second,)).fetchone()[0] == first
+    # A third member adds no new bucket entries for the cluster
+    buckets = conn.execute('SELECT COUNT(*) FROM report_lsh').fetchone()[0]
+    _submit(conn, add_report, created_at='2024-01-15 10:10:00')
+    assert conn.execute('SELECT COUNT(*) FROM report_lsh').fetchone()[0] == buckets
+
+
+def test_type_distance_and_time_keep_reports_apart(conn, add_report):
+    first, _ = _submit(conn, add_report, latitude=25.6, longitude=85.1)
+    for fields in ({'disaster_type': 'Fire'},
+                   {'latitude': 26.6, 'longitude': 85.1},
+                   {'created_at': '2024-01-15 17:00:00'}):
+        report_id, cluster = _submit(conn, add_report, **fields)
+        assert cluster == report_id
+
+
+def test_rebuild_reproduces_the_clusters(conn, add_report):
+    first, _ = _submit(conn, add_report)
+    second, _ = _submit(conn, add_report, created_at='2024-01-15 10:05:00')
+    other, _ = _submit(conn, add_report, disaster_type='Fire')
+    assert dedup.rebuild_clusters(conn.cursor()) == 2
+    clusters = dict(conn.execute('SELECT id, cluster_id FROM reports').fetchall())
+    assert clusters == {first: None, second: first, other: None}
@@ -0,0 +1,43 @@
+import csv
+import io
+import json
+
+import db
+
+DONATIONS = [('Asha', 10, 'USD', 'Succeeded', '2024-01-01 09:00:00'),
+             ('Ravi', 20, 'INR', 'Succeeded', '2024-01-02 09:00:00'),
+             ('Mina', 30, 'USD', 'Pending', '2024-01-03 09:00:00'),
+             ('Omar', 40, 'USD', 'Succeeded', '2024-01-04 09:00:00')]
+
+
+def _add_donations():
+    with db.connection() as conn:
+        conn.executemany("INSERT INTO donations (donor_name, donor_email, amount, currency, status, created_at, "
+                         "purpose, pay_via) VALUES (?, 'd@example.com', ?, ?, ?, ?, 'relief', 'Card')", DONATIONS)
+
+
+def test_ledger_pages_newest_first_with_filters(client):
+    _add_donations()
+    page = client.get('/api/get-donations?currency=usd&limit=2').get_json()
+    assert [d['donor_name'] for d in page['donations']] == ['Omar', 'Mina']
+    rest = client.get(f"/api/get-donations?currency=usd&limit=2&after={page['next_cursor']}").get_json()
+    assert [d['donor_name'] for d in rest['donations']] == ['Asha']
+    assert rest['next_cursor'] is None
+    ranged = client.get('/api/get-donations?status=Succeeded&from=2024-01-02&to=2024-01-03').get_json()
+    assert [d['donor_name'] for d in ranged['donations']] == ['Ravi']
+
+
+def test_ledger_exports_stream_every_matching_row(client):
+    _add_donations()
+    response = client.get('/api/get-donations?format=ndjson&status=Succeeded')
+    assert response.mimetype == 'application/x-ndjson'
+    assert [json.loads(line)['donor_name'] for line in response.get_data(as_text=True).splitlines()] == \
+        ['Omar', 'Ravi', 'Asha']
+    rows = list(csv.DictReader(io.StringIO(client.get('/api/get-donations?format=csv').get_data(as_text=True))))
+    assert [(row['donor_name'], row['amount']) for row in rows][-1] == ('Asha', '10.0')
+    assert len(rows) == 4
+
+
+def test_ledger_rejects_bad_parameters(client):
+    assert client.get('/api/get-donations?format=xml').status_code == 400
+    assert client.get('/api/get-donations?from=yesterday').status_code == 400
@@ -0,0 +1,59 @@
+import pytest
+
+from events import Broker, TooManySubscribers
+
+
+def test_events_fan_out_to_matching_topics():
+    broker = Broker()
+    everything, _ = broker.subscribe()
+    floods, _ = broker.subscribe(topic='Flood')
+    broker.publish('report', {'id': 1}, topic='Fire')
+    broker.publish('report', {'id': 2}, topic='Flood')
+    assert everything.queue.qsize() == 2
+    assert floods.queue.get_nowait().endswith('event: report\ndata: {"id":2}\n\n')
+    assert floods.queue.empty()
+
+
+def test_missed_events_are_replayed_after_last_event_id():
+    broker = Broker()
+    seen = broker.publish('report', {'id': 1})
+    broker.publish('report', {'id': 2}, topic='Fire')
+    broker.publish('report', {'id': 3}, topic='Flood')
+    _, backlog = broker.subscribe(seen, topic='Flood')
+    assert [frame.split('data: ')[1] for frame in backlog] == ['{"id":3}\n\n']
+
+
+@pytest.mark.parametrize('last_event_id', ['0-1', 'garbage', None])
+def test_unknown_or_expired_ids_ask_for_a_resync(last_event_id):
+    broker = Broker(history_size=2)
+    for n in range(4):
+        broker.publish('report', {'id': n})
+    if last_event_id is None:
+        last_event_id = f'{broker.epoch}-1'     # fell out of the history
+    _, backlog = broker.subscribe(last_event_id)
+    assert backlog is None
+
+
+def test_slow_consumers_are_dropped_and_told_to_resync():
+    broker = Broker()
+    sub, backlog = broker.subscribe()
+    sub.queue.maxsize = 2
+    for n in range(3):
+        broker.publish('report', {'id': n})
+    # Whatever was still queued is stale once the client resyncs
+    frames = list(broker.stream(sub, backlog, heartbeat=0.01))
+    assert len(frames) == 2 and 'event: resync' in frames[1]
+    broker.publish('report', {'id': 4})
+    assert sub.queue.qsize() == 2
+
+
+def test_closing_a_stream_unsubscribes():
+    broker = Broker(max_subscribers=1)
+    sub, backlog = broker.subscribe()
+    with pytest.raises(TooManySubscribers):
+        broker.subscribe()
+    stream = broker.stream(sub, backlog, heartbeat=0.01)
+    assert next(stream).startswith('retry:')
+    assert next(stream) == ': keep-alive\n\n'
+    stream.close()
+    broker.subscribe()
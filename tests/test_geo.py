@@ -0,0 +1,25 @@
+import pytest
+
+import geo
+
+
+def test_radius_box_is_split_at_the_antimeridian():
+    boxes = geo.radius_bboxes(0.0, 179.95, 20)
+    assert len(boxes) == 2
+    assert boxes[0][3] == 180.0 and boxes[1][2] == -180.0
+
+
+@pytest.mark.parametrize('value, radius', [('91,0', None), ('0,0', '0'), ('0,0', '5000'), ('0', None)])
+def test_invalid_near_queries_are_rejected(value, radius):
+    with pytest.raises(geo.GeoQueryError):
+        geo.parse_near(value, radius)
+
+
+def test_approximate_distance_orders_like_haversine(conn, add_report):
+    # Around the antimeridian at 60N, where a degree of longitude is half a degree of latitude
+    points = {'a': (60.0, 179.9), 'b': (60.05, -179.95), 'c': (60.2, 179.9), 'd': (59.5, -179.0)}
+    ids = {add_report(location=name, latitude=lat, longitude=lon): name for name, (lat, lon) in points.items()}
+    sql, params = geo.approx_distance_sql(60.0, 179.95)
+    rows = conn.execute(f'SELECT id FROM reports ORDER BY {sql} LIMIT 3', params).fetchall()
+    by_haversine = sorted(points, key=lambda name: geo.haversine_km(60.0, 179.95, *points[name]))
+    assert [ids[row[0]] for row in rows] == by_haversine[:3]
@@ -0,0 +1,97 @@
+import hashlib
+import io
+import os
+
+import pytest
+from werkzeug.datastructures import FileStorage
+
+import images
+
+Image = pytest.importorskip('PIL.Image')
+
+
+def _jpeg_with_gps() -> bytes:
+    exif = Image.Exif()
+    exif[0x010F] = 'CameraMaker'
+    exif[0x8825] = {2: (25.0, 35.0, 40.0)}     # GPSInfo: GPSLatitude
+    buffer = io.BytesIO()
+    Image.new('RGB', (640, 480), 'red').save(buffer, 'JPEG', exif=exif)
+    return buffer.getvalue()
+
+
+def _png_with_text() -> bytes:
+    from PIL import PngImagePlugin
+    info = PngImagePlugin.PngInfo()
+    info.add_text('Location', 'Patna 25.594,85.137')
+    buffer = io.BytesIO()
+    Image.new('RGB', (64, 64), 'blue').save(buffer, 'PNG', pnginfo=info)
+    return buffer.getvalue()
+
+
+@pytest.fixture
+def pipeline(tmp_path):
+    return images.ImagePipeline(str(tmp_path / 'uploads'))
+
+
+def _upload(pipeline, data: bytes) -> str:
+    return pipeline.save(FileStorage(stream=io.BytesIO(data), filename='photo'))
+
+
+def test_published_file_has_no_metadata_and_is_named_by_its_bytes(pipeline):
+    filename = _upload(pipeline, _jpeg_with_gps())
+    path = os.path.join(pipeline.upload_folder, filename)
+    with open(path, 'rb') as f:
+        assert filename == hashlib.sha256(f.read()).hexdigest() + '.jpg'
+    with Image.open(path) as img:
+        assert dict(img.getexif()) == {}
+    assert pipeline.is_final(filename)
+    assert os.listdir(pipeline.incoming_folder) == []
+
+
+def test_identical_uploads_are_stored_once(pipeline):
+    data = _jpeg_with_gps()
+    assert _upload(pipeline, data) == _upload(pipeline, data)
+    pipeline._queue.join()
+    assert len([name for name in os.listdir(pipeline.upload_folder) if name.endswith('.jpg')]) == 1
+
+
+def test_thumbnails_leave_the_original_untouched(pipeline):
+    filename = _upload(pipeline, _png_with_text())
+    path = os.path.join(pipeline.upload_folder, filename)
+    with open(path, 'rb') as f:
+        before = f.read()
+    pipeline._queue.join()
+    assert all(os.path.exists(p) for p in pipeline.thumbnail_paths(filename))
+    with open(path, 'rb') as f:
+        assert f.read() == before
+
+
+@pytest.mark.parametrize('data, error', [
+    (b'', 'empty'),
+    (b'%PDF-1.4 not an image', 'Only PNG, JPEG and GIF'),
+    (b'\x89PNG\r\n\x1a\n' + b'garbage' * 10, 'not a valid image'),
+])
+def test_bad_uploads_are_rejected_and_cleaned_up(pipeline, data, error):
+    with pytest.raises(images.UploadRejected, match=error):
+        _upload(pipeline, data)
+    assert os.listdir(pipeline.incoming_folder) == []
+    assert [name for name in os.listdir(pipeline.upload_folder) if name != images.THUMBNAIL_DIR] == []
+
+
+def test_oversized_uploads_are_rejected(tmp_path):
+    pipeline = images.ImagePipeline(str(tmp_path / 'uploads'), max_bytes=1024)
+    with pytest.raises(images.UploadRejected, match='smaller than'):
+        _upload(pipeline, _jpeg_with_gps() + b'\0' * 4096)
+
+
+def test_metadata_is_cut_out_without_pillow(tmp_path, monkeypatch):
+    monkeypatch.setattr(images, 'Image', None)
+    for ext, data, marker in (('jpg', _jpeg_with_gps(), b'Exif'), ('png', _png_with_text(), b'Location')):
+        src, dst = tmp_path / f'in.{ext}', tmp_path / f'out.{ext}'
+        src.write_bytes(data)
+        images.strip_metadata(str(src), str(dst), ext)
+        cleaned = dst.read_bytes()
+        assert marker in data and marker not in cleaned
+        with Image.open(dst) as img:
+            img.load()
+            assert img.size in ((640, 480), (64, 64))
@@ -0,0 +1,55 @@
+from collections import OrderedDict
+
+import pytest
+
+import db
+
+
+@pytest.fixture
+def flask_app(client, monkeypatch):
+    import app as flask_app
+
+    monkeypatch.setattr(flask_app, '_preferred_languages', OrderedDict())
+    return flask_app
+
+
+def _add_user(user_id, language):
+    with db.connection() as conn:
+        conn.execute("INSERT INTO users (id, name, email, password_hash, preferred_language) VALUES (?, 'U', ?, 'x', ?)",
+                     (user_id, f'u{user_id}@example.com', language))
+
+
+def _set_language(user_id, language):
+    with db.connection() as conn:
+        conn.execute('UPDATE users SET preferred_language = ? WHERE id = ?', (language, user_id))
+
+
+def test_preferred_language_is_read_once(flask_app):
+    _add_user(1, 'hi')
+    with flask_app.app.test_request_context():
+        assert flask_app._preferred_language(1) == 'hi'
+        _set_language(1, 'en')
+        assert flask_app._preferred_language(1) == 'hi'
+        flask_app._forget_preferred_language(1)
+        assert flask_app._preferred_language(1) == 'en'
+
+
+def test_cache_is_bounded_and_ignores_unknown_languages(flask_app, monkeypatch):
+    monkeypatch.setattr(flask_app, 'PREFERRED_LANGUAGE_CACHE_SIZE', 2)
+    for user_id, language in ((1, 'hi'), (2, 'fr'), (3, 'en')):
+        _add_user(user_id, language)
+    with flask_app.app.test_request_context():
+        assert [flask_app._preferred_language(n) for n in (1, 2, 3)] == ['hi', None, 'en']
+    assert list(flask_app._preferred_languages) == [2, 3]
+
+
+def test_changing_language_refreshes_the_cache(flask_app, client):
+    _add_user(1, 'en')
+    with flask_app.app.test_request_context():
+        flask_app._preferred_language(1)
+    with client.session_transaction() as session:
+        session['user_id'] = 1
+    client.get('/change-language/hi')
+    assert 1 not in flask_app._preferred_languages
+    with flask_app.app.test_request_context():
+        assert flask_app._preferred_language(1) == 'hi'
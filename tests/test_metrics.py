@@ -0,0 +1,57 @@
+from flask import Flask
+
+import metrics
+
+
+def test_histogram_renders_cumulative_buckets():
+    histogram = metrics.Histogram('t_seconds', 'Test.', ('path',), buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 0.7, 3.0):
+        histogram.observe(value, '/a"b')
+    assert list(histogram.render())[2:] == [
+        't_seconds_bucket{path="/a\\"b",le="0.1"} 1',
+        't_seconds_bucket{path="/a\\"b",le="1.0"} 3',
+        't_seconds_bucket{path="/a\\"b",le="+Inf"} 4',
+        't_seconds_sum{path="/a\\"b"} 4.25',
+        't_seconds_count{path="/a\\"b"} 4',
+    ]
+
+
+def _app(pool):
+    with pool.connection():
+        pass    # opening a connection runs PRAGMAs; keep them out of the request
+    app = Flask(__name__)
+    metrics.init_app(app)
+
+    @app.route('/probe')
+    def metrics_probe():
+        with pool.connection() as conn:
+            conn.execute('SELECT 1')
+            conn.execute('SELECT 2')
+        return 'ok'
+
+    return app
+
+
+def _sample(body, prefix):
+    return next(float(line.rsplit(' ', 1)[1]) for line in body.splitlines() if line.startswith(prefix))
+
+
+def test_requests_are_counted_with_their_sql(pool):
+    client = _app(pool).test_client()
+    client.get('/probe')
+    client.get('/probe')
+    body = client.get('/metrics').get_data(as_text=True)
+    assert _sample(body, 'resqnet_http_requests_total{endpoint="metrics_probe",method="GET",status="200"}') == 2
+    assert _sample(body, 'resqnet_http_request_db_queries_bucket{endpoint="metrics_probe",le="2"}') == 2
+    assert _sample(body, 'resqnet_http_request_db_queries_bucket{endpoint="metrics_probe",le="1"}') == 0
+
+
+def test_metrics_token_is_required_when_set(pool):
+    app = _app(pool)
+    app.config['METRICS_TOKEN'] = 'secret'
+    client = app.test_client()
+    assert client.get('/metrics').status_code == 401
+    assert client.get('/metrics', headers={'Authorization': 'Bearer wrong'}).status_code == 401
+    response = client.get('/metrics', headers={'Authorization': 'Bearer secret'})
+    assert response.status_code == 200
+    assert response.content_type == metrics.CONTENT_TYPE
@@ -0,0 +1,103 @@
+import sqlite3
+
+import pytest
+
+import migrations
+
+
+def test_fresh_database_applies_every_migration(pool):
+    conn = pool.acquire()
+    try:
+        applied = migrations.migrate(conn)
+        assert applied == [number for number, _, _ in migrations.MIGRATIONS]
+        assert migrations.current_version(conn) == migrations.MIGRATIONS[-1][0]
+        assert migrations.migrate(conn) == []
+    finally:
+        pool.release(conn)
+
+
+def test_only_pending_migrations_run(pool):
+    conn = pool.acquire()
+    try:
+        migrations.migrate(conn)
+        last = migrations.MIGRATIONS[-1][0]
+        conn.execute('DELETE FROM schema_version WHERE version = ?', (last,))
+        conn.commit()
+        assert migrations.migrate(conn) == [last]
+    finally:
+        pool.release(conn)
+
+
+def test_failed_migration_rolls_back_the_batch(conn, monkeypatch):
+    version = migrations.current_version(conn)
+
+    def broken(cursor):
+        cursor.execute('CREATE TABLE half_done (id INTEGER)')
+        raise RuntimeError('boom')
+
+    monkeypatch.setattr(migrations, 'MIGRATIONS', migrations.MIGRATIONS + [(version + 1, 'broken', broken)])
+    with pytest.raises(RuntimeError):
+        migrations.migrate(conn)
+    assert not conn.in_transaction
+    assert migrations.current_version(conn) == version
+    assert conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'half_done'").fetchone() is None
+
+
+def test_out_of_order_migration_is_rejected(monkeypatch):
+    monkeypatch.setattr(migrations, 'MIGRATIONS', list(migrations.MIGRATIONS))
+    with pytest.raises(ValueError):
+        migrations.migration(1, 'duplicate')(lambda cursor: None)
+
+
+def test_pre_runner_database_is_upgraded_in_place(pool):
+    # Databases from before the runner: no schema_version, users without the later columns
+    conn = pool.acquire()
+    try:
+        conn.execute('''
+            CREATE TABLE users (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                username TEXT,
+                email TEXT UNIQUE NOT NULL,
+                password_hash TEXT NOT NULL
+            )
+        ''')
+        conn.execute("INSERT INTO users (username, email, password_hash) VALUES ('old', 'old@example.com', 'x')")
+        conn.commit()
+        migrations.migrate(conn)
+        assert {'name', 'preferred_language'} <= migrations.columns('users')
+        assert conn.execute('SELECT email FROM users').fetchall() == [('old@example.com',)]
+    finally:
+        pool.release(conn)
+
+
+def test_current_version_without_schema_table():
+    assert migrations.current_version(sqlite3.connect(':memory:')) == 0
+
+
+def test_duplicate_payment_references_are_set_aside(pool, monkeypatch, caplog):
+    conn = pool.acquire()
+    try:
+        monkeypatch.setattr(migrations, 'MIGRATIONS', [m for m in migrations.MIGRATIONS if m[0] < 8])
+        migrations.migrate(conn)
+        rows = [('pending-first', 10.0, 'Pending'), ('cs_1', 10.0, 'Pending'), ('cs_1', 10.0, 'Succeeded'),
+                ('cs_1', 10.0, 'Succeeded'), ('cs_2', 5.0, 'Pending'), ('cs_2', 5.0, 'Cancelled')]
+        conn.executemany('''
+            INSERT INTO donations (donor_name, donor_email, amount, currency, pay_via, payment_reference,
+                                   status, created_at)
+            VALUES ('Donor', 'd@example.com', ?, 'USD', 'Card', ?, ?, '2024-01-01 10:00:00')
+        ''', [(amount, reference, status) for reference, amount, status in rows])
+        conn.commit()
+        monkeypatch.undo()
+
+        migrations.migrate(conn)
+        survivors = conn.execute('SELECT id, payment_reference, status FROM donations ORDER BY id').fetchall()
+        assert survivors == [(1, 'pending-first', 'Pending'), (3, 'cs_1', 'Succeeded'), (5, 'cs_2', 'Pending')]
+        moved = conn.execute('SELECT id, amount, status FROM duplicate_donations ORDER BY id').fetchall()
+        assert moved == [(2, 10.0, 'Pending'), (4, 10.0, 'Succeeded'), (6, 5.0, 'Cancelled')]
+        assert 'moved duplicate donation 4 (reference cs_1, 10.0 USD, Succeeded)' in caplog.text
+        # The totals follow the surviving ledger rows
+        totals = dict(((status, total) for status, total in conn.execute(
+            'SELECT status, total_amount FROM donation_totals WHERE donation_count != 0')))
+        assert totals == {'Pending': 15.0, 'Succeeded': 10.0}
+    finally:
+        pool.release(conn)
@@ -0,0 +1,54 @@
+import pytest
+
+import db
+from pagination import CursorError, decode_cursor, encode_cursor, keyset_clause, page_size, time_bound
+
+
+def test_cursors_round_trip():
+    token = encode_cursor('2024-01-15 10:00:00', 42)
+    assert '=' not in token
+    assert decode_cursor(token) == ('2024-01-15 10:00:00', 42)
+
+
+@pytest.mark.parametrize('token', ['', 'garbage', encode_cursor('2024-01-15', 'x')])
+def test_malformed_cursors_are_rejected(token):
+    with pytest.raises(CursorError):
+        decode_cursor(token)
+
+
+def test_page_size_is_clamped():
+    assert page_size(None) == 20
+    assert page_size('500') == 100
+    for value in ('0', 'ten'):
+        with pytest.raises(CursorError):
+            page_size(value)
+
+
+def test_a_bare_end_date_covers_the_whole_day():
+    assert time_bound('2024-01-15') == '2024-01-15 00:00:00'
+    assert time_bound('2024-01-15', end=True) == '2024-01-16 00:00:00'
+    assert time_bound('2024-01-15 08:30:00', end=True) == '2024-01-15 08:30:00'
+
+
+def test_after_and_before_are_exclusive():
+    with pytest.raises(CursorError):
+        keyset_clause({'after': 'a', 'before': 'b'})
+
+
+def test_pages_walk_forward_and_back_without_gaps(client):
+    with db.connection() as conn:
+        # Three rows share a timestamp, so the id breaks ties
+        for created_at in ['2024-01-01 00:00:00'] * 3 + ['2024-01-02 00:00:00', '2024-01-03 00:00:00']:
+            conn.execute("INSERT INTO reports (user_id, name, email, location, disaster_type, description, "
+                         "created_at) VALUES (1, 'R', 'r@example.com', 'Patna', 'Flood', 'water', ?)", (created_at,))
+    first = client.get('/api/reports?limit=2').get_json()
+    assert [r['id'] for r in first['reports']] == [5, 4]
+    assert first['prev_cursor'] is None
+    second = client.get(f"/api/reports?limit=2&after={first['next_cursor']}").get_json()
+    assert [r['id'] for r in second['reports']] == [3, 2]
+    third = client.get(f"/api/reports?limit=2&after={second['next_cursor']}").get_json()
+    assert [r['id'] for r in third['reports']] == [1]
+    assert third['next_cursor'] is None
+    back = client.get(f"/api/reports?limit=2&before={third['prev_cursor']}").get_json()
+    assert [r['id'] for r in back['reports']] == [3, 2]
+    assert client.get('/api/reports?after=garbage').status_code == 400
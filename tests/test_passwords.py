@@ -0,0 +1,53 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from werkzeug.security import generate_password_hash
+
+import passwords
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    """Hash on threads instead of spawned processes; admission limit of two."""
+    executor = ThreadPoolExecutor(max_workers=2)
+    monkeypatch.setattr(passwords, '_get_executor', lambda: executor)
+    monkeypatch.setattr(passwords, '_slots', threading.BoundedSemaphore(2))
+    monkeypatch.setattr(passwords, '_method_prefix', None)
+    yield executor
+    executor.shutdown(wait=True)
+
+
+def test_hash_round_trip(pool, monkeypatch):
+    monkeypatch.setattr(passwords, 'HASH_METHOD', 'pbkdf2:sha256:1000')
+    password_hash = passwords.hash_password('secret')
+    assert passwords.verify_password(password_hash, 'secret')
+    assert not passwords.verify_password(password_hash, 'guess')
+
+
+def test_timeout_is_busy_and_keeps_the_slot(pool, monkeypatch):
+    monkeypatch.setattr(passwords, 'HASH_TIMEOUT', 0.05)
+    release = threading.Event()
+    with pytest.raises(passwords.HashingBusy, match='timed out'):
+        passwords._run(release.wait)
+    # The timed-out call is still running, so only one slot is left
+    assert passwords._slots.acquire(blocking=False)
+    with pytest.raises(passwords.HashingBusy, match='queue is full'):
+        passwords._run(time.sleep, 0)
+    passwords._slots.release()
+    release.set()
+    time.sleep(0.05)
+    assert passwords._run(lambda: 'done') == 'done'
+
+
+def test_default_parameters_do_not_force_a_rehash(pool, monkeypatch):
+    monkeypatch.setattr(passwords, 'HASH_METHOD', 'pbkdf2:sha256')
+    assert not passwords.needs_rehash(generate_password_hash('secret', 'pbkdf2:sha256'))
+    assert passwords.needs_rehash(generate_password_hash('secret', 'pbkdf2:sha256:1000'))
+
+
+def test_changed_parameters_force_a_rehash(pool, monkeypatch):
+    monkeypatch.setattr(passwords, 'HASH_METHOD', 'pbkdf2:sha256:2000')
+    assert passwords.needs_rehash(generate_password_hash('secret', 'pbkdf2:sha256:1000'))
+    assert not passwords.needs_rehash(generate_password_hash('secret', 'pbkdf2:sha256:2000'))
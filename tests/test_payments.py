@@ -0,0 +1,129 @@
+import pytest
+import stripe
+
+import payments
+from payments import CircuitBreaker, StripeUnavailable
+
+FIELDS = {'donor_name': 'Asha', 'donor_email': 'asha@example.com', 'amount': 25, 'currency': 'inr',
+          'purpose': 'relief', 'pay_via': 'Card'}
+
+
+def _donations(conn):
+    return conn.execute('SELECT payment_reference, amount, currency, status FROM donations').fetchall()
+
+
+def test_record_donation_upserts_one_row_per_payment(conn):
+    cursor = conn.cursor()
+    payments.record_donation(cursor, 'cs_1', FIELDS, 'Pending')
+    payments.record_donation(cursor, 'cs_1', dict(FIELDS, amount=30), 'Succeeded')
+    assert _donations(conn) == [('cs_1', 30.0, 'INR', 'Succeeded')]
+    payments.record_donation(cursor, 'cs_1', FIELDS, 'Succeeded')
+    assert len(_donations(conn)) == 1
+
+
+@pytest.mark.parametrize('late_status', ['Pending', 'Failed', 'Cancelled'])
+def test_succeeded_donations_are_never_downgraded(conn, late_status):
+    cursor = conn.cursor()
+    payments.record_donation(cursor, 'cs_1', FIELDS, 'Succeeded')
+    payments.record_donation(cursor, 'cs_1', dict(FIELDS, amount=99), late_status)
+    conn.commit()
+    assert _donations(conn) == [('cs_1', 25.0, 'INR', 'Succeeded')]
+    assert conn.execute('SELECT status, total_amount, donation_count FROM donation_totals').fetchall() == \
+        [('Succeeded', 25.0, 1)]
+
+
+def _event(event_type, **session):
+    return {'id': 'evt_1', 'type': event_type,
+            'data': {'object': dict({'id': 'cs_1', 'amount_total': 2500, 'currency': 'usd',
+                                     'metadata': {'donor_name': 'Asha'},
+                                     'customer_details': {'email': 'asha@example.com'}}, **session)}}
+
+
+def test_events_map_to_donation_statuses(conn):
+    cursor = conn.cursor()
+    assert not payments.apply_event(cursor, _event('payment_intent.created'))
+    assert payments.apply_event(cursor, _event('checkout.session.completed', payment_status='unpaid'))
+    assert _donations(conn) == [('cs_1', 25.0, 'USD', 'Pending')]
+    assert payments.apply_event(cursor, _event('checkout.session.async_payment_succeeded'))
+    assert _donations(conn) == [('cs_1', 25.0, 'USD', 'Succeeded')]
+    assert conn.execute('SELECT donor_email FROM donations').fetchone()[0] == 'asha@example.com'
+
+
+def test_redelivered_webhooks_are_stored_and_applied_once(database, monkeypatch):
+    processor = payments.WebhookProcessor()
+    monkeypatch.setattr(processor, '_ensure_worker', lambda: None)
+    event = _event('checkout.session.completed', payment_status='paid')
+    assert processor.receive(event)
+    assert not processor.receive(event)
+    processor.process('evt_1')
+    processor.process('evt_1')
+    with database.connection() as conn:
+        assert _donations(conn) == [('cs_1', 25.0, 'USD', 'Succeeded')]
+        assert conn.execute('SELECT processed_at IS NOT NULL FROM stripe_events').fetchall() == [(1,)]
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(payments.time, 'monotonic', clock)
+    return clock
+
+
+def _down():
+    raise stripe.APIConnectionError('connection refused')
+
+
+def _declined():
+    raise stripe.CardError('declined', None, 'card_declined')
+
+
+def test_breaker_opens_after_consecutive_failures(clock):
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=30)
+    for _ in range(2):
+        with pytest.raises(stripe.APIConnectionError):
+            breaker.call(_down)
+    assert breaker.call(lambda: 'ok') == 'ok'   # a success resets the count
+    for _ in range(3):
+        with pytest.raises(stripe.APIConnectionError):
+            breaker.call(_down)
+    assert breaker.state == 'open'
+    calls = []
+    with pytest.raises(StripeUnavailable):
+        breaker.call(calls.append, 'not sent')
+    assert calls == []
+
+
+def test_provider_errors_do_not_trip_the_breaker(clock):
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30)
+    with pytest.raises(stripe.CardError):
+        breaker.call(_declined)
+    assert breaker.state == 'closed'
+
+
+def test_half_open_breaker_admits_one_probe(clock):
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30)
+    with pytest.raises(stripe.APIConnectionError):
+        breaker.call(_down)
+    clock.now += 30
+    assert breaker.state == 'half-open'
+
+    def probe():
+        # While the probe is out, everyone else still fails fast
+        with pytest.raises(StripeUnavailable):
+            breaker.call(lambda: 'second')
+        raise stripe.APIConnectionError('still down')
+
+    with pytest.raises(stripe.APIConnectionError):
+        breaker.call(probe)
+    assert breaker.state == 'open'          # a failed probe re-opens for another reset_timeout
+    clock.now += 30
+    assert breaker.call(lambda: 'ok') == 'ok'
+    assert breaker.state == 'closed'
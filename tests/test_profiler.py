@@ -0,0 +1,68 @@
+import contextvars
+import threading
+import time
+
+import pytest
+from flask import Flask, g
+
+import profiler
+
+
+@pytest.fixture
+def app_and_profiler(tmp_path):
+    app = Flask(__name__)
+    sampler = profiler.SamplingProfiler(slow_ms=20, interval_ms=1, output_dir=str(tmp_path))
+    sampler.init_app(app)
+
+    @app.route('/slow')
+    def slow():
+        time.sleep(0.1)
+        return 'ok'
+
+    @app.route('/fast')
+    def fast():
+        return 'ok'
+    return app, sampler
+
+
+def test_slow_requests_write_a_folded_profile(app_and_profiler, tmp_path):
+    app, sampler = app_and_profiler
+    assert app.test_client().get('/fast').status_code == 200
+    assert list(tmp_path.iterdir()) == []
+    assert app.test_client().get('/slow').status_code == 200
+    [profile] = tmp_path.iterdir()
+    assert profile.name.endswith('.folded') and '-slow-' in profile.name
+    assert 'slow (test_profiler.py' in profile.read_text()
+    assert sampler._active == {}
+
+
+def test_hooks_on_different_threads_keep_their_samples(app_and_profiler, tmp_path):
+    # As under ASGI: before_request on an executor thread, teardown on the event loop
+    app, sampler = app_and_profiler
+
+    def slow_hook():
+        sampler._before_request()
+        time.sleep(0.1)
+        profiler.release_thread()
+
+    with app.test_request_context('/slow'):
+        context = contextvars.copy_context()
+        worker = threading.Thread(target=context.run, args=(slow_hook,))
+        worker.start()
+        worker.join()
+        context.run(sampler._teardown_request)
+    assert sampler._active == {}
+    [profile] = tmp_path.iterdir()
+    assert 'slow_hook (test_profiler.py' in profile.read_text()
+
+
+def test_released_threads_are_not_sampled(app_and_profiler):
+    app, sampler = app_and_profiler
+    with app.test_request_context('/slow'):
+        sampler._before_request()
+        entry = g._profile_entry
+        assert entry[0] == threading.get_ident()
+        profiler.release_thread()
+        assert entry[0] is None
+        sampler._teardown_request()
+    assert sampler._active == {}
@@ -0,0 +1,78 @@
+import pytest
+from flask import Flask
+
+import ratelimit
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.delenv('RATE_LIMIT_PATH', raising=False)
+    monkeypatch.setenv('RATE_LIMIT_ENABLED', '1')
+    app = Flask(__name__)
+
+    @app.route('/login', methods=['GET', 'POST'])
+    def login():
+        return 'ok'
+
+    @app.route('/report', methods=['POST'])
+    def report():
+        return 'ok'
+
+    limiter = ratelimit.RateLimiter(app)
+    client = app.test_client()
+    client.limiter = limiter
+    return client
+
+
+def _login(client, peer='203.0.113.7', forwarded=None):
+    headers = {'X-Forwarded-For': forwarded} if forwarded else {}
+    return client.post('/login', headers=headers, environ_base={'REMOTE_ADDR': peer})
+
+
+def test_budget_is_enforced_with_retry_after(client):
+    for _ in range(ratelimit.BUDGETS['login'].capacity):
+        assert _login(client).status_code == 200
+    response = _login(client)
+    assert response.status_code == 429
+    assert int(response.headers['Retry-After']) >= 1
+    assert _login(client, peer='203.0.113.8').status_code == 200
+    # GETs of the login page are not counted against the POST budget
+    assert client.get('/login', environ_base={'REMOTE_ADDR': '203.0.113.7'}).status_code == 200
+
+
+def test_forwarded_for_is_ignored_by_default(client):
+    for n in range(ratelimit.BUDGETS['login'].capacity):
+        assert _login(client, peer='10.0.0.5', forwarded=f'198.51.100.{n}').status_code == 200
+    assert _login(client, peer='10.0.0.5', forwarded='198.51.100.200').status_code == 429
+
+
+def test_trusted_proxy_forwards_the_client_address(client, monkeypatch):
+    monkeypatch.setattr(ratelimit, 'TRUSTED_PROXIES', 1)
+    for _ in range(ratelimit.BUDGETS['login'].capacity):
+        assert _login(client, peer='127.0.0.1', forwarded='spoofed, 198.51.100.1').status_code == 200
+    assert _login(client, peer='127.0.0.1', forwarded='198.51.100.1').status_code == 429
+    assert _login(client, peer='127.0.0.1', forwarded='198.51.100.2').status_code == 200
+
+
+def test_peers_outside_the_proxy_networks_cannot_forward(client, monkeypatch):
+    monkeypatch.setattr(ratelimit, 'TRUSTED_PROXIES', 1)
+    for n in range(ratelimit.BUDGETS['login'].capacity):
+        assert _login(client, peer='192.168.1.20', forwarded=f'198.51.100.{n}').status_code == 200
+    assert _login(client, peer='192.168.1.20', forwarded='198.51.100.99').status_code == 429
+
+
+def test_shared_buckets_span_limiters(tmp_path):
+    buckets = [ratelimit._SQLiteBuckets(str(tmp_path / 'limits.db')) for _ in range(2)]
+    assert buckets[0].take('k', 2, 0.001, 1000.0)[0]
+    assert buckets[1].take('k', 2, 0.001, 1000.0)[0]
+    allowed, retry_after = buckets[0].take('k', 2, 0.001, 1000.0)
+    assert not allowed and retry_after > 0
+
+
+def test_low_priority_is_shed_first():
+    shedder = ratelimit.LoadShedder(max_inflight=2, target_delay=0.1)
+    assert shedder.admit(ratelimit.LOW, 0) and shedder.admit(ratelimit.LOW, 0)
+    assert not shedder.admit(ratelimit.LOW, 0)
+    assert shedder.admit(ratelimit.NORMAL, 0)
+    assert shedder.admit(ratelimit.CRITICAL, 5.0)
+    assert not shedder.admit(ratelimit.NORMAL, 0.5)
@@ -0,0 +1,28 @@
+import db
+import search
+
+
+def test_user_input_becomes_quoted_prefix_terms():
+    assert search.match_expression('Patna "city" OR', 'location') == 'location : ("Patna"* "city"* "OR"*)'
+    assert search.match_expression('flood') == '("flood"*)'
+    assert search.match_expression('?!*') is None
+
+
+def _add(location):
+    with db.connection() as conn:
+        conn.execute("INSERT INTO reports (user_id, name, email, location, disaster_type, description) "
+                     "VALUES (1, 'Reporter', 'r@example.com', ?, 'Flood', 'water rising')", (location,))
+        conn.commit()
+
+
+def test_location_filter_matches_tokens(client):
+    _add('Patna')
+    _add('Gaya')
+    reports = client.get('/api/reports?location=pat').get_json()['reports']
+    assert [report['location'] for report in reports] == ['Patna']
+
+
+def test_location_filter_without_tokens_matches_nothing(client):
+    _add('Patna')
+    assert client.get('/api/reports?location=%3F%21').get_json()['reports'] == []
+    assert client.get('/api/reports?q=%2A').get_json()['reports'] == []
@@ -0,0 +1,98 @@
+import pytest
+from flask import Flask, session
+
+import sessions
+from sessions import ServerSideSessionInterface
+
+
+def _worker(path):
+    app = Flask(__name__)
+    app.secret_key = 'unused'
+    app.session_interface = ServerSideSessionInterface(path)
+
+    @app.route('/set/<key>/<value>')
+    def set_value(key, value):
+        session[key] = value
+        return 'ok'
+
+    @app.route('/login/<int:user_id>')
+    def login(user_id):
+        session['user_id'] = user_id
+        return 'ok'
+
+    @app.route('/get/<key>')
+    def get_value(key):
+        return session.get(key, '-')
+
+    @app.route('/logout')
+    def logout():
+        session.clear()
+        return 'ok'
+
+    return app
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / 'sessions.db')
+
+
+def _sid(client):
+    cookie = client.get_cookie('session')
+    return cookie.value if cookie else None
+
+
+def test_cookie_carries_only_an_id_shared_by_all_workers(path):
+    first = _worker(path).test_client()
+    first.get('/set/language/hi')
+    sid = _sid(first)
+    assert len(sid) == 43 and 'hi' not in sid
+    second = _worker(path).test_client()
+    second.set_cookie('session', sid)
+    assert second.get('/get/language').text == 'hi'
+
+
+def test_id_is_rotated_when_the_user_changes(path):
+    client = _worker(path).test_client()
+    client.get('/set/cart/1')
+    planted = _sid(client)
+    client.get('/login/7')
+    assert _sid(client) != planted
+    attacker = _worker(path).test_client()
+    attacker.set_cookie('session', planted)
+    assert attacker.get('/get/user_id').text == '-'
+
+
+def test_unknown_ids_are_not_adopted(path):
+    client = _worker(path).test_client()
+    client.set_cookie('session', 'chosen-by-the-client')
+    client.get('/set/cart/1')
+    assert _sid(client) != 'chosen-by-the-client'
+
+
+def test_logout_deletes_the_stored_session(path):
+    app = _worker(path)
+    client = app.test_client()
+    client.get('/login/7')
+    sid = _sid(client)
+    client.get('/logout')
+    assert _sid(client) is None
+    assert app.session_interface.store.load(sid, 0) is None
+
+
+def test_reads_do_not_write_and_expired_sessions_are_gone(path, monkeypatch):
+    app = _worker(path)
+    client = app.test_client()
+    client.get('/set/language/hi')
+    sid = _sid(client)
+    store = app.session_interface.store
+    saved = store.load(sid, 0)[1]
+    client.get('/get/language')
+    assert store.load(sid, 0)[1] == saved
+    # Past the touch interval a read pushes the expiry forward
+    clock = sessions.time.time() + sessions.TOUCH_SECONDS + 1
+    monkeypatch.setattr(sessions.time, 'time', lambda: clock)
+    client.get('/get/language')
+    assert store.load(sid, 0)[1] > saved
+    assert store.load(sid, clock + sessions.TTL_SECONDS + 1) is None
+    assert store.prune(clock + sessions.TTL_SECONDS + 1) == 1
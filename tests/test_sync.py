@@ -0,0 +1,80 @@
+import pytest
+
+import sync
+
+
+def test_initial_sync_returns_every_report(conn, add_report):
+    first, second = add_report(location='Patna'), add_report(location='Mumbai')
+    payload = sync.changes(conn, 0, ['id', 'location'])
+    assert payload['fields'] == ['id', 'location']
+    assert payload['changed'] == [[first, 'Patna'], [second, 'Mumbai']]
+    assert payload['has_more'] is False
+    assert 'deleted' not in payload
+
+
+def test_only_changes_after_since_are_returned(conn, add_report):
+    first = add_report()
+    second = add_report()
+    version = sync.changes(conn, 0, ['id', 'status'])['version']
+    conn.execute("UPDATE reports SET status = 'dispatched' WHERE id = ?", (first,))
+    conn.commit()
+    payload = sync.changes(conn, version, ['id', 'status'])
+    assert payload['changed'] == [[first, 'dispatched']]
+    assert payload['version'] > version
+    assert second not in [row[0] for row in payload['changed']]
+
+
+def test_nothing_new_is_an_empty_delta(conn, add_report):
+    add_report()
+    version = sync.changes(conn, 0, ['id'])['version']
+    assert sync.changes(conn, version, ['id']) == {'version': version, 'has_more': False}
+
+
+def test_deletes_are_reported_to_clients_that_saw_the_row(conn, add_report):
+    kept, removed = add_report(), add_report()
+    version = sync.changes(conn, 0, ['id'])['version']
+    conn.execute('DELETE FROM reports WHERE id = ?', (removed,))
+    conn.commit()
+    assert sync.changes(conn, version, ['id'])['deleted'] == [removed]
+    # A first sync never needs tombstones
+    payload = sync.changes(conn, 0, ['id'])
+    assert payload['changed'] == [[kept]]
+    assert 'deleted' not in payload
+
+
+def test_pages_follow_the_change_order(conn, add_report):
+    ids = [add_report() for _ in range(5)]
+    page = sync.changes(conn, 0, ['id'], limit=2)
+    assert page['has_more'] is True
+    seen = [row[0] for row in page['changed']]
+    while page['has_more']:
+        page = sync.changes(conn, page['version'], ['id'], limit=2)
+        seen += [row[0] for row in page.get('changed', [])]
+    assert seen == ids
+
+
+def test_unknown_version_resets_the_client(conn, add_report):
+    add_report()
+    assert sync.changes(conn, 10_000, ['id']) == {'version': 0, 'reset': True, 'has_more': True}
+
+
+@pytest.mark.parametrize('args', [{'since': 'x'}, {'since': '-1'}, {'limit': '0'}, {'fields': 'id,password'}])
+def test_bad_parameters_are_rejected(args):
+    with pytest.raises(sync.SyncError):
+        sync.parse_request(args)
+
+
+def test_id_is_always_requested():
+    since, fields, limit = sync.parse_request({'since': '3', 'fields': 'status', 'limit': '999999'})
+    assert (since, fields, limit) == (3, ['id', 'status'], sync.MAX_LIMIT)
+
+
+def test_updates_to_unsynced_columns_keep_the_version(conn, add_report):
+    report = add_report()
+    version = sync.changes(conn, 0, ['id'])['version']
+    conn.execute("UPDATE reports SET claimed_by = 3, claimed_at = CURRENT_TIMESTAMP WHERE id = ?", (report,))
+    conn.commit()
+    assert sync.changes(conn, version, ['id']) == {'version': version, 'has_more': False}
+    conn.execute("UPDATE reports SET cluster_id = 99 WHERE id = ?", (report,))
+    conn.commit()
+    assert sync.changes(conn, version, ['id'])['changed'] == [[report]]
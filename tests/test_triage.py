@@ -0,0 +1,73 @@
+import threading
+
+import pytest
+
+import db
+import triage
+from triage import TransitionError, TriageQueue
+
+
+def test_more_severe_larger_and_older_incidents_come_first():
+    flood = triage.priority_key('Flood', '2024-01-15 10:00:00')
+    assert triage.priority_key('Earthquake', '2024-01-15 10:00:00') > flood
+    assert triage.priority_key('Flood', '2024-01-15 10:00:00', cluster_size=4) == flood + 2 * triage.CLUSTER_WEIGHT
+    assert triage.priority_key('Flood', '2024-01-15 09:00:00') == pytest.approx(flood + triage.AGE_WEIGHT)
+
+
+def test_claims_take_the_most_urgent_incident_with_its_cluster(conn, add_report):
+    flood = add_report(disaster_type='Flood')
+    quake = add_report(disaster_type='Earthquake')
+    duplicate = add_report(disaster_type='Earthquake', cluster_id=quake)
+    queue = TriageQueue()
+    report = queue.claim(conn, 5)
+    assert (report['id'], report['claimed_by'], report['report_count']) == (quake, 5, 2)
+    assert conn.execute('SELECT status FROM reports WHERE id = ?', (duplicate,)).fetchone()[0] == 'dispatched'
+    assert queue.claim(conn, 6)['id'] == flood
+    assert queue.claim(conn, 7) is None
+
+
+def test_concurrent_claims_dispatch_each_incident_once(pool, conn, add_report):
+    workers = db.ConnectionPool(pool.database, size=6)
+    incidents = {add_report(disaster_type=kind) for kind in ('Flood', 'Fire', 'Medical', 'Cyclone') * 5}
+    # Two workers, each with its own heap holding every incident
+    queues = [TriageQueue(), TriageQueue()]
+    for queue in queues:
+        queue.load(conn)
+    claimed = []
+    start = threading.Barrier(6)
+
+    def responder(queue, user_id):
+        start.wait()
+        while True:
+            with workers.connection() as worker_conn:
+                report = queue.claim(worker_conn, user_id)
+            if report is None:
+                return
+            claimed.append(report['id'])
+
+    threads = [threading.Thread(target=responder, args=(queues[n % 2], n)) for n in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    workers.close_all()
+    assert sorted(claimed) == sorted(incidents)
+    assert conn.execute("SELECT COUNT(*) FROM reports WHERE status = 'dispatched'").fetchone()[0] == len(incidents)
+
+
+def test_transitions_follow_the_status_rules(conn, add_report):
+    report = add_report()
+    queue = TriageQueue()
+    assert queue.claim(conn, 5)['id'] == report
+    with pytest.raises(TransitionError, match='from dispatched to dispatched'):
+        queue.transition(conn, report, 'dispatched', 6)
+    with pytest.raises(TransitionError, match='status must be one of'):
+        queue.transition(conn, report, 'verified', 6)
+    # Back to pending: unclaimed and in the queue again
+    reopened = queue.transition(conn, report, 'pending', 6)
+    assert (reopened['status'], reopened['claimed_by']) == ('pending', None)
+    assert queue.claim(conn, 6)['id'] == report
+    assert queue.transition(conn, report, 'resolved', 6)['status'] == 'resolved'
+    with pytest.raises(TransitionError):
+        queue.transition(conn, report, 'dispatched', 6)
+    assert queue.transition(conn, 999, 'resolved', 6) is None
@@ -0,0 +1,72 @@
+import json
+import os
+
+import db
+import writebehind
+from writebehind import Journal, WriteBehindQueue
+
+
+def _record(submission_id, **row):
+    row = dict(user_id=1, name='Reporter', email='r@example.com', location='Patna', disaster_type='Flood',
+               description='water rising', submission_id=submission_id, **row)
+    return {'table': 'reports', 'row': row}
+
+
+def _leftover(path, *records, tail=''):
+    with open(path, 'w') as f:
+        for record in records:
+            f.write(json.dumps(record) + '\n')
+        f.write(tail)
+
+
+def _submission_ids():
+    with db.connection() as conn:
+        return [row[0] for row in conn.execute('SELECT submission_id FROM reports ORDER BY id')]
+
+
+def test_replay_is_idempotent_and_deletes_segments(database, tmp_path):
+    journal = str(tmp_path / 'journal')
+    announced = []
+    queue = WriteBehindQueue(journal)
+    queue.on_commit('reports', announced.extend)
+    _leftover(journal + '.1111.1', _record('a'), _record('b'))
+    # The same records again, as if the process died after committing but before deleting
+    _leftover(journal + '.1111.2', _record('b'), _record('c'), tail='{"torn')
+    os.utime(journal + '.1111.1', (1, 1))     # replayed oldest first
+    assert queue.replay() == 4
+    assert _submission_ids() == ['a', 'b', 'c']
+    assert [record['row']['submission_id'] for _, record in announced] == ['a', 'b', 'c']
+    assert all(row_id is not None for row_id, _ in announced)
+    assert not [name for name in os.listdir(tmp_path) if name.startswith('journal')]
+
+
+def test_replay_drops_rows_that_can_never_be_inserted(database, tmp_path):
+    journal = str(tmp_path / 'journal')
+    bad = _record('bad')
+    bad['row']['location'] = None
+    _leftover(journal, _record('first'), bad, _record('last'))
+    assert WriteBehindQueue(journal).replay() == 3
+    assert _submission_ids() == ['first', 'last']
+    assert not os.path.exists(journal)
+
+
+def test_finished_segments_are_deleted_but_the_open_one_is_kept(tmp_path):
+    journal = Journal(str(tmp_path / 'journal'), segment_bytes=1)
+    first = journal.append(_record('a'))
+    second = journal.append(_record('b'))
+    assert second == first + 1
+    segments = lambda: sorted(p for p in os.listdir(tmp_path) if p.startswith('journal'))
+    assert len(segments()) == 2
+    journal.committed({first: 1})
+    assert segments() == [f'journal.{os.getpid()}.{second}']
+    journal.committed({second: 1})
+    assert len(segments()) == 1
+    assert writebehind.read_journal(str(tmp_path / segments()[0])) == [_record('b')]
+    journal.close()
+
+
+def test_submissions_are_committed_by_the_writer(database, tmp_path):
+    queue = WriteBehindQueue(str(tmp_path / 'journal'), batch_interval=0.01)
+    submitted = [queue.submit('reports', _record(None)['row']) for _ in range(3)]
+    queue.stop()
+    assert _submission_ids() == submitted
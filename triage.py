@@ -0,0 +1,215 @@
+"""Triage queue: hand responders the most urgent open incident.
+
+Every open incident (a pending cluster head) has a severity. It is made of a
+base weight for its disaster type, a bonus that grows with the log of its
+cluster size (how many people reported it), and an ageing term of
+AGE_WEIGHT points per hour waiting. All open incidents age at the same
+rate, so the ageing term never reorders them relative to each other except
+through created_at. Each heap entry can therefore be keyed on a value fixed
+at insert time, ``base + bonus - AGE_WEIGHT * created_hours``. The ordering
+stays correct as time passes without re-keying anything.
+
+The heap lives in process memory. It is loaded from SQLite on first use and
+reloaded every TRIAGE_REFRESH_SECONDS to pick up rows written by other
+workers. Pops are O(log n). Changed or removed entries are left in the heap
+and skipped when they surface (lazy deletion). Claims are conditional
+UPDATEs on status = 'pending', so two workers can never dispatch the same
+incident even if both of their heaps hold it.
+"""
+import heapq
+import math
+import os
+import threading
+import time
+from datetime import datetime
+
+SEVERITY = {
+    'Earthquake': 10.0,
+    'Fire': 8.0,
+    'Medical': 8.0,
+    'Flood': 7.0,
+    'Cyclone': 7.0,
+    'Landslide': 6.0,
+}
+DEFAULT_SEVERITY = 5.0
+CLUSTER_WEIGHT = 3.0       # points per doubling of the cluster size
+AGE_WEIGHT = float(os.getenv('TRIAGE_AGE_WEIGHT', '1'))   # points per hour waiting
+REFRESH_SECONDS = float(os.getenv('TRIAGE_REFRESH_SECONDS', '60'))
+
+STATUSES = ('pending', 'dispatched', 'resolved', 'rejected')
+# status -> statuses it may move to
+TRANSITIONS = {
+    'pending': ('dispatched', 'resolved', 'rejected'),
+    'dispatched': ('pending', 'resolved', 'rejected'),
+    'resolved': ('pending',),
+    'rejected': ('pending',),
+}
+REPORT_COLUMNS = ['id', 'name', 'email', 'location', 'disaster_type', 'description', 'image_path', 'status',
+                  'created_at', 'latitude', 'longitude', 'claimed_by', 'claimed_at']
+
+
+class TransitionError(ValueError):
+    """Raised for an unknown status or a move the current status does not allow."""
+
+
+def _hours(created_at) -> float:
+    created = datetime.strptime(str(created_at)[:19], '%Y-%m-%d %H:%M:%S')
+    return (created - datetime(1970, 1, 1)).total_seconds() / 3600
+
+
+def priority_key(disaster_type: str, created_at, cluster_size: int = 1) -> float:
+    """Time-invariant heap key; larger means more urgent."""
+    base = SEVERITY.get(disaster_type, DEFAULT_SEVERITY)
+    return base + CLUSTER_WEIGHT * math.log2(max(1, cluster_size)) - AGE_WEIGHT * _hours(created_at)
+
+
+def severity(key: float, now: float = None) -> float:
+    """Current severity score of an entry with heap key ``key``."""
+    now = time.time() if now is None else now
+    return round(key + AGE_WEIGHT * now / 3600, 2)
+
+
+class TriageQueue:
+    def __init__(self, refresh_seconds: float = REFRESH_SECONDS):
+        self.refresh_seconds = refresh_seconds
+        self._heap = []          # (-key, report_id)
+        self._entries = {}       # report_id -> [key, disaster_type, created_at, cluster_size]
+        self._loaded_at = None
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def load(self, conn) -> int:
+        """Replace the queue with the open incidents currently in SQLite."""
+        rows = conn.execute('''
+            SELECT r.id, r.disaster_type, r.created_at,
+                   1 + (SELECT COUNT(*) FROM reports d WHERE d.cluster_id = r.id)
+            FROM reports r WHERE r.status = 'pending' AND r.cluster_id IS NULL
+        ''').fetchall()
+        entries = {row[0]: [priority_key(row[1], row[2], row[3]), row[1], row[2], row[3]] for row in rows}
+        heap = [(-entry[0], report_id) for report_id, entry in entries.items()]
+        heapq.heapify(heap)
+        with self._lock:
+            self._entries, self._heap = entries, heap
+            self._loaded_at = time.monotonic()
+        return len(entries)
+
+    def invalidate(self) -> None:
+        """Reload from SQLite on next use (after bulk writes the queue did not see)."""
+        with self._lock:
+            self._loaded_at = None
+
+    def _ensure_loaded(self, conn) -> None:
+        loaded_at = self._loaded_at
+        if loaded_at is None or time.monotonic() - loaded_at > self.refresh_seconds:
+            self.load(conn)
+
+    def _push(self, report_id: int, entry: list) -> None:
+        self._entries[report_id] = entry
+        heapq.heappush(self._heap, (-entry[0], report_id))
+        if len(self._heap) > 2 * len(self._entries) + 64:
+            # Too many stale entries: rebuild from the live ones
+            self._heap = [(-e[0], rid) for rid, e in self._entries.items()]
+            heapq.heapify(self._heap)
+
+    def admit(self, report_id: int, cluster_id: int, disaster_type: str, created_at) -> None:
+        """Account for a newly stored report: a new incident, or one more report of an open one."""
+        with self._lock:
+            if self._loaded_at is None:
+                return
+            if cluster_id == report_id:
+                self._push(report_id, [priority_key(disaster_type, created_at), disaster_type, created_at, 1])
+                return
+            entry = self._entries.get(cluster_id)
+            if entry is not None:
+                size = entry[3] + 1
+                self._push(cluster_id, [priority_key(entry[1], entry[2], size), entry[1], entry[2], size])
+
+    def discard(self, report_id: int) -> None:
+        with self._lock:
+            self._entries.pop(report_id, None)
+
+    def pop(self):
+        """Remove and return (report_id, entry) for the most urgent incident, or None."""
+        with self._lock:
+            while self._heap:
+                negative_key, report_id = heapq.heappop(self._heap)
+                entry = self._entries.get(report_id)
+                if entry is None or entry[0] != -negative_key:
+                    continue
+                del self._entries[report_id]
+                return report_id, entry
+        return None
+
+    def claim(self, conn, user_id: int):
+        """Atomically dispatch the most urgent pending incident to ``user_id``; None when none is open."""
+        self._ensure_loaded(conn)
+        while True:
+            item = self.pop()
+            if item is None:
+                return None
+            report_id, entry = item
+            try:
+                row = conn.execute(f'''
+                    UPDATE reports SET status = 'dispatched', claimed_by = ?, claimed_at = CURRENT_TIMESTAMP
+                    WHERE id = ? AND status = 'pending'
+                    RETURNING {', '.join(REPORT_COLUMNS)}
+                ''', (user_id, report_id)).fetchone()
+                if row is not None:
+                    conn.execute("UPDATE reports SET status = 'dispatched' WHERE cluster_id = ?", (report_id,))
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                with self._lock:
+                    self._push(report_id, entry)
+                raise
+            if row is None:
+                # Moved on in another worker since our last refresh
+                continue
+            report = dict(zip(REPORT_COLUMNS, row))
+            report.update(cluster_id=report_id, report_count=entry[3], severity=severity(entry[0]))
+            return report
+
+    def transition(self, conn, report_id: int, status: str, user_id: int):
+        """Move an incident (the report's whole cluster) to ``status`` and commit.
+
+        Returns the updated cluster head, or None if the report does not exist.
+        Raises TransitionError when the current status does not allow the move.
+        """
+        if status not in TRANSITIONS:
+            raise TransitionError(f"status must be one of {', '.join(STATUSES)}")
+        row = conn.execute('SELECT COALESCE(cluster_id, id) FROM reports WHERE id = ?', (report_id,)).fetchone()
+        if row is None:
+            return None
+        head_id = row[0]
+        allowed_from = [current for current, targets in TRANSITIONS.items() if status in targets]
+        claimed = status == 'dispatched'
+        try:
+            row = conn.execute(f'''
+                UPDATE reports SET status = ?,
+                    claimed_by = CASE WHEN ? THEN ? WHEN ? = 'pending' THEN NULL ELSE claimed_by END,
+                    claimed_at = CASE WHEN ? THEN CURRENT_TIMESTAMP WHEN ? = 'pending' THEN NULL ELSE claimed_at END
+                WHERE id = ? AND status IN ({', '.join('?' for _ in allowed_from)})
+                RETURNING {', '.join(REPORT_COLUMNS)}
+            ''', [status, claimed, user_id, status, claimed, status, head_id] + allowed_from).fetchone()
+            if row is None:
+                current = conn.execute('SELECT status FROM reports WHERE id = ?', (head_id,)).fetchone()[0]
+                raise TransitionError(f'cannot move an incident from {current} to {status}')
+            cursor = conn.execute('UPDATE reports SET status = ? WHERE cluster_id = ?', (status, head_id))
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        report = dict(zip(REPORT_COLUMNS, row))
+        report.update(cluster_id=head_id, report_count=cursor.rowcount + 1)
+        if status == 'pending':
+            disaster_type, created_at, size = report['disaster_type'], report['created_at'], report['report_count']
+            with self._lock:
+                self._push(head_id, [priority_key(disaster_type, created_at, size), disaster_type, created_at, size])
+        else:
+            self.discard(head_id)
+        return report
+
+
+pending = TriageQueue()
@@ -0,0 +1,324 @@
+"""Durable write-behind queue for incident reports and contact messages.
+
+With WRITE_BEHIND enabled, report() and contact() neither open a transaction
+nor wait for SQLite. Each submission is appended to an append-only journal
+and acknowledged with a submission ID once the journal is fsync'd.
+Concurrent submissions share a single fsync (group commit). A background
+writer then inserts queued rows in batches with executemany, so SQLite sees
+one transaction per batch instead of one per submission.
+
+Every process writes its own journal, ``<WRITE_BEHIND_JOURNAL>.<pid>.<n>``,
+split into segments of SEGMENT_BYTES. A segment is deleted once every record
+in it is committed, so the journal stays bounded under sustained traffic and
+no process can delete another's unacknowledged records. Each live segment
+holds an exclusive flock. On startup, every segment nobody holds is a
+leftover of a stopped process: it is replayed and then deleted.
+
+Rows carry their submission_id, and the tables have a unique index on it,
+so replay is idempotent (ON CONFLICT (submission_id) DO NOTHING). Only rows
+that were actually inserted reach the commit listeners (dedup, triage, the
+live feed). A row that violates a NOT NULL or CHECK constraint cannot ever
+be inserted. It is logged with its full record and dropped, and the rest of
+its batch commits.
+"""
+import glob
+import json
+import logging
+import os
+import queue
+import re
+import sqlite3
+import threading
+import time
+import uuid
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows: no locks, one server process assumed
+    fcntl = None
+
+import db
+
+logger = logging.getLogger(__name__)
+
+TABLES = ('reports', 'contact_messages')
+BATCH_SIZE = 500
+BATCH_INTERVAL = 0.05   # seconds to wait for more rows before committing a batch
+RETRY_DELAY = 1.0
+SEGMENT_BYTES = 4 * 1024 * 1024
+_STOP = object()
+
+
+def _read_records(f) -> list:
+    records = []
+    for line in f:
+        try:
+            records.append(json.loads(line))
+        except ValueError:
+            logger.warning('skipping torn write-behind journal entry')
+    return records
+
+
+def read_journal(path: str):
+    """Records currently in a journal file; a torn final line is ignored."""
+    with open(path, 'rb') as f:
+        return _read_records(f)
+
+
+def _mtime(path: str) -> float:
+    try:
+        return os.path.getmtime(path)
+    except OSError:
+        return 0.0
+
+
+def _lock(f) -> bool:
+    """Take an exclusive, non-blocking flock on ``f``; False if another process holds it."""
+    if fcntl is None:
+        return True
+    try:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        return True
+    except BlockingIOError:
+        return False
+
+
+class Journal:
+    """This process's append-only NDJSON segments, with leader-based group fsync."""
+
+    def __init__(self, path: str, segment_bytes: int = SEGMENT_BYTES):
+        self.prefix = f'{path}.{os.getpid()}'
+        self.segment_bytes = segment_bytes
+        self._cond = threading.Condition()
+        self._segments = {}    # number -> [file, records appended, records committed]
+        self._number = 0
+        self._file = None
+        self._appended = 0     # records ever appended by this process
+        self._synced = 0
+        self._syncing = False
+        self._open_segment()
+
+    def _open_segment(self) -> None:
+        # Created and locked under a temporary name, so a replaying process never
+        # sees a segment before its owner holds the lock
+        self._number += 1
+        path = f'{self.prefix}.{self._number}'
+        if fcntl is None:
+            f = open(path, 'ab')
+        else:
+            f = open(path + '.tmp', 'ab')
+            _lock(f)
+            os.replace(path + '.tmp', path)
+        self._file = f
+        self._segments[self._number] = [f, 0, 0]
+
+    def _rotate(self) -> None:
+        # Records not yet covered by a leader's fsync live in the old segment;
+        # make them durable here, since the next leader syncs the new one
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        previous = self._number
+        self._open_segment()
+        self._drop_if_done(previous)
+
+    def append(self, record: dict) -> int:
+        """Write ``record`` and block until it is durable; returns its segment number."""
+        line = json.dumps(record, separators=(',', ':')).encode() + b'\n'
+        with self._cond:
+            if self._file.tell() >= self.segment_bytes:
+                self._rotate()
+            self._file.write(line)
+            segment = self._number
+            self._segments[segment][1] += 1
+            self._appended += 1
+            ticket = self._appended
+            while self._synced < ticket:
+                if self._syncing:
+                    self._cond.wait()
+                    continue
+                # Become the leader: one fsync covers everything written so far
+                self._syncing = True
+                target = self._appended
+                self._file.flush()
+                fd = self._file.fileno()
+                self._cond.release()
+                try:
+                    os.fsync(fd)
+                finally:
+                    self._cond.acquire()
+                    self._syncing = False
+                    self._synced = max(self._synced, target)
+                    self._cond.notify_all()
+        return segment
+
+    def committed(self, counts: dict) -> None:
+        """Record commits per segment ({segment: records}); deletes finished segments."""
+        with self._cond:
+            for segment, count in counts.items():
+                self._segments[segment][2] += count
+                self._drop_if_done(segment)
+
+    def _drop_if_done(self, segment: int) -> None:
+        f, appended, committed = self._segments[segment]
+        if segment != self._number and committed >= appended:
+            os.remove(f'{self.prefix}.{segment}')
+            f.close()
+            del self._segments[segment]
+
+    def close(self) -> None:
+        with self._cond:
+            for f, _, _ in self._segments.values():
+                f.close()
+
+
+class WriteBehindQueue:
+    def __init__(self, journal_path: str, batch_size: int = BATCH_SIZE, batch_interval: float = BATCH_INTERVAL):
+        self.journal_path = journal_path
+        self.batch_size = batch_size
+        self.batch_interval = batch_interval
+        self.listeners = {}        # table -> fn(list of (row_id, record))
+        self.journal = None
+        self._pending = queue.Queue()   # (segment, record)
+        self._started = False
+        self._writer = None
+        self._start_lock = threading.Lock()
+
+    def on_commit(self, table: str, listener) -> None:
+        """Register ``listener(committed)`` called after each batch for ``table``."""
+        self.listeners[table] = listener
+
+    def start(self) -> None:
+        """Replay journals left by stopped processes, then start the writer thread."""
+        with self._start_lock:
+            if self._started:
+                return
+            self.replay()
+            self.journal = Journal(self.journal_path)
+            self._writer = threading.Thread(target=self._run, name='write-behind', daemon=True)
+            self._writer.start()
+            self._started = True
+
+    def replay(self) -> int:
+        """Commit and delete every journal segment no live process holds; returns records replayed."""
+        name = re.compile(re.escape(os.path.basename(self.journal_path)) + r'(\.\d+\.\d+(\.tmp)?)?$')
+        # The bare path is the single shared journal older versions wrote
+        paths = [p for p in glob.glob(glob.escape(self.journal_path) + '*') if name.match(os.path.basename(p))]
+        replayed = 0
+        for path in sorted(paths, key=_mtime):
+            try:
+                f = open(path, 'rb')
+            except FileNotFoundError:
+                continue    # replayed by another process starting up
+            with f:
+                if not _lock(f):
+                    continue    # a running process's live segment
+                records = _read_records(f)
+                for offset in range(0, len(records), self.batch_size):
+                    self._commit(records[offset:offset + self.batch_size])
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+            replayed += len(records)
+        if replayed:
+            logger.info('replayed %d write-behind submissions', replayed)
+        return replayed
+
+    def stop(self, timeout: float = 10.0) -> None:
+        """Commit everything already queued, then stop the writer thread."""
+        with self._start_lock:
+            if not self._started:
+                return
+            self._pending.put(_STOP)
+            self._writer.join(timeout)
+            if not self._writer.is_alive():
+                self.journal.close()
+            self._started = False
+
+    def submit(self, table: str, row: dict, event: dict = None) -> str:
+        """Durably queue ``row`` for ``table``; returns its submission ID."""
+        if table not in TABLES:
+            raise ValueError(f'write-behind does not handle {table}')
+        self.start()
+        submission_id = uuid.uuid4().hex
+        record = {'table': table, 'row': dict(row, submission_id=submission_id)}
+        if event is not None:
+            record['event'] = event
+        segment = self.journal.append(record)
+        self._pending.put((segment, record))
+        return submission_id
+
+    def _run(self) -> None:
+        stopping = False
+        while not stopping:
+            item = self._pending.get()
+            if item is _STOP:
+                return
+            batch = [item]
+            deadline = time.monotonic() + self.batch_interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._pending.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+            while True:
+                try:
+                    self._commit([record for _, record in batch])
+                    break
+                except Exception:
+                    # Rows are safe in the journal; keep retrying the same batch
+                    logger.exception('write-behind batch failed, retrying')
+                    time.sleep(RETRY_DELAY)
+            counts = {}
+            for segment, _ in batch:
+                counts[segment] = counts.get(segment, 0) + 1
+            self.journal.committed(counts)
+
+    def _insert(self, conn, table: str, records) -> None:
+        columns = list(records[0]['row'])
+        sql = (f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' for _ in columns)}) "
+               f"ON CONFLICT (submission_id) WHERE submission_id IS NOT NULL DO NOTHING")
+        rows = [tuple(r['row'].get(c) for c in columns) for r in records]
+        try:
+            conn.executemany(sql, rows)
+        except sqlite3.IntegrityError:
+            # Rows before the bad one are already in; retrying them one by one is a no-op
+            for record, values in zip(records, rows):
+                try:
+                    conn.execute(sql, values)
+                except sqlite3.IntegrityError as e:
+                    logger.error('write-behind dropped invalid %s row (%s): %s', table, e, json.dumps(record))
+
+    def _commit(self, batch) -> None:
+        by_table = {}
+        for record in batch:
+            by_table.setdefault(record['table'], []).append(record)
+        committed = {}
+        with db.connection() as conn:
+            for table, records in by_table.items():
+                ids = [r['row']['submission_id'] for r in records]
+                marks = ', '.join('?' for _ in ids)
+                # Rows committed before a crash are replayed, but not announced again
+                existing = {row[0] for row in conn.execute(
+                    f'SELECT submission_id FROM {table} WHERE submission_id IN ({marks})', ids)}
+                fresh = [r for r in records if r['row']['submission_id'] not in existing]
+                if not fresh:
+                    continue
+                self._insert(conn, table, fresh)
+                if table not in self.listeners:
+                    continue
+                found = dict(conn.execute(
+                    f'SELECT submission_id, id FROM {table} WHERE submission_id IN ({marks})', ids).fetchall())
+                committed[table] = [(found.get(r['row']['submission_id']), r) for r in fresh]
+        for table, rows in committed.items():
+            try:
+                self.listeners[table](rows)
+            except Exception:
+                logger.exception('write-behind listener for %s failed', table)